@@ -4,7 +4,7 @@ import logging
 import random
 
 from twisted.application import service
-from twisted.internet import defer, pollreactor, task
+from twisted.internet import defer, pollreactor, task, threads
 from twisted.internet.error import CannotListenError
 from twisted.python import log as twisted_log
 from twisted.python import usage
@@ -14,8 +14,12 @@ from twisted import plugin
 
 from . import metrics
 from .announcer import Announcer, SharedUDP
+from .capture import CaptureFile
+from .iocstats import IOCStats, IOCStatsResource
 from .processors import ProcessorController
+from .profiler import LagProbe, ProfileResource
 from .recast import CastFactory
+from .tracing import Tracer
 
 log = logging.getLogger(__name__)
 
@@ -54,6 +58,14 @@ class RecService(service.MultiService):
         self.port = int(portn or "0")
         self.statusInterval = float(config.get("statusInterval", "60.0"))
         self.metricsPort = int(config.get("metricsPort", "0"))
+        self.captureFile = config.get("captureFile", "")
+        self.lagInterval = float(config.get("lagInterval", "1.0"))
+        self.profiling = config.getboolean("profiling", False)
+        self.profileMaxSeconds = float(config.get("profileMaxSeconds", "60.0"))
+        self._lagProbe = None
+        self.tracer = None
+        if config.getboolean("tracing", False):
+            self.tracer = Tracer(config.get("traceFile", ""), float(config.get("traceSample", "1.0")))
 
         for addr in config.get("addrlist", "").split(","):
             if not addr:
@@ -81,6 +93,14 @@ class RecService(service.MultiService):
         self.tcpFactory.session.timeout = self.commitperiod
         self.tcpFactory.session.trlimit = self.commitSizeLimit
         self.tcpFactory.maxActive = self.maxActive
+        if self.captureFile:
+            self.tcpFactory.capture = CaptureFile(self.captureFile)
+            self.tcpFactory.capture.start()
+        if self.tracer is not None:
+            self.tcpFactory.tracer = self.tracer
+            self.tracer.start()
+        self.iocstats = IOCStats(self.ctrl.queues.values())
+        self.tcpFactory.iocstats = self.iocstats
 
         # Attaching CastFactory to ProcessorController
         self.tcpFactory.commit = self.ctrl.commit
@@ -115,13 +135,24 @@ class RecService(service.MultiService):
 
         if self.metricsPort > 0:
             if metrics.available:
-                self.reactor.listenTCP(self.metricsPort, metrics.make_site(), interface=self.bind)
-                log.info("Prometheus metrics available on port %d", self.metricsPort)
+                children = {b"iocstats": IOCStatsResource(self.iocstats)}
+                if self.profiling:
+                    children[b"profile"] = ProfileResource(
+                        self.reactor, self.profileMaxSeconds, threadpool=self.reactor.getThreadPool()
+                    )
+                    log.warning("Profiler enabled on /profile of port %d", self.metricsPort)
+                site = metrics.make_site(children)
+                self.reactor.listenTCP(self.metricsPort, site, interface=self.bind)
+                log.info("Prometheus metrics and /iocstats available on port %d", self.metricsPort)
             else:
                 log.warning("metricsPort configured but prometheus_client is not installed; metrics disabled")
 
         metrics.connections_limit.set(self.tcpFactory.maxActive)
 
+        if self.lagInterval > 0:
+            self._lagProbe = LagProbe(self.reactor, self.lagInterval)
+            self._lagProbe.start()
+
         if self.statusInterval > 0:
             self._statusLoop = task.LoopingCall(self._logStatus)
             self._statusLoop.start(self.statusInterval, now=False)
@@ -141,9 +172,16 @@ class RecService(service.MultiService):
 
         if self._statusLoop is not None and self._statusLoop.running:
             self._statusLoop.stop()
+        if self._lagProbe is not None:
+            self._lagProbe.stop()
+        if self.tcpFactory.capture is not None:
+            self.tcpFactory.capture.stop()
 
         # This will stop plugin Processors
         D2 = defer.maybeDeferred(service.MultiService.stopService, self)
+        if self.tracer is not None:
+            # after the processors, which finish the last traces
+            D2.addBoth(lambda result: threads.deferToThread(self.tracer.stop).addBoth(lambda _: result))
 
         U = defer.maybeDeferred(self.udp.stopListening)
         T = defer.maybeDeferred(self.tcp.stopListening)
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""Capture of the raw RecCaster TCP streams, and a client replaying them.
+
+With captureFile set in the [recceiver] section, every byte received
+from an IOC is appended, with a timestamp, to that file. Running this
+module replays a capture against a recceiver, one TCP connection per
+captured session, each at its recorded pace scaled by --speed:
+
+    python -m recceiver.capture --host 127.0.0.1 --port 5049 --speed 0 recceiver.capture
+
+File layout: MAGIC, then one entry per event, in network byte order:
+
+    TIME(8, float) + SESSION(4) + KIND(1) + LENGTH(4) + DATA(LENGTH)
+
+KIND is OPEN (DATA is the peer "host:port"), DATA (bytes as received)
+or CLOSE. SESSION numbers restart with each run appending to the file,
+so they only tell apart the sessions open at the same time. Only the client to server direction is kept: the replay
+answers the pings of the server itself, as their nonces are random.
+"""
+
+import argparse
+import logging
+import struct
+import sys
+import time
+
+from twisted.internet import defer, protocol, task
+
+from .protocol import messages
+
+log = logging.getLogger(__name__)
+
+__all__ = ["CaptureFile", "read_capture", "replay"]
+
+MAGIC = b"RCCAPT\x00\x01"
+
+OPEN, DATA, CLOSE = 1, 2, 3
+
+_event = struct.Struct("!dIBI")
+
+
+class CaptureFile(object):
+    """Appends the events of the sessions of a CastFactory to path."""
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path, self.flush_interval = path, flush_interval
+        self._file = None
+        self._flusher = None
+        self._next_id = 1
+
+    def start(self):
+        self._file = open(self.path, "ab", buffering=1024 * 1024)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        if self.flush_interval > 0:
+            self._flusher = task.LoopingCall(self._file.flush)
+            self._flusher.start(self.flush_interval, now=False)
+        log.info("Capturing IOC sessions to %s", self.path)
+
+    def stop(self):
+        if self._flusher is not None and self._flusher.running:
+            self._flusher.stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def open(self, peer):
+        """Record a new session from peer; returns its session id."""
+        sid, self._next_id = self._next_id, self._next_id + 1
+        self._write(sid, OPEN, ("%s:%s" % (peer.host, peer.port)).encode())
+        return sid
+
+    def data(self, sid, data):
+        self._write(sid, DATA, data)
+
+    def close(self, sid):
+        self._write(sid, CLOSE, b"")
+
+    def _write(self, sid, kind, data):
+        if self._file is not None:
+            self._file.write(_event.pack(time.time(), sid, kind, len(data)) + data)
+
+
+class CapturedSession(object):
+    """The client messages of one session, with their times relative to its start."""
+
+    __slots__ = ("sid", "peer", "start", "frames", "closed")
+
+    def __init__(self, sid, peer, start):
+        self.sid, self.peer, self.start = sid, peer, start
+        # (seconds after start, framed message)
+        self.frames = []
+        # seconds after start; the last message when the capture ended first
+        self.closed = None
+
+
+def read_capture(path):
+    """The sessions of the capture at path, ordered by start time.
+
+    The received chunks are split into messages, each timed by the chunk
+    completing it. Pongs are dropped, as their nonces answer the pings
+    of the recorded server.
+    """
+    # offset of the OPEN entry -> session; session ids are reused by later runs
+    sessions = {}
+    # session id -> the offset of the session open under it, and its bytes not yet split
+    opened, buffers = {}, {}
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a recceiver capture" % path)
+        while True:
+            offset = f.tell()
+            head = f.read(_event.size)
+            if not head:
+                break
+            if len(head) < _event.size:
+                log.warning("Capture %s ends with a truncated entry", path)
+                break
+            stamp, sid, kind, length = _event.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                log.warning("Capture %s ends with a truncated entry", path)
+                break
+            if kind == OPEN:
+                opened[sid] = offset
+                sessions[offset] = CapturedSession(sid, data.decode(), stamp)
+                buffers[sid] = b""
+            elif sid not in opened:
+                continue
+            elif kind == DATA:
+                session = sessions[opened[sid]]
+                buf = buffers[sid] + data
+                start = 0
+                while len(buf) - start >= messages.Header.payload.size:
+                    try:
+                        header = messages.Header.decode(buf[start : start + messages.Header.payload.size])
+                    except messages.ProtocolError as exc:
+                        log.warning("Capture %s: session %d: %s, skip the rest", path, sid, exc)
+                        start = len(buf)
+                        break
+                    end = start + messages.Header.payload.size + header.body_length
+                    if end > len(buf):
+                        break
+                    if header.msg_id != messages.Pong.msg_id:
+                        session.frames.append((stamp - session.start, buf[start:end]))
+                    start = end
+                buffers[sid] = buf[start:]
+            elif kind == CLOSE:
+                session = sessions[opened.pop(sid)]
+                del buffers[sid]
+                session.closed = stamp - session.start
+    for session in sessions.values():
+        if session.closed is None:
+            session.closed = session.frames[-1][0] if session.frames else 0.0
+    return sorted(sessions.values(), key=lambda s: s.start)
+
+
+class ReplayClient(protocol.Protocol):
+    """Plays back one captured session, answering the pings of the server.
+
+    Messages are held until the server greeting arrives, as a RecCaster
+    does, then sent at their recorded times, scaled by speed.
+    """
+
+    def __init__(self, session, clock, speed):
+        self.session, self.clock, self.speed = session, clock, speed
+        self.greeted = False
+        self._buf = b""
+        self._call = None
+        self.sent = 0
+
+    def _delay(self, offset):
+        return offset / self.speed if self.speed > 0 else 0
+
+    def dataReceived(self, data):
+        self._buf += data
+        size = messages.Header.payload.size
+        while len(self._buf) >= size:
+            header = messages.Header.decode(self._buf[:size])
+            if len(self._buf) < size + header.body_length:
+                return
+            body, self._buf = self._buf[size : size + header.body_length], self._buf[size + header.body_length :]
+            if header.msg_id == messages.Ping.msg_id:
+                nonce = messages.Ping.decode(body).nonce
+                self.transport.write(messages.Pong(nonce).frame())
+            elif header.msg_id == messages.ServerGreeting.msg_id and not self.greeted:
+                self.greeted = True
+                self._schedule()
+
+    def _schedule(self):
+        # The capture starts with the client greeting, sent on receipt of the
+        # server greeting, so times are kept relative to the greeting.
+        self.greeted_at = self.clock.seconds()
+        self._send_next()
+
+    def _send_next(self):
+        # one timer at a time, as calls due at the same time may run in any order
+        self._call = None
+        while self.sent < len(self.session.frames):
+            offset, frame = self.session.frames[self.sent]
+            delay = self.greeted_at + self._delay(offset) - self.clock.seconds()
+            if delay > 0:
+                self._call = self.clock.callLater(delay, self._send_next)
+                return
+            self.sent += 1
+            self.transport.write(frame)
+        delay = self.greeted_at + self._delay(self.session.closed) - self.clock.seconds()
+        self._call = self.clock.callLater(max(delay, 0), self.transport.loseConnection)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self.factory.finished.callback(self.sent)
+
+
+class ReplayFactory(protocol.ClientFactory):
+    def __init__(self, session, clock, speed):
+        self.session, self.clock, self.speed = session, clock, speed
+        self.finished = defer.Deferred()
+
+    def buildProtocol(self, addr):
+        p = ReplayClient(self.session, self.clock, self.speed)
+        p.factory = self
+        return p
+
+    def clientConnectionFailed(self, connector, reason):
+        log.error("Replay of session %d from %s failed to connect: %s", self.session.sid, self.session.peer, reason)
+        self.finished.callback(0)
+
+
+def replay(reactor, sessions, host, port, speed=1.0, copies=1):
+    """Connect one client per session and copy, each at its recorded start time scaled by speed.
+
+    Returns a Deferred firing with the number of messages sent once
+    every connection has closed.
+    """
+    if not sessions:
+        return defer.succeed(0)
+    first = sessions[0].start
+    done = []
+    for session in sessions:
+        delay = (session.start - first) / speed if speed > 0 else 0
+        for _ in range(copies):
+            factory = ReplayFactory(session, reactor, speed)
+            reactor.callLater(delay, reactor.connectTCP, host, port, factory)
+            done.append(factory.finished)
+    return defer.gatherResults(done).addCallback(sum)
+
+
+def main(reactor, argv):
+    parser = argparse.ArgumentParser(prog="python -m recceiver.capture", description=__doc__.split("\n")[0])
+    parser.add_argument("capture", help="file written with captureFile set")
+    parser.add_argument("--host", default="127.0.0.1", help="recceiver address")
+    parser.add_argument("--port", type=int, required=True, help="recceiver TCP port")
+    parser.add_argument("--speed", type=float, default=1.0, help="pace relative to the capture, 0 for maximum")
+    parser.add_argument("--copies", type=int, default=1, help="concurrent connections replaying each session")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    sessions = read_capture(args.capture)
+    log.info("Replaying %d sessions x %d to %s:%d", len(sessions), args.copies, args.host, args.port)
+    started = time.monotonic()
+
+    def report(sent):
+        elapsed = time.monotonic() - started
+        log.info("Sent %d messages in %.3f s (%.1f/s)", sent, elapsed, sent / elapsed if elapsed else 0.0)
+
+    return replay(reactor, sessions, args.host, args.port, args.speed, args.copies).addCallback(report)
+
+
+if __name__ == "__main__":
+    task.react(main, (sys.argv[1:],))
@@ -1,14 +1,26 @@
-from typing import List
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import AbstractSet, Dict, FrozenSet, Iterator, List, Optional, Tuple
 
 try:
     from typing import Protocol
 except ImportError:
     from typing_extensions import Protocol  # type: ignore[assignment]
 
+from twisted.internet.defer import Deferred
+
+from recceiver import metrics, tracing
 from recceiver.cf.model import CFChannel, CFProperty, CFPropertyName, PVStatus
+from recceiver.cf.stream import iter_json_array
 
 # CF query URLs break above this length; names are pipe-joined and chunked to stay under it.
 _CF_NAME_QUERY_LIMIT = 600
+_CHANNELS_RESOURCE = "/resources/channels"
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Names of the properties to keep on returned channels; None keeps all of them.
+Projection = Optional[AbstractSet[str]]
 
 
 class ChannelFinderAdapter(Protocol):
@@ -16,17 +28,24 @@ class ChannelFinderAdapter(Protocol):
 
     All methods accept and return domain objects (CFChannel, CFProperty).
     Dict serialisation is handled inside the implementation, not at callsites.
+
+    The find methods take an optional properties projection: when given, the
+    returned channels carry only the properties with those names.
     """
 
-    def find_by_ioc_id(self, iocid: str) -> List[CFChannel]:
+    def find_by_ioc_id(self, iocid: str, properties: Projection = None) -> List[CFChannel]:
         """Return all channels registered under the given IOC ID."""
         ...
 
-    def find_by_names(self, names: List[str]) -> List[CFChannel]:
+    def iter_by_ioc_id(self, iocid: str, properties: Projection = None) -> Iterator[CFChannel]:
+        """Yield the channels registered under the given IOC ID as they are decoded."""
+        ...
+
+    def find_by_names(self, names: List[str], properties: Projection = None) -> List[CFChannel]:
         """Return channels whose names are in the given list."""
         ...
 
-    def find_active_for_recceiver(self, recceiverid: str) -> List[CFChannel]:
+    def find_active_for_recceiver(self, recceiverid: str, properties: Projection = None) -> List[CFChannel]:
         """Return all channels marked Active for the given recceiver."""
         ...
 
@@ -47,56 +66,275 @@ class ChannelFinderAdapter(Protocol):
         ...
 
 
+class AsyncChannelFinderAdapter(Protocol):
+    """Non-blocking counterpart of ChannelFinderAdapter.
+
+    Same operations and domain objects, but every method returns a Deferred
+    that fires on the reactor thread instead of blocking the caller.
+    """
+
+    def find_by_ioc_id(self, iocid: str, properties: Projection = None) -> Deferred:
+        """Fire with all channels registered under the given IOC ID."""
+        ...
+
+    def find_by_names(self, names: List[str], properties: Projection = None) -> Deferred:
+        """Fire with the channels whose names are in the given list."""
+        ...
+
+    def find_active_for_recceiver(self, recceiverid: str, properties: Projection = None) -> Deferred:
+        """Fire with all channels marked Active for the given recceiver."""
+        ...
+
+    def set_channels(self, channels: List[CFChannel]) -> Deferred:
+        """Create or overwrite channels."""
+        ...
+
+    def update_property(self, prop: CFProperty, channel_names: List[str]) -> Deferred:
+        """Update a single property value across the named channels."""
+        ...
+
+    def get_property_names(self) -> Deferred:
+        """Fire with the names of all property definitions registered in ChannelFinder."""
+        ...
+
+    def set_property(self, name: str, owner: str) -> Deferred:
+        """Register a property definition if it does not already exist."""
+        ...
+
+    def close(self) -> Deferred:
+        """Release any pooled connections."""
+        ...
+
+
+def name_query_chunks(names: List[str]) -> List[str]:
+    """Pipe-join names into '~name' query values that stay under the CF URL length limit."""
+    chunks, buf = [], ""
+    for name in names:
+        if not buf:
+            buf = name
+        elif len(buf) + len(name) < _CF_NAME_QUERY_LIMIT:
+            buf = buf + "|" + name
+        else:
+            chunks.append(buf)
+            buf = name
+    if buf:
+        chunks.append(buf)
+    return chunks
+
+
+NAME_LOOKUP_CHUNKED = "chunked"
+NAME_LOOKUP_PREFIX = "prefix"
+NAME_LOOKUP_AUTO = "auto"
+
+# Glob characters cannot appear in the literal part of a wildcard query.
+_GLOB_CHARS = "*?"
+
+
+def name_prefix_groups(names: List[str], min_group: int) -> Tuple[Dict[str, List[str]], List[str]]:
+    """Group names by their prefix up to and including the last ':'.
+
+    Returns the groups with at least min_group members, keyed by prefix,
+    and the list of names that belong to no such group.
+    """
+    groups: Dict[str, List[str]] = defaultdict(list)
+    rest = []
+    for name in names:
+        head, sep, _ = name.rpartition(":")
+        if sep and head and not any(c in head for c in _GLOB_CHARS):
+            groups[head + sep].append(name)
+        else:
+            rest.append(name)
+    large = {}
+    for prefix, members in groups.items():
+        if len(members) >= min_group:
+            large[prefix] = members
+        else:
+            rest.extend(members)
+    return large, rest
+
+
+@dataclass
+class NameLookupPlan:
+    """The '~name' queries for one find_by_names() call.
+
+    Each query is paired with the set of names to keep from its result,
+    or None when the query lists the names exactly.
+    """
+
+    strategy: str
+    queries: List[Tuple[str, Optional[FrozenSet[str]]]]
+
+
+class NameLookupPlanner:
+    """Chooses how find_by_names() turns a list of names into '~name' queries.
+
+    chunked -- pipe-joined exact names, split to stay under the URL length limit.
+    prefix  -- each group of names sharing a prefix becomes one 'PREFIX*' wildcard
+               query filtered client-side; the remaining names are chunked.
+    auto    -- uses whichever strategy has the lower measured seconds per name,
+               re-measuring the other one every explore_interval lookups.
+
+    Wildcard queries need a size limit to detect truncated results, so without
+    one the planner always chunks. They are sent with the smaller
+    wildcard_size_limit, which bounds what a prefix matching far more
+    channels than asked for costs, and groups larger than it are chunked.
+    """
+
+    def __init__(
+        self,
+        mode: str = NAME_LOOKUP_CHUNKED,
+        size_limit: int = 0,
+        min_group: int = 8,
+        explore_interval: int = 20,
+        wildcard_size_limit: int = 1000,
+    ):
+        if mode not in (NAME_LOOKUP_CHUNKED, NAME_LOOKUP_PREFIX, NAME_LOOKUP_AUTO):
+            raise ValueError(f"Unknown name lookup strategy '{mode}'")
+        self.mode = mode if size_limit > 0 else NAME_LOOKUP_CHUNKED
+        self.wildcard_size_limit = min(size_limit, wildcard_size_limit) if wildcard_size_limit > 0 else size_limit
+        self.min_group = min_group
+        self.explore_interval = explore_interval
+        self.cost: Dict[str, float] = {}
+        self._lookups = 0
+
+    def plan(self, names: List[str]) -> NameLookupPlan:
+        if self.mode != NAME_LOOKUP_CHUNKED:
+            groups, rest = name_prefix_groups(names, self.min_group)
+            for prefix in [prefix for prefix, members in groups.items() if len(members) > self.wildcard_size_limit]:
+                rest.extend(groups.pop(prefix))
+            if groups and self._choose() == NAME_LOOKUP_PREFIX:
+                queries = [(prefix + "*", frozenset(members)) for prefix, members in groups.items()]
+                queries.extend((chunk, None) for chunk in name_query_chunks(rest))
+                return NameLookupPlan(NAME_LOOKUP_PREFIX, queries)
+        return NameLookupPlan(NAME_LOOKUP_CHUNKED, [(chunk, None) for chunk in name_query_chunks(names)])
+
+    def _choose(self) -> str:
+        if self.mode != NAME_LOOKUP_AUTO:
+            return self.mode
+        self._lookups += 1
+        chunked, prefix = self.cost.get(NAME_LOOKUP_CHUNKED), self.cost.get(NAME_LOOKUP_PREFIX)
+        if chunked is None:
+            return NAME_LOOKUP_CHUNKED
+        if prefix is None:
+            return NAME_LOOKUP_PREFIX
+        best, other = (
+            (NAME_LOOKUP_PREFIX, NAME_LOOKUP_CHUNKED) if prefix < chunked else (NAME_LOOKUP_CHUNKED, NAME_LOOKUP_PREFIX)
+        )
+        if self._lookups % self.explore_interval == 0:
+            return other
+        return best
+
+    def record(self, strategy: str, elapsed: float, name_count: int) -> None:
+        """Fold the duration of a completed lookup into the strategy's cost estimate."""
+        metrics.cf_name_lookup_duration_seconds.labels(strategy=strategy).observe(elapsed)
+        sample = elapsed / max(name_count, 1)
+        previous = self.cost.get(strategy)
+        self.cost[strategy] = sample if previous is None else 0.7 * previous + 0.3 * sample
+
+
 class PyCFClientAdapter:
-    """Wraps pyCFClient's ChannelFinderClient to implement ChannelFinderAdapter."""
+    """Wraps pyCFClient's ChannelFinderClient to implement ChannelFinderAdapter.
+
+    When base_url and a requests session are given, channel queries bypass
+    findByArgs() and decode the response incrementally, so the raw body and
+    the intermediate dicts are never held for the whole result at once.
+    ChannelFinder has no server-side property selection, so projections are
+    applied while decoding: properties outside the projection are never
+    turned into CFProperty objects.
+    """
 
-    def __init__(self, client, size_limit: int = 0):
+    def __init__(
+        self,
+        client,
+        size_limit: int = 0,
+        base_url: Optional[str] = None,
+        session=None,
+        name_lookup: Optional[NameLookupPlanner] = None,
+    ):
         self._client = client
         self._size_limit = size_limit
+        self._name_lookup = name_lookup or NameLookupPlanner()
+        self._channels_url = base_url.rstrip("/") + _CHANNELS_RESOURCE if base_url and session else None
+        self._session = session
+
+    def _iter_find(
+        self, args: List, properties: Projection = None, size_limit: Optional[int] = None
+    ) -> Iterator[CFChannel]:
+        size_limit = self._size_limit if size_limit is None else size_limit
+        if size_limit > 0:
+            args = args + [("~size", size_limit)]
+        with tracing.span("cf.find", args=",".join(key for key, _ in args)):
+            if self._channels_url is None:
+                for ch in self._client.findByArgs(args):
+                    yield CFChannel.from_dict(ch, properties)
+                return
+            with self._session.get(
+                self._channels_url, params=args, headers={"Accept": "application/json"}, stream=True
+            ) as response:
+                response.raise_for_status()
+                for ch in iter_json_array(response.iter_content(chunk_size=_STREAM_CHUNK_SIZE)):
+                    yield CFChannel.from_dict(ch, properties)
 
-    def _find(self, args: List) -> List[CFChannel]:
-        if self._size_limit > 0:
-            args = args + [("~size", self._size_limit)]
-        return [CFChannel.from_dict(ch) for ch in self._client.findByArgs(args)]
+    def _find(self, args: List, properties: Projection = None) -> List[CFChannel]:
+        return list(self._iter_find(args, properties))
 
-    def find_by_ioc_id(self, iocid: str) -> List[CFChannel]:
-        return self._find([(CFPropertyName.IOC_ID.value, iocid)])
+    def find_by_ioc_id(self, iocid: str, properties: Projection = None) -> List[CFChannel]:
+        return self._find([(CFPropertyName.IOC_ID.value, iocid)], properties)
 
-    def find_by_names(self, names: List[str]) -> List[CFChannel]:
+    def iter_by_ioc_id(self, iocid: str, properties: Projection = None) -> Iterator[CFChannel]:
+        return self._iter_find([(CFPropertyName.IOC_ID.value, iocid)], properties)
+
+    def find_by_names(self, names: List[str], properties: Projection = None) -> List[CFChannel]:
         if not names:
             return []
-        chunks, buf = [], ""
-        for name in names:
-            if not buf:
-                buf = name
-            elif len(buf) + len(name) < _CF_NAME_QUERY_LIMIT:
-                buf = buf + "|" + name
-            else:
-                chunks.append(buf)
-                buf = name
-        if buf:
-            chunks.append(buf)
+        plan = self._name_lookup.plan(names)
+        t0 = time.monotonic()
         results = []
-        for chunk in chunks:
-            results.extend(self._find([("~name", chunk)]))
+        for query, wanted in plan.queries:
+            results.extend(self._find_name_query(plan.strategy, query, wanted, properties))
+        self._name_lookup.record(plan.strategy, time.monotonic() - t0, len(names))
         return results
 
-    def find_active_for_recceiver(self, recceiverid: str) -> List[CFChannel]:
+    def _find_name_query(
+        self, strategy: str, query: str, wanted: Optional[FrozenSet[str]], properties: Projection
+    ) -> List[CFChannel]:
+        metrics.cf_name_lookup_requests_total.labels(strategy=strategy).inc()
+        if wanted is None:
+            return self._find([("~name", query)], properties)
+        found, count, size_limit = [], 0, self._name_lookup.wildcard_size_limit
+        for ch in self._iter_find([("~name", query)], properties, size_limit):
+            count += 1
+            if ch.name in wanted:
+                found.append(ch)
+        if count < size_limit:
+            return found
+        # The wildcard result hit the size limit; look the group up by exact name instead.
+        found = []
+        for chunk in name_query_chunks(sorted(wanted)):
+            found.extend(self._find_name_query(strategy, chunk, None, properties))
+        return found
+
+    def find_active_for_recceiver(self, recceiverid: str, properties: Projection = None) -> List[CFChannel]:
         return self._find(
             [
                 (CFPropertyName.PV_STATUS.value, PVStatus.ACTIVE.value),
                 (CFPropertyName.RECCEIVER_ID.value, recceiverid),
-            ]
+            ],
+            properties,
         )
 
     def set_channels(self, channels: List[CFChannel]) -> None:
-        self._client.set(channels=[ch.as_dict() for ch in channels])
+        with tracing.span("cf.set_channels", channels=len(channels)):
+            self._client.set(channels=[ch.as_dict() for ch in channels])
 
     def update_property(self, prop: CFProperty, channel_names: List[str]) -> None:
-        self._client.update(property=prop.as_dict(), channelNames=channel_names)
+        with tracing.span("cf.update_property", property=prop.name, channels=len(channel_names)):
+            self._client.update(property=prop.as_dict(), channelNames=channel_names)
 
     def get_property_names(self) -> List[str]:
-        return [p["name"] for p in self._client.getAllProperties()]
+        with tracing.span("cf.get_properties"):
+            return [p["name"] for p in self._client.getAllProperties()]
 
     def set_property(self, name: str, owner: str) -> None:
-        self._client.set(property={"name": name, "owner": owner})
+        with tracing.span("cf.set_property", property=name):
+            self._client.set(property={"name": name, "owner": owner})
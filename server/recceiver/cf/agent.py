@@ -0,0 +1,297 @@
+"""Non-blocking ChannelFinder client built on twisted.web.client.Agent."""
+
+import json
+import logging
+import time
+from base64 import b64encode
+from typing import Any, FrozenSet, List, Optional, Sequence, Tuple
+from urllib.parse import quote, urlencode
+
+from requests import ConnectionError, HTTPError
+from twisted.internet import defer, error, protocol
+from twisted.web.client import Agent, HTTPConnectionPool, PartialDownloadError, ResponseDone, ResponseFailed, readBody
+from twisted.web.http import PotentialDataLoss
+from twisted.web.http_headers import Headers
+from twisted.web.iweb import IBodyProducer, IPolicyForHTTPS
+from zope.interface import implementer
+
+from recceiver import metrics
+from recceiver.cf.adapter import NameLookupPlanner, Projection, name_query_chunks
+from recceiver.cf.model import CFChannel, CFProperty, CFPropertyName, PVStatus
+from recceiver.cf.stream import JSONArrayDecoder
+
+log = logging.getLogger(__name__)
+
+_CHANNELS = "/resources/channels"
+_PROPERTIES = "/resources/properties"
+
+
+@implementer(IBodyProducer)
+class _JSONBody:
+    """Request body producer that writes a pre-encoded JSON document in one go."""
+
+    def __init__(self, payload: Any):
+        self.body = json.dumps(payload).encode()
+        self.length = len(self.body)
+
+    def startProducing(self, consumer):
+        consumer.write(self.body)
+        return defer.succeed(None)
+
+    def pauseProducing(self):
+        pass  # body is written in a single call
+
+    def resumeProducing(self):
+        pass  # body is written in a single call
+
+    def stopProducing(self):
+        pass  # body is written in a single call
+
+
+class _ChannelStream(protocol.Protocol):
+    """Decodes a channel list response into CFChannels while the body arrives."""
+
+    def __init__(self, finished: defer.Deferred, properties: Projection = None):
+        self.finished = finished
+        self.properties = properties
+        self.channels: List[CFChannel] = []
+        self._decoder = JSONArrayDecoder()
+        self._error: Optional[Exception] = None
+
+    def _add(self, items) -> None:
+        self.channels.extend(CFChannel.from_dict(ch, self.properties) for ch in items)
+
+    def dataReceived(self, data: bytes):
+        if self._error is not None:
+            return
+        try:
+            self._add(self._decoder.feed(data))
+        except ValueError as exc:
+            self._error = exc
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        if not reason.check(ResponseDone):
+            # the body was cut short, whatever was decoded of it is incomplete
+            self.finished.errback(reason)
+            return
+        try:
+            if self._error is not None:
+                raise self._error
+            self._add(self._decoder.close())
+        except ValueError as exc:
+            self.finished.errback(exc)
+        else:
+            self.finished.callback(self.channels)
+
+
+@implementer(IPolicyForHTTPS)
+class _NoVerifyPolicy:
+    """TLS policy used when verifySSL is disabled."""
+
+    def creatorForNetloc(self, hostname, port):
+        from twisted.internet.ssl import CertificateOptions
+
+        return CertificateOptions(verify=False)
+
+
+class AgentCFAdapter:
+    """Implements AsyncChannelFinderAdapter with twisted.web.client.Agent.
+
+    Requests run on the reactor over a persistent HTTPConnectionPool, so no
+    worker thread is needed per call. At most max_connections requests are in
+    flight at once; further calls queue on a DeferredSemaphore.
+
+    HTTP error statuses and connection failures are raised as the matching
+    requests exceptions so CFProcessor's retry handling is shared with
+    PyCFClientAdapter.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        verify_ssl: bool = True,
+        size_limit: int = 0,
+        max_connections: int = 16,
+        name_lookup: Optional[NameLookupPlanner] = None,
+        reactor=None,
+        agent=None,
+    ):
+        if reactor is None:
+            from twisted.internet import reactor
+        self._base_url = base_url.rstrip("/")
+        self._size_limit = size_limit
+        self._name_lookup = name_lookup or NameLookupPlanner()
+        self._username = username
+        self._headers = {
+            b"Accept": [b"application/json"],
+            b"Content-Type": [b"application/json"],
+        }
+        if username:
+            token = b64encode(f"{username}:{password or ''}".encode())
+            self._headers[b"Authorization"] = [b"Basic " + token]
+        self._pool = None
+        if agent is None:
+            self._pool = HTTPConnectionPool(reactor, persistent=True)
+            self._pool.maxPersistentPerHost = max_connections
+            if verify_ssl:
+                agent = Agent(reactor, pool=self._pool)
+            else:
+                agent = Agent(reactor, contextFactory=_NoVerifyPolicy(), pool=self._pool)
+        self._agent = agent
+        self._slots = defer.DeferredSemaphore(max_connections)
+
+    def _request(
+        self,
+        method: bytes,
+        path: str,
+        args: Optional[Sequence[Tuple[str, Any]]] = None,
+        payload=None,
+        reader=None,
+    ):
+        url = self._base_url + path
+        if args:
+            url = url + "?" + urlencode(args)
+        body = None if payload is None else _JSONBody(payload)
+        return self._slots.run(self._send, method, url, body, reader or self._read_response)
+
+    def _send(self, method: bytes, url: str, body: Optional[_JSONBody], reader) -> defer.Deferred:
+        d = self._agent.request(method, url.encode(), Headers(self._headers), body)
+        d.addCallbacks(
+            reader,
+            self._connection_failed,
+            callbackArgs=(method, url),
+            errbackArgs=(method, url),
+        )
+        d.addErrback(self._body_failed, method, url)
+        return d
+
+    def _read_response(self, response, method: bytes, url: str) -> defer.Deferred:
+        def decode(body: bytes):
+            if response.code >= 400:
+                raise _http_error(response, method, url)
+            if not body:
+                return None
+            return json.loads(body)
+
+        return readBody(response).addCallback(decode)
+
+    def _channel_reader(self, properties: Projection):
+        def read_channels(response, method: bytes, url: str) -> defer.Deferred:
+            if response.code >= 400:
+                return self._read_response(response, method, url)
+            d = defer.Deferred()
+            response.deliverBody(_ChannelStream(d, properties))
+            return d
+
+        return read_channels
+
+    @staticmethod
+    def _connection_failed(err, method: bytes, url: str):
+        if err.check(defer.CancelledError):
+            return err
+        raise ConnectionError(f"{method.decode()} {url} failed: {err.getErrorMessage()}")
+
+    @staticmethod
+    def _body_failed(err, method: bytes, url: str):
+        if err.check(ResponseFailed, PotentialDataLoss, PartialDownloadError, error.ConnectionLost):
+            raise ConnectionError(f"{method.decode()} {url} failed reading the response: {err.getErrorMessage()}")
+        return err
+
+    def _find(
+        self, args: List[Tuple[str, Any]], properties: Projection = None, size_limit: Optional[int] = None
+    ) -> defer.Deferred:
+        size_limit = self._size_limit if size_limit is None else size_limit
+        if size_limit > 0:
+            args = args + [("~size", size_limit)]
+        return self._request(b"GET", _CHANNELS, args, reader=self._channel_reader(properties))
+
+    def find_by_ioc_id(self, iocid: str, properties: Projection = None) -> defer.Deferred:
+        return self._find([(CFPropertyName.IOC_ID.value, iocid)], properties)
+
+    def find_by_names(self, names: List[str], properties: Projection = None) -> defer.Deferred:
+        if not names:
+            return defer.succeed([])
+        plan = self._name_lookup.plan(names)
+        t0 = time.monotonic()
+
+        def merge(results):
+            self._name_lookup.record(plan.strategy, time.monotonic() - t0, len(names))
+            return [ch for chunk in results for ch in chunk]
+
+        d = defer.gatherResults(
+            [self._find_name_query(plan.strategy, query, wanted, properties) for query, wanted in plan.queries],
+            consumeErrors=True,
+        )
+        d.addCallbacks(merge, _unwrap_first_error)
+        return d
+
+    def _find_name_query(
+        self, strategy: str, query: str, wanted: Optional[FrozenSet[str]], properties: Projection
+    ) -> defer.Deferred:
+        metrics.cf_name_lookup_requests_total.labels(strategy=strategy).inc()
+        if wanted is None:
+            return self._find([("~name", query)], properties)
+        size_limit = self._name_lookup.wildcard_size_limit
+        d = self._find([("~name", query)], properties, size_limit)
+
+        def filter_group(channels: List[CFChannel]):
+            if len(channels) < size_limit:
+                return [ch for ch in channels if ch.name in wanted]
+            # The wildcard result hit the size limit; look the group up by exact name instead.
+            exact = defer.gatherResults(
+                [
+                    self._find_name_query(strategy, chunk, None, properties)
+                    for chunk in name_query_chunks(sorted(wanted))
+                ],
+                consumeErrors=True,
+            )
+            exact.addCallbacks(lambda results: [ch for chunk in results for ch in chunk], _unwrap_first_error)
+            return exact
+
+        return d.addCallback(filter_group)
+
+    def find_active_for_recceiver(self, recceiverid: str, properties: Projection = None) -> defer.Deferred:
+        return self._find(
+            [
+                (CFPropertyName.PV_STATUS.value, PVStatus.ACTIVE.value),
+                (CFPropertyName.RECCEIVER_ID.value, recceiverid),
+            ],
+            properties,
+        )
+
+    def set_channels(self, channels: List[CFChannel]) -> defer.Deferred:
+        return self._request(b"PUT", _CHANNELS, payload=[ch.as_dict() for ch in channels])
+
+    def update_property(self, prop: CFProperty, channel_names: List[str]) -> defer.Deferred:
+        payload = prop.as_dict()
+        payload["channels"] = [
+            {"name": name, "owner": self._username or prop.owner, "properties": [prop.as_dict()]}
+            for name in channel_names
+        ]
+        return self._request(b"POST", _PROPERTIES + "/" + quote(prop.name, safe=""), payload=payload)
+
+    def get_property_names(self) -> defer.Deferred:
+        d = self._request(b"GET", _PROPERTIES)
+        d.addCallback(lambda result: [p["name"] for p in result or []])
+        return d
+
+    def set_property(self, name: str, owner: str) -> defer.Deferred:
+        return self._request(b"PUT", _PROPERTIES + "/" + quote(name, safe=""), payload={"name": name, "owner": owner})
+
+    def close(self) -> defer.Deferred:
+        if self._pool is None:
+            return defer.succeed(None)
+        return self._pool.closeCachedConnections()
+
+
+def _http_error(response, method: bytes, url: str) -> HTTPError:
+    return HTTPError(f"{response.code} {response.phrase.decode()} for {method.decode()} {url}")
+
+
+def _unwrap_first_error(err):
+    """Re-raise the underlying failure of a gatherResults() FirstError."""
+    if err.check(defer.FirstError):
+        return err.value.subFailure
+    return err
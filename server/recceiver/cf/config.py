@@ -6,6 +6,8 @@ from recceiver.processors import ConfigAdapter
 
 RECCEIVERID_DEFAULT = socket.gethostname()
 DEFAULT_QUERY_LIMIT = 10_000
+CF_CLIENT_PYCFCLIENT = "pycfclient"
+CF_CLIENT_AGENT = "agent"
 
 
 @dataclass
@@ -32,6 +34,11 @@ class CFConfig:
     push_max_retries: int = 10
     push_always_retry: bool = False
     status_interval: float = 60.0
+    cf_client: str = CF_CLIENT_PYCFCLIENT
+    cf_max_connections: int = 16
+    stream_find: bool = True
+    name_lookup: str = "chunked"
+    name_lookup_size_limit: int = 1000
 
     @classmethod
     def loads(cls, conf: ConfigAdapter) -> "CFConfig":
@@ -57,6 +64,11 @@ class CFConfig:
             push_max_retries=conf.getint("pushMaxRetries", 10),
             push_always_retry=conf.getboolean("pushAlwaysRetry", False),
             status_interval=float(conf.get("statusInterval", "60.0")),
+            cf_client=conf.get("cfClient", CF_CLIENT_PYCFCLIENT).strip().lower(),
+            cf_max_connections=conf.getint("cfMaxConnections", 16),
+            stream_find=conf.getboolean("streamFind", True),
+            name_lookup=conf.get("nameLookup", "chunked").strip().lower(),
+            name_lookup_size_limit=conf.getint("nameLookupSizeLimit", 1000),
         )
 
     def __repr__(self) -> str:
@@ -1,6 +1,6 @@
 import enum
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import Any, Container, Dict, List, Optional
 
 
 class PVStatus(enum.Enum):
@@ -66,12 +66,18 @@ class CFChannel:
         }
 
     @classmethod
-    def from_dict(cls, channel_dict: Dict[str, Any]) -> "CFChannel":
-        """Deserialise from the dict shape returned by pyCFClient."""
+    def from_dict(cls, channel_dict: Dict[str, Any], properties: Optional[Container[str]] = None) -> "CFChannel":
+        """Deserialise from the dict shape returned by pyCFClient.
+
+        If properties is given, only properties with those names are kept.
+        """
+        prop_dicts = channel_dict.get("properties", [])
+        if properties is not None:
+            prop_dicts = [p for p in prop_dicts if p.get("name") in properties]
         return cls(
             name=channel_dict.get("name", ""),
             owner=channel_dict.get("owner", ""),
-            properties=[CFProperty.from_dict(p) for p in channel_dict.get("properties", [])],
+            properties=[CFProperty.from_dict(p) for p in prop_dicts],
         )
 
 
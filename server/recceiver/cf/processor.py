@@ -2,8 +2,9 @@ import datetime
 import logging
 import time
 from collections import defaultdict
-from typing import Callable, Dict, List, Optional, Set
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
+import requests
 from channelfinder import ChannelFinderClient
 from requests import ConnectionError, RequestException
 from twisted.application import service
@@ -12,9 +13,15 @@ from twisted.internet.defer import DeferredLock
 from twisted.internet.threads import deferToThread
 from zope.interface import implementer
 
-from recceiver import interfaces, metrics
-from recceiver.cf.adapter import ChannelFinderAdapter, PyCFClientAdapter
-from recceiver.cf.config import CFConfig
+from recceiver import interfaces, metrics, tracing
+from recceiver.cf.adapter import (
+    AsyncChannelFinderAdapter,
+    ChannelFinderAdapter,
+    NameLookupPlanner,
+    PyCFClientAdapter,
+)
+from recceiver.cf.agent import AgentCFAdapter
+from recceiver.cf.config import CF_CLIENT_AGENT, CF_CLIENT_PYCFCLIENT, CFConfig
 from recceiver.cf.model import (
     CFChannel,
     CFProperty,
@@ -42,7 +49,7 @@ class CFProcessor(service.Service):
         self.name = name  # Override name from service.Service
         self.channel_ioc_ids: Dict[str, List[str]] = defaultdict(list)
         self.iocs: Dict[str, IOCInfo] = {}
-        self.client: Optional[ChannelFinderAdapter] = None
+        self.client: Optional[Union[ChannelFinderAdapter, AsyncChannelFinderAdapter]] = None
         self.current_time: Callable[[Optional[str]], str] = get_current_time
         self.lock: DeferredLock = DeferredLock()
         self._statusLoop = None
@@ -58,12 +65,17 @@ class CFProcessor(service.Service):
             raise RuntimeError("Failed to acquired CF Processor lock for service start")
 
         try:
-            self._start_service_with_lock()
+            started = self._start_service_with_lock()
         except:
             service.Service.stopService(self)
+            self.lock.release()
             raise
-        finally:
+
+        if started is None:
             self.lock.release()
+        else:
+            # Async client: commits queue on the lock until CF properties are registered.
+            started.addBoth(lambda _: self.lock.release())
 
         if self.cf_config.status_interval > 0:
             self._statusLoop = task.LoopingCall(self._logStatus)
@@ -74,19 +86,13 @@ class CFProcessor(service.Service):
         metrics.tracked_channels.set(len(self.channel_ioc_ids))
         log.info("CF status: known_iocs=%d tracked_channels=%d", len(self.iocs), len(self.channel_ioc_ids))
 
-    def _start_service_with_lock(self):
+    def _start_service_with_lock(self) -> Optional[defer.Deferred]:
         log.info("CF_START with configuration: %s", self.cf_config)
 
         if self.client is None:  # For setting up mock test client
-            self.client = PyCFClientAdapter(
-                ChannelFinderClient(
-                    BaseURL=self.cf_config.base_url,
-                    username=self.cf_config.cf_username,
-                    password=self.cf_config.cf_password,
-                    verify_ssl=self.cf_config.verify_ssl,
-                ),
-                size_limit=int(self.cf_config.cf_query_limit),
-            )
+            self.client = self._make_client()
+            if self.is_async:
+                return self._start_async()
             try:
                 cf_properties = set(self.client.get_property_names())
                 self._setup_cf_properties(cf_properties)
@@ -94,16 +100,87 @@ class CFProcessor(service.Service):
                 log.exception("Cannot connect to Channelfinder service")
                 raise
             else:
-                if self.cf_config.clean_on_start:
-                    log.info("CF Clean: scheduling background startup sweep")
-                    from twisted.internet import reactor
+                self._schedule_clean_on_start()
+        return None
+
+    def _make_client(self) -> Union[ChannelFinderAdapter, AsyncChannelFinderAdapter]:
+        name_lookup = NameLookupPlanner(
+            self.cf_config.name_lookup,
+            size_limit=int(self.cf_config.cf_query_limit),
+            wildcard_size_limit=self.cf_config.name_lookup_size_limit,
+        )
+        if self.cf_config.cf_client == CF_CLIENT_AGENT:
+            if not self.cf_config.base_url:
+                raise ValueError("baseUrl must be configured when cfClient = agent")
+            return AgentCFAdapter(
+                self.cf_config.base_url,
+                username=self.cf_config.cf_username,
+                password=self.cf_config.cf_password,
+                verify_ssl=self.cf_config.verify_ssl is not False,
+                size_limit=int(self.cf_config.cf_query_limit),
+                max_connections=self.cf_config.cf_max_connections,
+                name_lookup=name_lookup,
+            )
+        if self.cf_config.cf_client != CF_CLIENT_PYCFCLIENT:
+            raise ValueError(f"Unknown cfClient '{self.cf_config.cf_client}'")
+        return PyCFClientAdapter(
+            ChannelFinderClient(
+                BaseURL=self.cf_config.base_url,
+                username=self.cf_config.cf_username,
+                password=self.cf_config.cf_password,
+                verify_ssl=self.cf_config.verify_ssl,
+            ),
+            size_limit=int(self.cf_config.cf_query_limit),
+            base_url=self.cf_config.base_url if self.cf_config.stream_find else None,
+            session=self._make_stream_session() if self.cf_config.stream_find else None,
+            name_lookup=name_lookup,
+        )
+
+    def _make_stream_session(self) -> requests.Session:
+        """requests session used by PyCFClientAdapter to stream channel queries."""
+        session = requests.Session()
+        if self.cf_config.cf_username:
+            session.auth = (self.cf_config.cf_username, self.cf_config.cf_password)
+        if self.cf_config.verify_ssl is not None:
+            session.verify = self.cf_config.verify_ssl
+        return session
+
+    @property
+    def is_async(self) -> bool:
+        """True when self.client returns Deferreds and commits run on the reactor."""
+        return self.cf_config.cf_client == CF_CLIENT_AGENT
+
+    @defer.inlineCallbacks
+    def _start_async(self):
+        """Register CF properties through the async client, retrying until CF answers."""
+        from twisted.internet import reactor
+
+        sleep = 1.0
+        while self.running:
+            try:
+                cf_properties = set((yield self.client.get_property_names()))
+                yield defer.gatherResults(self._setup_cf_properties(cf_properties), consumeErrors=True)
+            except Exception as err:
+                retry_seconds = min(60, sleep)
+                log.error("Cannot connect to Channelfinder service: %s (retry in %s seconds)", err, retry_seconds)
+                yield task.deferLater(reactor, retry_seconds, lambda: None)
+                sleep *= 1.5
+            else:
+                self._schedule_clean_on_start()
+                return
+
+    def _schedule_clean_on_start(self) -> None:
+        if self.cf_config.clean_on_start:
+            log.info("CF Clean: scheduling background startup sweep")
+            from twisted.internet import reactor
 
-                    reactor.callLater(0, self._start_background_clean)
+            reactor.callLater(0, self._start_background_clean)
 
-    def _setup_cf_properties(self, cf_properties: Set[str]) -> None:
+    def _setup_cf_properties(self, cf_properties: Set[str]) -> list:
         """Compute required CF properties, register any missing ones, and cache state.
 
         Sets self.env_vars, self.record_property_names_list, and self.managed_properties.
+        Returns the set_property() results, which are Deferreds for an async client.
         """
         required_properties = {
             CFPropertyName.HOSTNAME.value,
@@ -140,12 +217,15 @@ class CFProcessor(service.Service):
             record_property_names_list.add(CFPropertyName.RECORD_DESC.value)
 
         owner = self.cf_config.username
-        for prop_name in (required_properties | record_property_names_list) - cf_properties:
+        results = [
             self.client.set_property(prop_name, owner)
+            for prop_name in (required_properties | record_property_names_list) - cf_properties
+        ]
 
         self.record_property_names_list = record_property_names_list
         self.managed_properties = required_properties | record_property_names_list
         log.debug("record_property_names_list = %s", self.record_property_names_list)
+        return results
 
     def stopService(self):
         log.info("CF_STOP")
@@ -162,20 +242,34 @@ class CFProcessor(service.Service):
         The lock is held throughout, preventing new commits from interleaving.
         """
         log.info("CF_STOP with lock")
-        if self.cf_config.clean_on_stop:
-            return deferToThread(self.clean_service)
+        d = self._run_clean() if self.cf_config.clean_on_stop else defer.succeed(None)
+        if self.is_async and self.client is not None:
+            client = self.client
+            d.addBoth(lambda result: client.close().addCallback(lambda _: result))
+        return d
 
     def _start_background_clean(self):
         log.info("CF Clean: background startup sweep beginning")
-        deferToThread(self.clean_service).addErrback(lambda err: log.error("CF Clean background sweep failed: %s", err))
+        self._run_clean().addErrback(lambda err: log.error("CF Clean background sweep failed: %s", err))
+
+    def _run_clean(self) -> defer.Deferred:
+        if self.is_async:
+            return self._clean_service_async()
+        return deferToThread(self.clean_service)
 
     # @defer.inlineCallbacks # Twisted v16 does not support cancellation!
     def commit(self, transaction_record: interfaces.ITransaction) -> defer.Deferred:
         """Commit a transaction to Channelfinder."""
-        return self.lock.run(self._commit_with_lock, transaction_record)
+        return self.lock.run(self._commit_with_lock, transaction_record, time.time())
 
-    def _commit_with_lock(self, transaction: interfaces.ITransaction) -> defer.Deferred:
+    def _commit_with_lock(self, transaction: interfaces.ITransaction, queued: Optional[float] = None) -> defer.Deferred:
         self.cancelled = False
+        trace = getattr(transaction, "trace", None)
+        if trace is not None and queued is not None:
+            trace.add("cf.lock", queued)
+
+        if self.is_async:
+            return self._commit_async(transaction)
 
         t = deferToThread(self._commit_with_thread, transaction)
 
@@ -322,6 +416,33 @@ class CFProcessor(service.Service):
             self.remove_channel(alias, iocid)
 
     def _commit_with_thread(self, transaction: interfaces.ITransaction):
+        with tracing.activate(getattr(transaction, "trace", None)):
+            prepared = self._prepare_commit(transaction)
+            if prepared is None:
+                return
+            poll_success = self._push_to_cf(*prepared)
+        if not poll_success:
+            raise defer.CancelledError(f"Failed to commit transaction after polling retries: {transaction}")
+
+    @defer.inlineCallbacks
+    def _commit_async(self, transaction: interfaces.ITransaction):
+        # no trace is activated here: it would stay current on the reactor
+        # thread across the yields, and AgentCFAdapter records no spans
+        prepared = self._prepare_commit(transaction)
+        if prepared is None:
+            return
+        poll_success = yield self._push_to_cf_async(*prepared)
+        if not poll_success:
+            raise defer.CancelledError(f"Failed to commit transaction after polling retries: {transaction}")
+
+    def _prepare_commit(
+        self, transaction: interfaces.ITransaction
+    ) -> Optional[Tuple[Dict[str, RecordInfo], List[str], IOCInfo]]:
+        """Update local IOC/channel state from the transaction.
+
+        Returns the (record_info_by_name, records_to_delete, ioc_info) arguments
+        for the CF push, or None when there is nothing to push.
+        """
         host = transaction.source_address.host
         port = transaction.source_address.port
 
@@ -379,11 +500,9 @@ class CFProcessor(service.Service):
                 host,
                 port,
             )
-            return
+            return None
         self.update_ioc_infos(transaction, ioc_info, records_to_delete, record_info_by_name)
-        poll_success = self._push_to_cf(record_info_by_name, records_to_delete, ioc_info)
-        if not poll_success:
-            raise defer.CancelledError(f"Failed to commit transaction after polling retries: {transaction}")
+        return record_info_by_name, records_to_delete, ioc_info
 
     def remove_channel(self, record_name: str, iocid: str) -> None:
         """Unlink a channel from an IOC in channel_ioc_ids and decrement channelcount.
@@ -429,16 +548,49 @@ class CFProcessor(service.Service):
                 log.info("Abandoning clean after %s seconds", retry_limit)
                 return
 
+    @defer.inlineCallbacks
+    def _clean_service_async(self):
+        """clean_service() for an async client, run on the reactor."""
+        from twisted.internet import reactor
+
+        sleep = 1
+        retry_limit = 5
+        owner = self.cf_config.username
+        recceiverid = self.cf_config.recceiver_id
+        while 1:
+            try:
+                log.info("CF Clean Started")
+                channels = yield self.get_active_channels(recceiverid)
+                while channels:
+                    yield self.clean_channels(owner, channels)
+                    channels = yield self.get_active_channels(recceiverid)
+                log.info("CF Clean Completed")
+                return
+            except RequestException:
+                log.exception("Clean service failed")
+            retry_seconds = min(60, sleep)
+            log.info("Clean service retry in %s seconds", retry_seconds)
+            yield task.deferLater(reactor, retry_seconds, lambda: None)
+            sleep *= 1.5
+            if self.running == 0 and sleep >= retry_limit:
+                log.info("Abandoning clean after %s seconds", retry_limit)
+                return
+
     def get_active_channels(self, recceiverid: str) -> List[CFChannel]:
-        """Return all CF channels currently marked Active for this recceiver."""
-        return self.client.find_active_for_recceiver(recceiverid)
+        """Return all CF channels currently marked Active for this recceiver.
+
+        Only the names are used, so no properties are decoded.
+        """
+        return self.client.find_active_for_recceiver(recceiverid, frozenset())
 
-    def clean_channels(self, owner: str, channels: List[CFChannel]) -> None:
+    def clean_channels(self, owner: str, channels: List[CFChannel]):
         """Mark the given channels Inactive in CF."""
         names = [ch.name for ch in channels or []]
         log.info("Cleaning %s channels.", len(names))
         log.debug('Update "pvStatus" property to "Inactive" for %s channels', len(names))
-        self.client.update_property(CFProperty(CFPropertyName.PV_STATUS.value, owner, PVStatus.INACTIVE.value), names)
+        return self.client.update_property(
+            CFProperty(CFPropertyName.PV_STATUS.value, owner, PVStatus.INACTIVE.value), names
+        )
 
     def _push_to_cf(
         self,
@@ -473,24 +625,54 @@ class CFProcessor(service.Service):
         log.error("CF push gave up after %d attempts: %s", count, ioc_info)
         return False
 
-    def _assert_not_cancelled(self, context: str) -> None:
-        if self.cancelled:
-            raise defer.CancelledError(f"Processor cancelled: {context}")
-
-    def _update_channelfinder(
+    @defer.inlineCallbacks
+    def _push_to_cf_async(
         self,
         record_info_by_name: Dict[str, RecordInfo],
         records_to_delete: List[str],
         ioc_info: IOCInfo,
-    ) -> None:
+    ):
+        """_push_to_cf() for an async client; retries wait with deferLater instead of sleeping."""
+        from twisted.internet import reactor
+
+        log.info("CF push start: %s (%d channels)", ioc_info, len(record_info_by_name))
+        count = 0
+        sleep = 1.0
+        while self.cf_config.push_always_retry or count < self.cf_config.push_max_retries:
+            if not self.running:
+                log.info("CF processor stopped; abandoning push for %s after %d attempt(s)", ioc_info, count)
+                return False
+            count += 1
+            t0 = time.monotonic()
+            try:
+                yield self._update_channelfinder_async(record_info_by_name, records_to_delete, ioc_info)
+                elapsed = time.monotonic() - t0
+                metrics.cf_commit_duration_seconds.observe(elapsed)
+                metrics.cf_commits_total.labels(result="success").inc()
+                log.info("CF push done in %.2fs: %s (%d channels)", elapsed, ioc_info, len(record_info_by_name))
+                return True
+            except RequestException:
+                elapsed = time.monotonic() - t0
+                log.exception("CF push failed after %.2fs (attempt %d): %s", elapsed, count, ioc_info)
+                retry_seconds = min(60, sleep)
+                log.info("CF push retry in %s seconds", retry_seconds)
+                yield task.deferLater(reactor, retry_seconds, lambda: None)
+                sleep *= 1.5
+        metrics.cf_commits_total.labels(result="cancelled").inc()
+        log.error("CF push gave up after %d attempts: %s", count, ioc_info)
+        return False
+
+    def _assert_not_cancelled(self, context: str) -> None:
+        if self.cancelled:
+            raise defer.CancelledError(f"Processor cancelled: {context}")
+
+    def _begin_update(self, record_info_by_name: Dict[str, RecordInfo], ioc_info: IOCInfo) -> Set[str]:
+        """Validate the IOC before an update and return the set of new channel names."""
         log.info("CF Update IOC: %s", ioc_info)
         log.debug("CF Update IOC: %s record_info_by_name %s", ioc_info, record_info_by_name)
-        recceiverid = self.cf_config.recceiver_id
-        new_channels = set(record_info_by_name.keys())
-        iocid = ioc_info.id
 
-        if iocid not in self.iocs and record_info_by_name:
-            # Disconnect-before-upload is already logged in _commit_with_thread.
+        if ioc_info.id not in self.iocs and record_info_by_name:
+            # Disconnect-before-upload is already logged in _prepare_commit.
             log.warning(
                 "IOC %s committed update without prior initial transaction (%d IOCs known)",
                 ioc_info,
@@ -501,22 +683,30 @@ class CFProcessor(service.Service):
             raise IOCMissingInfoError(ioc_info)
 
         self._assert_not_cancelled(f"before fetching old channels for {ioc_info}")
+        return set(record_info_by_name.keys())
+
+    def _update_channelfinder(
+        self,
+        record_info_by_name: Dict[str, RecordInfo],
+        records_to_delete: List[str],
+        ioc_info: IOCInfo,
+    ) -> None:
+        recceiverid = self.cf_config.recceiver_id
+        new_channels = self._begin_update(record_info_by_name, ioc_info)
+        iocid = ioc_info.id
 
         channels: List[CFChannel] = []
         log.debug("Find existing channels by IOCID: %s", ioc_info)
-        old_channels: List[CFChannel] = self.client.find_by_ioc_id(iocid)
-
-        if old_channels:
-            self._handle_channels(
-                old_channels,
-                new_channels,
-                records_to_delete,
-                ioc_info,
-                recceiverid,
-                channels,
-                record_info_by_name,
-                iocid,
-            )
+        old_channel_count = self._handle_channels(
+            self.client.iter_by_ioc_id(iocid),
+            new_channels,
+            records_to_delete,
+            ioc_info,
+            recceiverid,
+            channels,
+            record_info_by_name,
+            iocid,
+        )
         # now pvNames contains a list of pv's new on this host/ioc
         existing_channels = self._get_existing_channels(new_channels)
 
@@ -529,9 +719,47 @@ class CFProcessor(service.Service):
 
         if len(channels) != 0:
             self._cf_set_chunked(channels)
-        else:
-            if old_channels and len(old_channels) != 0:
-                self._cf_set_chunked(channels)
+        elif old_channel_count != 0:
+            self._cf_set_chunked(channels)
+        self._assert_not_cancelled(f"after setting channels for {ioc_info}")
+
+    @defer.inlineCallbacks
+    def _update_channelfinder_async(
+        self,
+        record_info_by_name: Dict[str, RecordInfo],
+        records_to_delete: List[str],
+        ioc_info: IOCInfo,
+    ):
+        """_update_channelfinder() for an async client; the chunked set is issued concurrently."""
+        recceiverid = self.cf_config.recceiver_id
+        new_channels = self._begin_update(record_info_by_name, ioc_info)
+        iocid = ioc_info.id
+
+        channels: List[CFChannel] = []
+        log.debug("Find existing channels by IOCID: %s", ioc_info)
+        old_channels: List[CFChannel] = yield self.client.find_by_ioc_id(iocid)
+        self._handle_channels(
+            old_channels,
+            new_channels,
+            records_to_delete,
+            ioc_info,
+            recceiverid,
+            channels,
+            record_info_by_name,
+            iocid,
+        )
+        found = yield self.client.find_by_names(list(new_channels))
+        existing_channels = {ch.name: ch for ch in found}
+
+        self._assert_not_cancelled(f"after fetching existing channels for {ioc_info}")
+
+        self._process_new_channels(
+            new_channels, record_info_by_name, ioc_info, recceiverid, existing_channels, channels, iocid
+        )
+        log.info("Total channels to update: %s for ioc: %s", len(channels), ioc_info)
+
+        if channels or old_channels:
+            yield self._cf_set_chunked_async(channels)
         self._assert_not_cancelled(f"after setting channels for {ioc_info}")
 
     def _process_new_channels(
@@ -574,9 +802,20 @@ class CFProcessor(service.Service):
         for i in range(0, len(channels), chunk_size):
             self.client.set_channels(channels[i : i + chunk_size])
 
+    def _cf_set_chunked_async(self, channels: List[CFChannel]) -> defer.Deferred:
+        chunk_size = int(self.cf_config.cf_query_limit)
+        if not channels:
+            return self.client.set_channels(channels)
+        d = defer.gatherResults(
+            [self.client.set_channels(channels[i : i + chunk_size]) for i in range(0, len(channels), chunk_size)],
+            consumeErrors=True,
+        )
+        d.addErrback(lambda err: err.value.subFailure if err.check(defer.FirstError) else err)
+        return d
+
     def _handle_channels(
         self,
-        old_channels: List[CFChannel],
+        old_channels: Iterable[CFChannel],
         new_channels: Set[str],
         records_to_delete: List[str],
         ioc_info: IOCInfo,
@@ -584,14 +823,20 @@ class CFProcessor(service.Service):
         channels: List[CFChannel],
         record_info_by_name: Dict[str, RecordInfo],
         iocid: str,
-    ) -> None:
+    ) -> int:
         """Handle channels already present in Channelfinder for this IOC.
 
         For each old channel: if it is not in new_channels or is being deleted,
         re-assign it to its last known IOC or orphan it; if it is in both old
         and new, update its properties in place.
+
+        old_channels is consumed once, so it may be a stream from the adapter;
+        channels that need no update are dropped as soon as they are seen.
+        Returns the number of old channels seen.
         """
+        count = 0
         for cf_channel in old_channels:
+            count += 1
             if not new_channels or cf_channel.name in records_to_delete:
                 log.debug("Channel %s exists in Channelfinder not in new_channels", cf_channel)
                 if cf_channel.name in self.channel_ioc_ids:
@@ -601,8 +846,9 @@ class CFProcessor(service.Service):
             else:
                 if cf_channel.name in new_channels:
                     self._handle_channel_old_and_new(
-                        cf_channel, iocid, ioc_info, channels, new_channels, record_info_by_name, old_channels
+                        cf_channel, iocid, ioc_info, channels, new_channels, record_info_by_name
                     )
+        return count
 
     def _handle_channel_is_old(
         self,
@@ -679,7 +925,6 @@ class CFProcessor(service.Service):
         channels: List[CFChannel],
         new_channels: Set[str],
         record_info_by_name: Dict[str, RecordInfo],
-        old_channels: List[CFChannel],
     ) -> None:
         """Channel exists in CF with the same iocid — mark active and update time."""
         log.debug("Channel %s exists in Channelfinder with same iocid %s", cf_channel.name, iocid)
@@ -698,30 +943,18 @@ class CFProcessor(service.Service):
         if self.cf_config.alias_enabled:
             if cf_channel.name in record_info_by_name:
                 for alias_name in record_info_by_name[cf_channel.name].aliases:
-                    if alias_name in old_channels:
-                        alias_channel = CFChannel(alias_name, "", [])
-                        alias_channel.properties = _merge_property_lists(
-                            [
-                                CFProperty(CFPropertyName.PV_STATUS.value, ioc_info.owner, PVStatus.ACTIVE.value),
-                                CFProperty(CFPropertyName.TIME.value, ioc_info.owner, ioc_info.time),
-                            ],
-                            alias_channel,
-                            self.managed_properties,
-                        )
-                        channels.append(alias_channel)
-                        new_channels.remove(alias_name)
-                    else:
-                        aprops = _merge_property_lists(
-                            [
-                                CFProperty(CFPropertyName.PV_STATUS.value, ioc_info.owner, PVStatus.ACTIVE.value),
-                                CFProperty(CFPropertyName.TIME.value, ioc_info.owner, ioc_info.time),
-                                CFProperty(CFPropertyName.ALIAS.value, ioc_info.owner, cf_channel.name),
-                            ],
-                            cf_channel,
-                            self.managed_properties,
-                        )
-                        channels.append(CFChannel(alias_name, ioc_info.owner, aprops))
-                        new_channels.remove(alias_name)
+                    aprops = _merge_property_lists(
+                        [
+                            CFProperty(CFPropertyName.PV_STATUS.value, ioc_info.owner, PVStatus.ACTIVE.value),
+                            CFProperty(CFPropertyName.TIME.value, ioc_info.owner, ioc_info.time),
+                            CFProperty(CFPropertyName.ALIAS.value, ioc_info.owner, cf_channel.name),
+                        ],
+                        cf_channel,
+                        self.managed_properties,
+                    )
+                    channels.append(CFChannel(alias_name, ioc_info.owner, aprops))
+                    # Aliases are not in new_channels (it holds record names only).
+                    new_channels.discard(alias_name)
                     log.debug("Add existing alias with same IOC: %s", cf_channel)
 
     def _get_existing_channels(self, new_channels: Set[str]) -> Dict[str, CFChannel]:
@@ -0,0 +1,86 @@
+"""Incremental decoding of the JSON arrays returned by ChannelFinder queries."""
+
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, List
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JSONArrayDecoder:
+    """Push-style decoder for a top-level JSON array.
+
+    Bytes are fed in arbitrary chunks and each element is returned as soon as
+    it is complete, so only the undecoded tail of the response is buffered.
+    """
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._started = False
+        self._finished = False
+        self._need_separator = False
+
+    def feed(self, data: bytes) -> List[Any]:
+        """Consume a chunk and return the elements it completed."""
+        self._buf += self._text.decode(data)
+        return self._drain()
+
+    def close(self) -> List[Any]:
+        """Signal end of input; raises ValueError if the array is incomplete.
+
+        An empty body is accepted as an empty array.
+        """
+        self._buf += self._text.decode(b"", final=True)
+        items = self._drain()
+        if not self._started and not self._buf:
+            return items
+        if not self._finished:
+            raise ValueError(f"Truncated or invalid JSON array: {self._buf[:80]!r}")
+        return items
+
+    def _drain(self) -> List[Any]:
+        buf, pos, end = self._buf, 0, len(self._buf)
+        items = []
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos >= end:
+                break
+            char = buf[pos]
+            if self._finished:
+                raise ValueError(f"Unexpected data after JSON array: {buf[pos : pos + 80]!r}")
+            if not self._started:
+                if char != "[":
+                    raise ValueError(f"Expected JSON array, got: {buf[pos : pos + 80]!r}")
+                self._started = True
+                pos += 1
+            elif char == "]":
+                self._finished = True
+                pos += 1
+            elif self._need_separator:
+                if char != ",":
+                    raise ValueError(f"Expected ',' or ']' in JSON array, got: {buf[pos : pos + 80]!r}")
+                self._need_separator = False
+                pos += 1
+            else:
+                try:
+                    item, after = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break  # element continues in the next chunk
+                if after >= end:
+                    break  # a trailing scalar may still be cut short
+                items.append(item)
+                self._need_separator = True
+                pos = after
+        self._buf = buf[pos:]
+        return items
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Yield the elements of a JSON array read from an iterable of byte chunks."""
+    decoder = JSONArrayDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""SQL dialects of the databases DBProcessor can write to.
+
+DBProcessor writes its statements with qmark (?) placeholders and asks
+the dialect of the configured dbtype for anything that differs between
+databases: connection set up, upserts, bulk loads and generated ids.
+"""
+
+import io
+import logging
+
+log = logging.getLogger(__name__)
+
+__all__ = ["SQLiteDialect", "PostgresDialect", "get_dialect"]
+
+# (config key, PRAGMA, default) applied to every new sqlite3 connection.
+# page_size only takes effect on a new database, so it must come before journal_mode.
+_SQLITE_PRAGMAS = (
+    ("pageSize", "page_size", ""),
+    ("journalMode", "journal_mode", "WAL"),
+    ("synchronous", "synchronous", "NORMAL"),
+    ("cacheSize", "cache_size", "-65536"),
+    ("mmapSize", "mmap_size", "268435456"),
+)
+
+
+class Dialect:
+    """Statements and connection handling common to all databases."""
+
+    name = None
+    # schema file, relative to the server directory
+    schema = None
+    placeholder = "?"
+    # column types used by the schema migrations
+    types = {}
+
+    def __init__(self, conf):
+        pass
+
+    def connection_args(self, dbargs):
+        """Fill in the ConnectionPool arguments for this database."""
+
+    def open_connection(self, conn):
+        """Set up each new pooled connection."""
+
+    def sql(self, statement):
+        """Convert a statement written with ? placeholders."""
+        return statement.replace("?", self.placeholder)
+
+    def begin(self, cur):
+        """Make sure a transaction is open before the first SAVEPOINT."""
+
+    def index_names(self, cur, table):
+        """The names of the indexes on table."""
+        raise NotImplementedError
+
+    def optimize(self, cur):
+        """Refresh the query planner statistics, if cheap enough to do at start up."""
+
+    def insert(self, table, columns):
+        return "INSERT INTO %s (%s) VALUES (%s)" % (
+            table,
+            ",".join(columns),
+            ",".join([self.placeholder] * len(columns)),
+        )
+
+    def upsert(self, table, columns, keys):
+        """INSERT statement replacing the row with the same keys."""
+        raise NotImplementedError
+
+    def insert_id(self, cur, table, columns, values):
+        """Insert one row and return its generated id."""
+        cur.execute(self.insert(table, columns), values)
+        return cur.lastrowid
+
+    def bulk_insert(self, cur, table, columns, rows):
+        """Insert many rows."""
+        cur.executemany(self.insert(table, columns), rows)
+
+
+class SQLiteDialect(Dialect):
+    name = "sqlite3"
+    schema = "recceiver.sqlite3"
+    types = {"serial": "INTEGER PRIMARY KEY", "bigserial": "INTEGER PRIMARY KEY", "bigint": "INTEGER"}
+
+    def __init__(self, conf):
+        self.pragmas = [
+            "PRAGMA %s = %s" % (pragma, value)
+            for key, pragma, default in _SQLITE_PRAGMAS
+            for value in [conf.get(key, default).strip()]
+            if value
+        ]
+        self.pragmas.append("PRAGMA foreign_keys = ON")
+        self.statement_cache = conf.getint("statementCache", 256)
+
+    def connection_args(self, dbargs):
+        dbargs.setdefault("isolation_level", "IMMEDIATE")
+        # statements are re-prepared once they fall out of this per-connection cache
+        dbargs["cached_statements"] = int(dbargs.get("cached_statements", self.statement_cache))
+        dbargs["cp_openfun"] = self.open_connection
+        # workaround twisted bug #3629
+        dbargs["check_same_thread"] = False
+
+    def open_connection(self, conn):
+        """Apply the PRAGMA profile once to each new pooled sqlite3 connection."""
+        cur = conn.cursor()
+        for pragma in self.pragmas:
+            cur.execute(pragma)
+        cur.close()
+
+    def begin(self, cur):
+        if not getattr(cur.connection, "in_transaction", True):
+            # sqlite3 only begins implicitly before DML; a SAVEPOINT outside
+            # a transaction would commit on RELEASE.
+            cur.execute("BEGIN IMMEDIATE")
+
+    def index_names(self, cur, table):
+        cur.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name=?", (table,))
+        return {row[0] for row in cur.fetchall()}
+
+    def optimize(self, cur):
+        # only analyzes tables whose statistics are out of date
+        cur.execute("PRAGMA optimize")
+
+    def upsert(self, table, columns, keys):
+        return "INSERT OR REPLACE" + self.insert(table, columns)[len("INSERT") :]
+
+
+class PostgresDialect(Dialect):
+    """PostgreSQL through psycopg2 or psycopg (3)."""
+
+    name = "postgres"
+    schema = "recceiver.pgsql"
+    placeholder = "%s"
+    types = {"serial": "SERIAL PRIMARY KEY", "bigserial": "BIGSERIAL PRIMARY KEY", "bigint": "BIGINT"}
+
+    def __init__(self, conf):
+        # batches with fewer rows are not worth a COPY
+        self.copy_min = conf.getint("copyMin", 64)
+
+    def connection_args(self, dbargs):
+        # reconnect after the server restarts instead of failing every later commit
+        dbargs.setdefault("cp_reconnect", True)
+
+    def upsert(self, table, columns, keys):
+        return "%s ON CONFLICT (%s) DO UPDATE SET %s" % (
+            self.insert(table, columns),
+            ",".join(keys),
+            ",".join("%s = EXCLUDED.%s" % (col, col) for col in columns if col not in keys),
+        )
+
+    def index_names(self, cur, table):
+        cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (table,))
+        return {row[0] for row in cur.fetchall()}
+
+    def insert_id(self, cur, table, columns, values):
+        cur.execute(self.insert(table, columns) + " RETURNING id", values)
+        return cur.fetchone()[0]
+
+    def bulk_insert(self, cur, table, columns, rows):
+        """Insert many rows, with COPY when there are enough of them."""
+        rows = list(rows)
+        copy = "COPY %s (%s) FROM STDIN" % (table, ",".join(columns))
+        if len(rows) < self.copy_min:
+            Dialect.bulk_insert(self, cur, table, columns, rows)
+        elif hasattr(cur, "copy_expert"):
+            # psycopg2
+            cur.copy_expert(copy, io.StringIO("".join(copy_text(rows))))
+        elif hasattr(cur, "copy"):
+            # psycopg 3
+            with cur.copy(copy) as writer:
+                for row in rows:
+                    writer.write_row(row)
+        else:
+            Dialect.bulk_insert(self, cur, table, columns, rows)
+
+
+def copy_text(rows):
+    """Lines of the COPY text format for rows."""
+    for row in rows:
+        yield "\t".join(r"\N" if value is None else _copy_escape(str(value)) for value in row) + "\n"
+
+
+def _copy_escape(value):
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+# dbtype, the DB-API module given to ConnectionPool, to dialect
+_DIALECTS = {
+    "sqlite3": SQLiteDialect,
+    "psycopg2": PostgresDialect,
+    "psycopg": PostgresDialect,
+}
+
+
+def get_dialect(dbtype, conf):
+    try:
+        cls = _DIALECTS[dbtype]
+    except KeyError:
+        raise ValueError("Unsupported dbtype '%s', expected one of: %s" % (dbtype, ", ".join(sorted(_DIALECTS))))
+    return cls(conf)
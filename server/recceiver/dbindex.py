@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""In-memory index of the records stored by DBProcessor, and a JSON read API over it.
+
+The index is updated on the reactor from committed transactions, so
+lookups never touch the database.
+
+    GET /pvs?name=PATTERN&ioc=IOCNAME&info=KEY[=VALUE]&limit=N
+    GET /iocs?name=PATTERN&limit=N
+
+PATTERN is a glob (* and ?); a literal prefix before the first wildcard
+narrows the search to a range of the sorted names.
+"""
+
+import bisect
+import heapq
+import json
+import logging
+from fnmatch import fnmatchcase
+
+from twisted.web.resource import Resource
+
+from .webutil import error, query_args
+
+log = logging.getLogger(__name__)
+
+__all__ = ["PVIndex", "PVIndexResource"]
+
+_WILDCARDS = "*?["
+
+
+class _Server:
+    __slots__ = ("hostname", "port", "infos", "records")
+
+    def __init__(self, hostname, port):
+        self.hostname, self.port = hostname, port
+        self.infos = {}
+        # recid -> _Record
+        self.records = {}
+
+
+class _Record:
+    __slots__ = ("name", "rtype", "aliases", "infos")
+
+    def __init__(self, name, rtype, aliases, infos):
+        self.name, self.rtype = name, rtype
+        self.aliases, self.infos = list(aliases), dict(infos)
+
+
+class PVIndex:
+    """Record names, aliases and info tags of the servers (IOCs) of one DBProcessor."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # srvid -> _Server
+        self.servers = {}
+        # PV name or alias -> {(srvid, recid)}
+        self.names = {}
+        # info tag -> {(srvid, recid)}
+        self.infos = {}
+        # unique names in order, with the changes since it was last merged
+        self._sorted = []
+        self._added = set()
+        self._removed = set()
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self, servers):
+        """Replace the index contents.
+
+        servers is an iterable of (srvid, hostname, port, infos, records),
+        records a dict of recid -> (name, rtype, aliases, infos).
+        """
+        self.clear()
+        for srvid, hostname, port, infos, records in servers:
+            server = self.servers[srvid] = _Server(hostname, port)
+            server.infos.update(infos)
+            for recid, record in records.items():
+                self._add(srvid, server, recid, _Record(*record))
+
+    def apply(self, srvid, transaction):
+        """Update the index from a committed transaction of server srvid."""
+        if not transaction.connected:
+            self.remove_server(srvid)
+            return
+        if transaction.initial:
+            self.remove_server(srvid)
+            address = transaction.source_address
+            self.servers[srvid] = _Server(address.host, address.port)
+        server = self.servers.get(srvid)
+        if server is None:
+            return
+        server.infos.update(transaction.client_infos)
+        for recid in transaction.records_to_delete:
+            self._remove(srvid, server, recid)
+        for recid, (name, rtype) in transaction.records_to_add.items():
+            self._remove(srvid, server, recid)
+            record = _Record(
+                name,
+                rtype,
+                transaction.aliases.get(recid, ()),
+                transaction.record_infos_to_add.get(recid, {}),
+            )
+            self._add(srvid, server, recid, record)
+        for recid, infos in transaction.record_infos_to_add.items():
+            record = server.records.get(recid)
+            if recid in transaction.records_to_add or record is None:
+                continue
+            for key in infos:
+                self.infos.setdefault(key, set()).add((srvid, recid))
+            record.infos.update(infos)
+
+    def _add(self, srvid, server, recid, record):
+        server.records[recid] = record
+        for name in [record.name] + record.aliases:
+            refs = self.names.get(name)
+            if refs is None:
+                refs = self.names[name] = set()
+                if name in self._removed:
+                    # still in _sorted
+                    self._removed.discard(name)
+                else:
+                    self._added.add(name)
+            refs.add((srvid, recid))
+        for key in record.infos:
+            self.infos.setdefault(key, set()).add((srvid, recid))
+
+    def _remove(self, srvid, server, recid):
+        record = server.records.pop(recid, None)
+        if record is None:
+            return
+        for name in [record.name] + record.aliases:
+            refs = self.names.get(name)
+            if refs is None:
+                continue
+            refs.discard((srvid, recid))
+            if not refs:
+                del self.names[name]
+                if name in self._added:
+                    self._added.discard(name)
+                else:
+                    self._removed.add(name)
+        for key in record.infos:
+            refs = self.infos.get(key)
+            if refs is not None:
+                refs.discard((srvid, recid))
+                if not refs:
+                    del self.infos[key]
+
+    def remove_server(self, srvid):
+        """Drop server srvid and its records."""
+        server = self.servers.pop(srvid, None)
+        if server is not None:
+            for recid in list(server.records):
+                self._remove(srvid, server, recid)
+
+    def sorted_names(self):
+        """All names in order; merges the changes since the last call in linear time."""
+        if self._added or self._removed:
+            removed = self._removed
+            kept = (name for name in self._sorted if name not in removed) if removed else self._sorted
+            self._sorted = list(heapq.merge(kept, sorted(self._added)))
+            self._added, self._removed = set(), set()
+        return self._sorted
+
+    def match_names(self, pattern):
+        """Names matching a glob pattern, in order."""
+        cut = min((i for i in (pattern.find(c) for c in _WILDCARDS) if i >= 0), default=len(pattern))
+        prefix = pattern[:cut]
+        if cut == len(pattern):
+            if pattern in self.names:
+                yield pattern
+            return
+        names = self.sorted_names()
+        for i in range(bisect.bisect_left(names, prefix), len(names)):
+            name = names[i]
+            if not name.startswith(prefix):
+                break
+            if fnmatchcase(name, pattern):
+                yield name
+
+    def find(self, name="*", ioc=None, info=None, limit=1000):
+        """Records matching all of the given filters, as dicts ordered by name."""
+        key, _, value = (info or "").partition("=")
+        results = []
+        for pvname, srvid, recid in self._candidates(name, ioc, key):
+            server = self.servers[srvid]
+            record = server.records[recid]
+            if ioc is not None and server.infos.get("IOCNAME") != ioc:
+                continue
+            if key and (key not in record.infos or (value and record.infos[key] != value)):
+                continue
+            results.append(self._describe(pvname, srvid, server, record))
+            if len(results) >= limit:
+                break
+        return results
+
+    def _candidates(self, pattern, ioc, key):
+        """(name, srvid, recid) in order, from the smallest of the name, IOC and info tag indexes."""
+        refs = None
+        if key:
+            refs = self.infos.get(key, set())
+        if ioc is not None:
+            servers = [srvid for srvid, server in self.servers.items() if server.infos.get("IOCNAME") == ioc]
+            if refs is None or sum(len(self.servers[srvid].records) for srvid in servers) < len(refs):
+                refs = [(srvid, recid) for srvid in servers for recid in self.servers[srvid].records]
+        if refs is None or not any(c in pattern for c in _WILDCARDS) or len(refs) > len(self.names):
+            for pvname in self.match_names(pattern):
+                for srvid, recid in sorted(self.names[pvname]):
+                    yield pvname, srvid, recid
+            return
+        found = []
+        for srvid, recid in refs:
+            record = self.servers[srvid].records[recid]
+            for pvname in [record.name] + record.aliases:
+                if fnmatchcase(pvname, pattern):
+                    found.append((pvname, srvid, recid))
+        yield from sorted(found)
+
+    def find_iocs(self, name="*", limit=1000):
+        """Servers whose IOCNAME matches a glob pattern."""
+        results = []
+        for srvid, server in sorted(self.servers.items()):
+            ioc_name = server.infos.get("IOCNAME", "")
+            if not fnmatchcase(ioc_name, name):
+                continue
+            results.append(
+                {
+                    "id": srvid,
+                    "iocName": ioc_name,
+                    "hostname": server.hostname,
+                    "port": server.port,
+                    "records": len(server.records),
+                    "infos": server.infos,
+                }
+            )
+            if len(results) >= limit:
+                break
+        return results
+
+    def _describe(self, name, srvid, server, record):
+        result = {
+            "name": name,
+            "recordType": record.rtype,
+            "iocName": server.infos.get("IOCNAME"),
+            "hostname": server.hostname,
+            "port": server.port,
+            "server": srvid,
+            "infos": record.infos,
+        }
+        if name != record.name:
+            result["aliasOf"] = record.name
+        return result
+
+
+class PVIndexResource(Resource):
+    """Serves PVIndex lookups as JSON."""
+
+    isLeaf = True
+
+    def __init__(self, index, max_limit=10000):
+        Resource.__init__(self)
+        self.index, self.max_limit = index, max_limit
+
+    def render_GET(self, request):
+        try:
+            args = query_args(request)
+        except ValueError:
+            return error(request, 400, "query arguments must be UTF-8")
+        try:
+            limit = min(int(args.get("limit", "1000")), self.max_limit)
+        except ValueError:
+            return error(request, 400, "limit must be an integer")
+        if limit < 1:
+            return error(request, 400, "limit must be positive")
+        path = request.path.rstrip(b"/").rsplit(b"/", 1)[-1]
+        if path == b"pvs":
+            body = self.index.find(args.get("name", "*"), args.get("ioc"), args.get("info"), limit)
+        elif path == b"iocs":
+            body = self.index.find_iocs(args.get("name", "*"), limit)
+        else:
+            return error(request, 404, "unknown path")
+        request.setHeader(b"Content-Type", b"application/json")
+        return json.dumps(body).encode()
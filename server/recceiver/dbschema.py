@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Versioned schema of the DBProcessor database.
+
+Each migration is a list of statements run in one transaction together
+with the bump of the version stored in the recceiver_schema table.
+Statements are templates formatted with the configured table names and
+the column types of the dialect, eg. {record} and {serial}.
+
+A database created from recceiver.sqlite3 or recceiver.pgsql before
+versioning existed has no recceiver_schema table; migration 1 uses
+IF NOT EXISTS so it applies to such a database as a no-op.
+"""
+
+import logging
+
+log = logging.getLogger(__name__)
+
+__all__ = ["SCHEMA_VERSION", "migrate", "missing_indexes", "table_sizes"]
+
+VERSION_TABLE = "recceiver_schema"
+
+MIGRATIONS = (
+    (
+        1,
+        "Initial schema",
+        (
+            # owner is the idkey of the recceiver managing the IOC; a negative owner
+            # marks a disconnected IOC whose rows are being purged.
+            """CREATE TABLE IF NOT EXISTS {server} (
+                id {serial},
+                owner INTEGER,
+                hostname TEXT NOT NULL,
+                port INTEGER NOT NULL
+            )""",
+            "CREATE INDEX IF NOT EXISTS {server}_ep ON {server}(hostname,port)",
+            """CREATE TABLE IF NOT EXISTS {servinfo} (
+                id {serial},
+                host INTEGER NOT NULL REFERENCES {server}(id) ON DELETE CASCADE,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                UNIQUE(host, key)
+            )""",
+            "CREATE INDEX IF NOT EXISTS {servinfo}_key ON {servinfo}(key)",
+            "CREATE INDEX IF NOT EXISTS {servinfo}_host ON {servinfo}(host)",
+            """CREATE TABLE IF NOT EXISTS {record} (
+                pkey {bigserial},
+                id INTEGER NOT NULL,
+                rtype TEXT,
+                host INTEGER NOT NULL REFERENCES {server}(id) ON DELETE CASCADE,
+                UNIQUE(id, host)
+            )""",
+            "CREATE INDEX IF NOT EXISTS {record}_host ON {record}(host)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS {record}_id_host ON {record}(id, host)",
+            """CREATE TABLE IF NOT EXISTS {record_name} (
+                id {bigserial},
+                rec {bigint} NOT NULL REFERENCES {record}(pkey) ON DELETE CASCADE,
+                rname TEXT NOT NULL,
+                prim INTEGER NOT NULL,
+                UNIQUE(rec, rname)
+            )""",
+            "CREATE INDEX IF NOT EXISTS {record_name}_rname ON {record_name}(rname)",
+            """CREATE TABLE IF NOT EXISTS {recinfo} (
+                id {bigserial},
+                rec {bigint} NOT NULL REFERENCES {record}(pkey) ON DELETE CASCADE,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                UNIQUE(rec, key)
+            )""",
+            "CREATE INDEX IF NOT EXISTS {recinfo}_key ON {recinfo}(key)",
+            "CREATE INDEX IF NOT EXISTS {recinfo}_rec ON {recinfo}(rec)",
+        ),
+    ),
+    (
+        2,
+        "Indexes matched to the write paths",
+        (
+            # Every lookup and delete by the processor is by host, or host and id;
+            # (id, host) of the UNIQUE constraint cannot serve them.
+            "CREATE INDEX IF NOT EXISTS {record}_host_id ON {record}(host, id)",
+            # claimed and purged servers are found by owner
+            "CREATE INDEX IF NOT EXISTS {server}_owner ON {server}(owner)",
+            # Covered by the UNIQUE constraints, but maintained on every write.
+            "DROP INDEX IF EXISTS {record}_host",
+            "DROP INDEX IF EXISTS {record}_id_host",
+            "DROP INDEX IF EXISTS {servinfo}_host",
+            "DROP INDEX IF EXISTS {recinfo}_rec",
+        ),
+    ),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# table -> indexes the processor relies on at SCHEMA_VERSION
+REQUIRED_INDEXES = {
+    "server": ("{server}_owner",),
+    "record": ("{record}_host_id",),
+}
+
+
+def current_version(cur):
+    """The schema version of the database, 0 when not versioned."""
+    cur.execute("CREATE TABLE IF NOT EXISTS %s (version INTEGER NOT NULL)" % VERSION_TABLE)
+    cur.execute("SELECT MAX(version) FROM %s" % VERSION_TABLE)
+    return cur.fetchone()[0] or 0
+
+
+def migrate(cur, dialect, tables, target=SCHEMA_VERSION):
+    """Apply the migrations past the current version, up to target; returns the resulting version."""
+    dialect.begin(cur)
+    version = current_version(cur)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError("Database schema version %d is newer than supported version %d" % (version, SCHEMA_VERSION))
+    names = dict(tables, **dialect.types)
+    for number, description, statements in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        log.info("Migrate database schema to version %d: %s", number, description)
+        for statement in statements:
+            cur.execute(statement.format(**names))
+        cur.execute(dialect.sql("INSERT INTO %s (version) VALUES (?)" % VERSION_TABLE), (number,))
+        version = number
+    return version
+
+
+def missing_indexes(cur, dialect, tables):
+    """The required indexes not found in the database."""
+    missing = []
+    for table, indexes in REQUIRED_INDEXES.items():
+        present = dialect.index_names(cur, tables[table])
+        missing.extend(name for name in (index.format(**tables) for index in indexes) if name not in present)
+    return missing
+
+
+def table_sizes(cur, tables):
+    """Row count of each table, by its key in tables."""
+    sizes = {}
+    for table, name in tables.items():
+        cur.execute("SELECT COUNT(*) FROM %s" % name)
+        sizes[table] = cur.fetchone()[0]
+    return sizes
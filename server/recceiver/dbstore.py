@@ -6,9 +6,12 @@ import logging
 from twisted.application import service
 from twisted.enterprise import adbapi as db
 from twisted.internet import defer
+from twisted.python.failure import Failure
 from zope.interface import implementer
 
-from . import interfaces
+from . import dbschema, interfaces
+from .dbdialect import get_dialect
+from .dbindex import PVIndex, PVIndexResource
 
 log = logging.getLogger(__name__)
 
@@ -26,12 +29,63 @@ class DBProcessor(service.Service):
         self.trecord = self.conf.get("table.record", "record")
         self.tname = self.conf.get("table.record_name", "record_name")
         self.trecinfo = self.conf.get("table.recinfo", "recinfo")
+        self.tables = {
+            "server": self.tserver,
+            "servinfo": self.tinfo,
+            "record": self.trecord,
+            "record_name": self.tname,
+            "recinfo": self.trecinfo,
+        }
         self.mykey = int(self.conf["idkey"])
+        self.dbtype = self.conf.get("dbtype", "sqlite3")
+        # everything that differs between databases, statements are written with ? placeholders
+        self.dialect = get_dialect(self.dbtype, self.conf)
+        self.sql = self.dialect.sql
+        # group commit: transactions arriving within batchWindow seconds share one SQL transaction
+        self.batch_window = float(self.conf.get("batchWindow", "0.05"))
+        self.batch_max = self.conf.getint("batchMax", 100)
+        self._pending = []
+        self._flush_call = None
+        self._flushing = None
+        # Deferreds fired once nothing is pending or being written
+        self._idle_waiters = []
+        # rows of a disconnected IOC are kept this long for a reconnect to reuse
+        self.reconnect_grace = float(self.conf.get("reconnectGrace", "30"))
+        # The rows of this daemon are kept across a restart, and adopted by the IOCs
+        # reconnecting within restartGrace seconds of the start, unless cleaned.
+        self.restart_grace = float(self.conf.get("restartGrace", "300"))
+        self.clean_on_start = self.conf.getboolean("cleanOnStart", False)
+        self.clean_on_stop = self.conf.getboolean("cleanOnStop", False)
+        # Writer thread state, see _commit():
+        #  fingerprints: srvid -> {recid: (pkey, record_digest())}, loaded lazily
+        #  identities: srvid -> server_identity() of the IOC using it
+        #  retired: server_identity() -> srvid of a disconnected IOC within its grace period
+        #  stale: srvid -> recids not yet re-sent since the IOC reconnected
+        #  stale_commits: srvid -> commits since the IOC reconnected, the last one arms the purge of stale
+        self.fingerprints = {}
+        self.identities = {}
+        self.retired = {}
+        self.stale = {}
+        self.stale_commits = {}
+        # while a batched op runs: how to undo its changes to the state above,
+        # and the reactor calls it makes once it is committed
+        self._undo = None
+        self._calls = None
+        self._timers = set()
+        # records deleted per purge step of a disconnected server
+        self.purge_batch = self.conf.getint("purgeBatch", 5000)
+        # transactions with more records are written in chunks, other writes go in between
+        self.chunk_size = self.conf.getint("chunkSize", 10000)
+        self._purging = False
+        # optional read API, answered from an in-memory index of the committed records
+        self.read_port = self.conf.getint("readPort", 0)
+        self.index = PVIndex() if self.read_port > 0 else None
+        self._read_listener = None
 
     def dec_count(self, _result, deferred):
         assert len(self.Ds) > 0
         self.Ds.remove(deferred)
-        if self.done:
+        if self.done and not self.Ds:
             self.pool.close()
 
     def wait_for(self, deferred):
@@ -54,119 +108,639 @@ class DBProcessor(service.Service):
                 continue
             dbargs[key] = val
 
-        if self.conf["dbtype"] == "sqlite3" and "isolation_level" not in dbargs:
-            dbargs["isolation_level"] = "IMMEDIATE"
+        # a single writer thread, so commits never contend for the database lock
+        dbargs["cp_min"] = dbargs["cp_max"] = 1
+        self.dialect.connection_args(dbargs)
 
-        # workaround twisted bug #3629
-        dbargs["check_same_thread"] = False
+        self.pool = db.ConnectionPool(self.dbtype, self.conf["dbname"], **dbargs)
 
-        self.pool = db.ConnectionPool(self.conf["dbtype"], self.conf["dbname"], **dbargs)
+        d = self.wait_for(self.pool.runInteraction(self.setupDB))
+        d.addCallback(lambda _: self._start_purge())
 
-        self.wait_for(self.pool.runInteraction(self.cleanupDB))
+        if self.index is not None:
+            from twisted.internet import reactor
+            from twisted.web.server import Site
+
+            self._read_listener = reactor.listenTCP(
+                self.read_port,
+                Site(PVIndexResource(self.index)),
+                interface=self.conf.get("readBind", ""),
+            )
+            log.info("DB read API available on %s", self._read_listener.getHost())
 
     def stopService(self):
         log.info("Stop DBService")
 
         service.Service.stopService(self)
 
-        self.wait_for(self.pool.runInteraction(self.cleanupDB))
+        # the next start adopts or cleans up whatever the grace-period purges would have removed
+        for call in self._timers:
+            call.cancel()
+        self._timers.clear()
+        if self._read_listener is not None:
+            self.wait_for(defer.maybeDeferred(self._read_listener.stopListening))
+            self._read_listener = None
+        # the pool is closed once the queued writes, and the batches they lead to, are done
+        d = self._idle()
+        if self.clean_on_stop:
+            d.addCallback(lambda _: self.pool.runInteraction(self.cleanupDB))
+        self.wait_for(d)
 
-        assert len(self.Ds) > 0
         self.done = True
+        if not self.Ds:
+            self.pool.close()
         return defer.DeferredList(list(self.Ds), consumeErrors=True)
 
+    def setupDB(self, cur):
+        """Bring the schema up to date, check and report on it, then take over the rows of a previous run."""
+        version = dbschema.migrate(cur, self.dialect, self.tables)
+        log.info("Database schema version %d", version)
+        missing = dbschema.missing_indexes(cur, self.dialect, self.tables)
+        if missing:
+            log.warning("Database is missing indexes, ingest will slow down as it grows: %s", ", ".join(missing))
+        sizes = dbschema.table_sizes(cur, self.tables)
+        log.info("Database rows: %s", ", ".join("%s=%d" % item for item in sizes.items()))
+        self.dialect.optimize(cur)
+        if self.clean_on_start or self.restart_grace <= 0:
+            self.cleanupDB(cur)
+        else:
+            self.adoptServers(cur)
+        if self.index is not None:
+            self._call_in_reactor(self.index.load, self._indexed_servers(cur))
+
     def cleanupDB(self, cur):
         log.info("Cleanup DBService")
 
         assert self.mykey != 0
-        cur.execute("PRAGMA foreign_keys = ON;")
-        cur.execute("DELETE FROM %s WHERE owner=?" % self.tserver, self.mykey)
+        # The servers left behind by this daemon are purged in the background after start up.
+        cur.execute(self.sql("UPDATE %s SET owner=? WHERE owner=?" % self.tserver), (-self.mykey, self.mykey))
+        self.fingerprints.clear()
+        self.identities.clear()
+        self.retired.clear()
+        self.stale.clear()
+        self.stale_commits.clear()
+
+    def adoptServers(self, cur):
+        """Retire the servers left by a previous run of this daemon, as if their IOCs had just disconnected.
+
+        An IOC reconnecting within restart_grace reuses its server row, and
+        only the records that changed are rewritten; the others are purged.
+        """
+        self.fingerprints.clear()
+        self.identities.clear()
+        self.retired.clear()
+        self.stale.clear()
+        self.stale_commits.clear()
+        cur.execute(
+            self.sql(
+                "SELECT s.id, s.hostname, i.value FROM %s s LEFT JOIN %s i ON i.host = s.id AND i.key = ? "
+                "WHERE s.owner = ? ORDER BY s.id" % (self.tserver, self.tinfo)
+            ),
+            ("IOCNAME", self.mykey),
+        )
+        for srvid, hostname, ioc_name in cur.fetchall():
+            identity = (hostname, ioc_name)
+            # without an IOCNAME the identity is the endpoint, which a reconnecting IOC does not keep
+            if not ioc_name or identity in self.retired:
+                self._delete_server(cur, srvid)
+                continue
+            self.retired[identity] = srvid
+            self._call_in_reactor(self._schedule, self._purge_retired, identity, srvid, delay=self.restart_grace)
+        log.info("Adopted %d servers of a previous run", len(self.retired))
+
+    def _indexed_servers(self, cur):
+        """The servers of this daemon and their records, in the form taken by PVIndex.load()."""
+        servers = {}
+        cur.execute(self.sql("SELECT id, hostname, port FROM %s WHERE owner=?" % self.tserver), (self.mykey,))
+        for srvid, hostname, port in cur.fetchall():
+            servers[srvid] = (srvid, hostname, port, {}, {})
+        cur.execute(
+            self.sql(
+                "SELECT i.host, i.key, i.value FROM %s i JOIN %s s ON i.host = s.id WHERE s.owner=?"
+                % (self.tinfo, self.tserver)
+            ),
+            (self.mykey,),
+        )
+        for srvid, key, value in cur.fetchall():
+            servers[srvid][3][key] = value
+        # pkey -> [recid, rtype, name, aliases, infos] of the record's server
+        records = {}
+        cur.execute(
+            self.sql(
+                "SELECT r.pkey, r.host, r.id, r.rtype FROM %s r JOIN %s s ON r.host = s.id WHERE s.owner=?"
+                % (self.trecord, self.tserver)
+            ),
+            (self.mykey,),
+        )
+        for pkey, srvid, recid, rtype in cur.fetchall():
+            records[pkey] = (srvid, [recid, rtype, None, [], {}])
+        cur.execute(
+            self.sql(
+                "SELECT n.rec, n.rname, n.prim FROM %s n JOIN %s r ON n.rec = r.pkey JOIN %s s ON r.host = s.id "
+                "WHERE s.owner=?" % (self.tname, self.trecord, self.tserver)
+            ),
+            (self.mykey,),
+        )
+        for pkey, rname, prim in cur.fetchall():
+            if prim:
+                records[pkey][1][2] = rname
+            else:
+                records[pkey][1][3].append(rname)
+        cur.execute(
+            self.sql(
+                "SELECT i.rec, i.key, i.value FROM %s i JOIN %s r ON i.rec = r.pkey JOIN %s s ON r.host = s.id "
+                "WHERE s.owner=?" % (self.trecinfo, self.trecord, self.tserver)
+            ),
+            (self.mykey,),
+        )
+        for pkey, key, value in cur.fetchall():
+            records[pkey][1][4][key] = value
+        for srvid, (recid, rtype, rname, aliases, infos) in records.values():
+            servers[srvid][4][recid] = (rname, rtype, aliases, infos)
+        return list(servers.values())
 
     def commit(self, transaction):
-        return self.pool.runInteraction(self._commit, transaction)
+        if self.chunk_size > 0 and len(transaction.records_to_add) > self.chunk_size:
+            d = self._commit_chunked(transaction)
+        else:
+            d = self._enqueue(self._commit, transaction)
+        return d.addCallback(self._committed, transaction)
+
+    def _committed(self, srvid, transaction):
+        if self.index is not None:
+            self.index.apply(srvid, transaction)
+
+    def _enqueue(self, op, *args):
+        """Queue op(cur, *args) for the writer; returns a Deferred for its result."""
+        d = defer.Deferred()
+        self._pending.append(((op, args), d))
+        if len(self._pending) >= self.batch_max:
+            self._flush()
+        elif self._flush_call is None and self._flushing is None:
+            from twisted.internet import reactor
+
+            self._flush_call = reactor.callLater(self.batch_window, self._flush)
+        return d
+
+    def _flush(self):
+        """Write the pending transactions in one interaction, unless one is already running.
+
+        Transactions arriving while a batch is being written are picked up
+        by the next batch as soon as it completes.
+        """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if self._flushing is not None or not self._pending:
+            return
+        batch, self._pending = self._pending[: self.batch_max], self._pending[self.batch_max :]
+
+        calls, undo = [], []
+
+        def resolve(results):
+            for fn, args, kwargs in calls:
+                fn(*args, **kwargs)
+            for (_, d), result in zip(batch, results):
+                if isinstance(result, Failure):
+                    d.errback(result)
+                else:
+                    d.callback(result)
+
+        def fail_all(err):
+            # the writer is idle until next_batch(), so its state can be restored here:
+            # the SQL transaction is rolled back, with the ops that had succeeded in it
+            for step in reversed(undo):
+                step()
+            self.fingerprints.clear()
+            for _, d in batch:
+                d.errback(err)
+
+        def next_batch(_ignored):
+            self._flushing = None
+            self._flush()
+            if self._flushing is None:
+                waiters, self._idle_waiters = self._idle_waiters, []
+                for d in waiters:
+                    d.callback(None)
+
+        self._flushing = self.pool.runInteraction(self._commit_batch, [op for op, _ in batch], calls, undo)
+        self._flushing.addCallbacks(resolve, fail_all)
+        self._flushing.addBoth(next_batch)
+
+    def _idle(self):
+        """Write the pending transactions now; returns a Deferred fired once none is left."""
+        self._flush()
+        if self._flushing is None:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._idle_waiters.append(d)
+        return d
+
+    def _commit_batch(self, cur, ops, calls=None, undo=None):
+        """Run several queued (op, args) as one SQL transaction.
+
+        Each op runs inside its own SAVEPOINT, so a failing one is rolled
+        back alone, along with its changes to the writer state. The reactor
+        calls of the ops that succeed are appended to calls, for the caller
+        to make once the SQL transaction is committed, or are made at the end
+        without it. The steps undoing the writer state changes of the ops
+        that succeed are appended to undo, for the caller to replay in
+        reverse should the SQL transaction fail as a whole. Returns a list
+        holding the result or a Failure per op.
+        """
+        self.dialect.begin(cur)
+        results = []
+        committed = [] if calls is None else calls
+        try:
+            for op, args in ops:
+                self._undo, self._calls = [], []
+                cur.execute("SAVEPOINT recceiver_commit")
+                try:
+                    result = op(cur, *args)
+                except Exception:
+                    results.append(Failure())
+                    for step in reversed(self._undo):
+                        step()
+                    # fingerprints are reloaded from the database when next needed
+                    self.fingerprints.clear()
+                    cur.execute("ROLLBACK TO SAVEPOINT recceiver_commit")
+                else:
+                    results.append(result)
+                    committed.extend(self._calls)
+                    if undo is not None:
+                        undo.extend(self._undo)
+                cur.execute("RELEASE SAVEPOINT recceiver_commit")
+        finally:
+            self._undo = self._calls = None
+        if calls is None:
+            for fn, args, kwargs in committed:
+                self._call_in_reactor(fn, *args, **kwargs)
+        return results
+
+    def _save(self, mapping, key):
+        """Remember mapping[key], to restore it if the running op is rolled back."""
+        if self._undo is None:
+            return
+        if key in mapping:
+            value = mapping[key]
+            self._undo.append(lambda: mapping.__setitem__(key, value))
+        else:
+            self._undo.append(lambda: mapping.pop(key, None))
 
-    def _commit(self, cur, transaction):
-        cur.execute("PRAGMA foreign_keys = ON;")
+    def _after_commit(self, fn, *args, **kwargs):
+        """Call fn on the reactor once the running op is committed."""
+        if self._calls is None:
+            self._call_in_reactor(fn, *args, **kwargs)
+        else:
+            self._calls.append((fn, args, kwargs))
 
+    def _commit(self, cur, transaction):
+        """Write one transaction; returns the id of its server row."""
+        srvid = self._commit_head(cur, transaction)
+        if transaction.connected:
+            self._commit_records(cur, transaction, srvid, transaction.records_to_add)
+            self._commit_tail(cur, transaction, srvid)
+        return srvid
+
+    def _commit_chunked(self, transaction):
+        """Write a large transaction as a sequence of writer ops of at most chunk_size records.
+
+        Each op is queued once the previous one is done, so the transactions
+        of other IOCs are written in between. Returns a Deferred for the server id.
+        """
+        recids = iter(transaction.records_to_add)
+
+        def next_chunk(srvid):
+            chunk = list(itertools.islice(recids, self.chunk_size))
+            if not chunk:
+                return self._enqueue(self._commit_tail, transaction, srvid).addCallback(lambda _: srvid)
+            d = self._enqueue(self._commit_records, transaction, srvid, chunk)
+            return d.addCallback(lambda _: next_chunk(srvid))
+
+        return self._enqueue(self._commit_head, transaction).addCallback(next_chunk)
+
+    def _commit_head(self, cur, transaction):
+        """Attach or retire the server, update its client infos and delete records; returns the server id."""
+        self._save(self.sources, transaction.srcid)
         if not transaction.initial:
             srvid = self.sources[transaction.srcid]
         else:
-            cur.execute(
-                "INSERT INTO %s (hostname,port,owner) VALUES (?,?,?)" % self.tserver,
-                (
-                    transaction.source_address.host,
-                    transaction.source_address.port,
-                    self.mykey,
-                ),
-            )
-            cur.execute(
-                "SELECT id FROM %s WHERE hostname=? AND port=? AND owner=?" % self.tserver,
-                (
-                    transaction.source_address.host,
-                    transaction.source_address.port,
-                    self.mykey,
-                ),
-            )
-            R = cur.fetchone()
-            srvid = R[0]
+            srvid = self._attach_server(cur, transaction)
             self.sources[transaction.srcid] = srvid
 
         if not transaction.connected:
-            cur.execute(
-                "DELETE FROM %s where id=? AND owner=?" % self.tserver,
-                (srvid, self.mykey),
-            )
             del self.sources[transaction.srcid]
-            return
+            self._retire_server(cur, srvid)
+            return srvid
 
         # update client-wide client_infos
         cur.executemany(
-            "INSERT OR REPLACE INTO %s (host,key,value) VALUES (?,?,?)" % self.tinfo,
-            [(srvid, K, V) for K, V in transaction.client_infos.items()],
+            self.dialect.upsert(self.tinfo, ("host", "key", "value"), ("host", "key")),
+            ((srvid, K, V) for K, V in transaction.client_infos.items()),
         )
 
-        # Remove all records, including those which will be re-created
+        fingerprints = self._fingerprints(cur, srvid)
+        removed = [recid for recid in transaction.records_to_delete if recid in fingerprints]
         cur.executemany(
-            "DELETE FROM %s WHERE host=? AND id=?" % self.trecord,
-            itertools.chain(
-                [(srvid, recid) for recid in transaction.records_to_add],
-                [(srvid, recid) for recid in transaction.records_to_delete],
-            ),
+            self.sql("DELETE FROM %s WHERE host=? AND id=?" % self.trecord),
+            ((srvid, recid) for recid in removed),
         )
+        for recid in removed:
+            del fingerprints[recid]
+        return srvid
+
+    def _commit_records(self, cur, transaction, srvid, recids):
+        """Write the records recids of transaction.records_to_add that are new or changed."""
+        fingerprints = self._fingerprints(cur, srvid)
+        stale = self.stale.get(srvid, ())
+
+        # Only records that are new or differ from what is stored are rewritten.
+        changed = {}
+        for recid in recids:
+            record_name, record_type = transaction.records_to_add[recid]
+            digest = record_digest(
+                record_type,
+                record_name,
+                transaction.aliases.get(recid, ()),
+                transaction.record_infos_to_add.get(recid, {}),
+            )
+            current = fingerprints.get(recid)
+            if current is None or current[1] != digest:
+                changed[recid] = digest
+        if stale:
+            resent = stale.intersection(recids)
+            stale -= resent
+            if self._undo is not None:
+                self._undo.append(lambda: stale.update(resent))
+        if not changed:
+            return
 
-        # Start new records
+        removed = [recid for recid in changed if recid in fingerprints]
         cur.executemany(
-            "INSERT INTO %s (host, id, record_type) VALUES (?,?,?)" % self.trecord,
-            [(srvid, recid, record_type) for recid, (record_name, record_type) in transaction.records_to_add.items()],
+            self.sql("DELETE FROM %s WHERE host=? AND id=?" % self.trecord),
+            ((srvid, recid) for recid in removed),
         )
 
-        # Add primary record names
-        cur.executemany(
-            """INSERT INTO %s (rec, record_name, prim) VALUES (
-                         (SELECT pkey FROM %s WHERE id=? AND host=?)
-                         ,?,1)"""
-            % (self.tname, self.trecord),
-            [(recid, srvid, record_name) for recid, (record_name, record_type) in transaction.records_to_add.items()],
+        # Start new records, bulk loaded where the database supports it
+        self.dialect.bulk_insert(
+            cur,
+            self.trecord,
+            ("host", "id", "rtype"),
+            ((srvid, recid, transaction.records_to_add[recid][1]) for recid in changed),
         )
 
-        # Add new record aliases
+        # Look up the pkeys of the new records at once, instead of
+        # a (SELECT pkey ...) subquery for every dependent row.
+        cur.execute(
+            self.sql("SELECT id, pkey FROM %s WHERE host=? AND id BETWEEN ? AND ?" % self.trecord),
+            (srvid, min(changed), max(changed)),
+        )
+        for recid, pkey in cur.fetchall():
+            if recid in changed:
+                fingerprints[recid] = (pkey, changed[recid])
+
+        # Add primary record names and aliases
+        self.dialect.bulk_insert(
+            cur,
+            self.tname,
+            ("rec", "rname", "prim"),
+            itertools.chain(
+                ((fingerprints[recid][0], transaction.records_to_add[recid][0], 1) for recid in changed),
+                (
+                    (fingerprints[recid][0], record_name, 0)
+                    for recid in changed
+                    for record_name in transaction.aliases.get(recid, ())
+                ),
+            ),
+        )
+
+        # add the record client_infos of the changed records
         cur.executemany(
-            """INSERT INTO %(name)s (rec, record_name, prim) VALUES (
-                         (SELECT pkey FROM %(rec)s WHERE id=? AND host=?)
-                         ,?,0)"""
-            % {"name": self.tname, "rec": self.trecord},
-            [(recid, srvid, record_name) for recid, names in transaction.aliases.items() for record_name in names],
+            self.dialect.upsert(self.trecinfo, ("rec", "key", "value"), ("rec", "key")),
+            (
+                (fingerprints[recid][0], K, V)
+                for recid in changed
+                for K, V in transaction.record_infos_to_add.get(recid, {}).items()
+            ),
         )
 
-        # add record client_infos
+    def _commit_tail(self, cur, transaction, srvid):
+        """Add the record client_infos sent for records that are not in records_to_add."""
+        fingerprints = self._fingerprints(cur, srvid)
+        infos = []
+        for recid, client_infos in transaction.record_infos_to_add.items():
+            if recid in transaction.records_to_add:
+                continue
+            current = fingerprints.get(recid)
+            if current is None:
+                continue
+            # the digest no longer describes the stored record
+            fingerprints[recid] = (current[0], None)
+            infos.extend((current[0], K, V) for K, V in client_infos.items())
+        cur.executemany(self.dialect.upsert(self.trecinfo, ("rec", "key", "value"), ("rec", "key")), infos)
+
+        if srvid in self.stale:
+            # the upload of a reconnected IOC may span many transactions, so its
+            # stale records are purged once it has sent none for the grace period
+            self._save(self.stale, srvid)
+            self._save(self.stale_commits, srvid)
+            if not self.stale[srvid]:
+                del self.stale[srvid]
+                self.stale_commits.pop(srvid, None)
+                return
+            commits = self.stale_commits[srvid] = self.stale_commits.get(srvid, 0) + 1
+            self._after_commit(self._schedule, self._purge_stale, srvid, commits)
+
+    def _attach_server(self, cur, transaction):
+        """Return the server row for a newly connected IOC.
+
+        The row of the same IOC is reused while it is in its reconnect grace
+        period, so records it uploads again unchanged are not rewritten.
+        """
+        identity = server_identity(transaction)
+        self._save(self.retired, identity)
+        srvid = self.retired.pop(identity, None)
+        if srvid is not None:
+            log.debug("Reuse server %s for reconnected IOC %s", srvid, identity)
+            cur.execute(
+                self.sql("UPDATE %s SET port=? WHERE id=?" % self.tserver),
+                (transaction.source_address.port, srvid),
+            )
+            # records of the previous connection that are not sent again are removed later
+            self._save(self.stale, srvid)
+            self.stale[srvid] = set(self._fingerprints(cur, srvid))
+        else:
+            srvid = self.dialect.insert_id(
+                cur,
+                self.tserver,
+                ("hostname", "port", "owner"),
+                (
+                    transaction.source_address.host,
+                    transaction.source_address.port,
+                    self.mykey,
+                ),
+            )
+            self.fingerprints[srvid] = {}
+        self._save(self.identities, srvid)
+        self.identities[srvid] = identity
+        return srvid
+
+    def _retire_server(self, cur, srvid):
+        self._save(self.identities, srvid)
+        identity = self.identities.pop(srvid, None)
+        if self.reconnect_grace <= 0 or identity is None:
+            self._delete_server(cur, srvid)
+            return
+        self._save(self.retired, identity)
+        self.retired[identity] = srvid
+        self._after_commit(self._schedule, self._purge_retired, identity, srvid)
+
+    def _delete_server(self, cur, srvid):
+        """Mark a server row for purging; a single row update however many records it has.
+
+        A negative owner marks the server as disconnected; its rows are
+        deleted in batches by _purge_step().
+        """
+        cur.execute(
+            self.sql("UPDATE %s SET owner=? WHERE id=? AND owner=?" % self.tserver),
+            (-self.mykey, srvid, self.mykey),
+        )
+        self.fingerprints.pop(srvid, None)
+        self._save(self.stale, srvid)
+        self._save(self.stale_commits, srvid)
+        self.stale.pop(srvid, None)
+        self.stale_commits.pop(srvid, None)
+        self._after_commit(self._start_purge)
+
+    def _start_purge(self):
+        """Run purge steps through the writer queue until no marked server is left."""
+        if self._purging or not self.running:
+            return
+        self._purging = True
+
+        def step():
+            if not self.running:
+                return defer.succeed(False)
+            return self._enqueue(self._purge_step).addCallback(next_step)
+
+        def next_step(more):
+            if more:
+                return step()
+            return False
+
+        def done(result):
+            self._purging = False
+            return result
+
+        step().addErrback(lambda err: log.error("DB purge failed: %s", err)).addBoth(done)
+
+    def _purge_step(self, cur):
+        """Delete up to purge_batch records of one marked server; returns True if more remain."""
+        cur.execute(self.sql("SELECT id FROM %s WHERE owner=? LIMIT 1" % self.tserver), (-self.mykey,))
+        row = cur.fetchone()
+        if row is None:
+            return False
+        srvid = row[0]
+        cur.execute(
+            self.sql(
+                "DELETE FROM %s WHERE pkey IN (SELECT pkey FROM %s WHERE host=? LIMIT ?)" % (self.trecord, self.trecord)
+            ),
+            (srvid, self.purge_batch),
+        )
+        if cur.rowcount < self.purge_batch:
+            cur.execute(self.sql("DELETE FROM %s WHERE id=?" % self.tserver), (srvid,))
+        return True
+
+    def _purge_retired(self, cur, identity, srvid):
+        if self.retired.get(identity) == srvid:
+            self._save(self.retired, identity)
+            del self.retired[identity]
+            self._delete_server(cur, srvid)
+            if self.index is not None:
+                self._after_commit(self.index.remove_server, srvid)
+
+    def _purge_stale(self, cur, srvid, commits):
+        if self.stale_commits.get(srvid) != commits:
+            # committed to since, a later call purges
+            return
+        self._save(self.stale_commits, srvid)
+        self._save(self.stale, srvid)
+        del self.stale_commits[srvid]
+        stale = self.stale.pop(srvid, None)
+        if not stale or srvid not in self.identities:
+            return
         cur.executemany(
-            """INSERT OR REPLACE INTO %s (rec,key,value) VALUES (
-                         (SELECT pkey FROM %s WHERE id=? AND host=?)
-                         ,?,?)"""
-            % (self.trecinfo, self.trecord),
-            [
-                (recid, srvid, K, V)
-                for recid, client_infos in transaction.record_infos_to_add.items()
-                for K, V in client_infos.items()
-            ],
+            self.sql("DELETE FROM %s WHERE host=? AND id=?" % self.trecord),
+            [(srvid, recid) for recid in stale],
+        )
+        fingerprints = self.fingerprints.get(srvid, {})
+        for recid in stale:
+            fingerprints.pop(recid, None)
+
+    def _schedule(self, op, *args, delay=None):
+        """Queue op for the writer once the reconnect grace period, or delay seconds, has passed."""
+        from twisted.internet import reactor
+
+        def fire():
+            self._timers.discard(call)
+            self._enqueue(op, *args)
+
+        call = reactor.callLater(self.reconnect_grace if delay is None else delay, fire)
+        self._timers.add(call)
+
+    def _call_in_reactor(self, fn, *args, **kwargs):
+        from twisted.internet import reactor
+
+        reactor.callFromThread(fn, *args, **kwargs)
+
+    def _fingerprints(self, cur, srvid):
+        """The record fingerprints of a server, loaded from the database when not cached."""
+        fingerprints = self.fingerprints.get(srvid)
+        if fingerprints is not None:
+            return fingerprints
+        records = {}
+        cur.execute(self.sql("SELECT pkey, id, rtype FROM %s WHERE host=?" % self.trecord), (srvid,))
+        for pkey, recid, rtype in cur.fetchall():
+            records[pkey] = [recid, rtype, None, [], {}]
+        cur.execute(
+            self.sql(
+                "SELECT n.rec, n.rname, n.prim FROM %s n JOIN %s r ON n.rec = r.pkey WHERE r.host=?"
+                % (self.tname, self.trecord)
+            ),
+            (srvid,),
+        )
+        for pkey, rname, prim in cur.fetchall():
+            if prim:
+                records[pkey][2] = rname
+            else:
+                records[pkey][3].append(rname)
+        cur.execute(
+            self.sql(
+                "SELECT i.rec, i.key, i.value FROM %s i JOIN %s r ON i.rec = r.pkey WHERE r.host=?"
+                % (self.trecinfo, self.trecord)
+            ),
+            (srvid,),
         )
+        for pkey, key, value in cur.fetchall():
+            records[pkey][4][key] = value
+        fingerprints = {
+            recid: (pkey, record_digest(rtype, rname, aliases, infos))
+            for pkey, (recid, rtype, rname, aliases, infos) in records.items()
+        }
+        self.fingerprints[srvid] = fingerprints
+        return fingerprints
+
+
+def server_identity(transaction):
+    """Identifies an IOC across reconnects: its host and IOCNAME, or its endpoint without one."""
+    host = transaction.source_address.host
+    ioc_name = transaction.client_infos.get("IOCNAME")
+    if ioc_name:
+        return (host, ioc_name)
+    return (host, transaction.source_address.port)
+
+
+def record_digest(record_type, record_name, aliases, infos):
+    """Fingerprint of everything stored for one record."""
+    return hash((record_type, record_name, frozenset(aliases), frozenset(infos.items())))
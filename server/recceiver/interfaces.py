@@ -25,6 +25,10 @@ class ITransaction(Interface):
 
     connected = Attribute("False if the IOC has disconnected")
 
+    trace = Attribute("recceiver.tracing.Trace timing the transaction, or None when not traced")
+
+    stats = Attribute("Per-IOC statistics of the sending IOC in recceiver.iocstats.IOCStats, or None")
+
 
 class IProcessor(service.IService):
     def commit(self, transaction):
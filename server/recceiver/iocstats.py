@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Per-IOC statistics kept by RecService, and a JSON view of them on the metrics site.
+
+    GET /iocstats?sort=KEY&limit=N
+
+lists the IOCs by decreasing KEY, one of
+
+    records         records currently uploaded
+    upload_bytes    size of the last upload
+    upload_seconds  duration of the last upload
+    reconnects      connections after the first
+    commit_seconds  slowest last commit over the processors
+    queue_position  furthest queue position over the processors
+
+or by name when sort is absent. IOCs are identified by host and
+IOCNAME, so that their reconnections are counted together.
+"""
+
+import heapq
+import json
+import time
+
+from twisted.web.resource import Resource
+
+from .webutil import error, query_args
+
+__all__ = ["IOCStats", "IOCStatsResource"]
+
+
+class _IOC:
+    __slots__ = (
+        "host",
+        "name",
+        "peer",
+        "connected",
+        "connects",
+        "records",
+        "upload_bytes",
+        "upload_seconds",
+        "uploaded",
+        "commit_seconds",
+    )
+
+    def __init__(self, host, name):
+        self.host, self.name = host, name
+        self.peer = None
+        self.connected = False
+        self.connects = 0
+        self.records = 0
+        self.upload_bytes = self.upload_seconds = self.uploaded = None
+        # processor name -> duration of its last commit of this IOC
+        self.commit_seconds = {}
+
+
+class IOCStats(object):
+    """The statistics of every IOC seen, updated on the reactor.
+
+    queues are the ProcessorQueues of the processors, for the queue
+    positions of the IOCs.
+    """
+
+    _sorts = {
+        "records": lambda ioc, positions: ioc.records,
+        "upload_bytes": lambda ioc, positions: ioc.upload_bytes or 0,
+        "upload_seconds": lambda ioc, positions: ioc.upload_seconds or 0.0,
+        "reconnects": lambda ioc, positions: max(ioc.connects - 1, 0),
+        "commit_seconds": lambda ioc, positions: max(ioc.commit_seconds.values(), default=0.0),
+        "queue_position": lambda ioc, positions: max(positions.get(ioc, {}).values(), default=0),
+    }
+
+    def __init__(self, queues=()):
+        self.queues = list(queues)
+        # (host, IOCNAME) -> _IOC
+        self._iocs = {}
+        # srcid of the live sessions -> _IOC
+        self._sessions = {}
+
+    def __len__(self):
+        return len(self._iocs)
+
+    def observe(self, trans):
+        """Account for trans, flushed by its session; returns the _IOC to attach to it."""
+        ioc = self._sessions.get(trans.srcid)
+        if ioc is None:
+            if not trans.connected:
+                # closed before its first transaction
+                return None
+            key = (trans.source_address.host, trans.client_infos.get("IOCNAME"))
+            ioc = self._iocs.get(key)
+            if ioc is None:
+                ioc = self._iocs[key] = _IOC(*key)
+            self._sessions[trans.srcid] = ioc
+        if not trans.connected:
+            ioc.connected = False
+            del self._sessions[trans.srcid]
+            return ioc
+        if trans.initial:
+            ioc.connects += 1
+            ioc.records = 0
+            ioc.connected = True
+            ioc.peer = "%s:%s" % (trans.source_address.host, trans.source_address.port)
+        ioc.records = max(ioc.records + len(trans.records_to_add) - len(trans.records_to_delete), 0)
+        return ioc
+
+    def uploaded(self, srcid, size, seconds):
+        """Record the upload done by the session srcid."""
+        ioc = self._sessions.get(srcid)
+        if ioc is not None:
+            ioc.upload_bytes, ioc.upload_seconds, ioc.uploaded = size, seconds, time.time()
+
+    def _positions(self):
+        # _IOC -> {processor name: position of its first queued transaction}
+        positions = {}
+        for queue in self.queues:
+            name = queue.processor.name
+            for position, trans in enumerate(queue.pending(), 1):
+                ioc = getattr(trans, "stats", None)
+                if ioc is not None:
+                    positions.setdefault(ioc, {}).setdefault(name, position)
+        return positions
+
+    def list(self, sort=None, limit=100):
+        """The IOCs as dicts, the limit largest by sort, or the first by name."""
+        positions = self._positions()
+        if sort is None:
+            iocs = sorted(self._iocs.values(), key=lambda ioc: (ioc.host, ioc.name or ""))[:limit]
+        else:
+            key = self._sorts[sort]
+            iocs = heapq.nlargest(limit, self._iocs.values(), key=lambda ioc: key(ioc, positions))
+        return [self._describe(ioc, positions.get(ioc, {})) for ioc in iocs]
+
+    def _describe(self, ioc, positions):
+        return {
+            "host": ioc.host,
+            "iocName": ioc.name,
+            "peer": ioc.peer,
+            "connected": ioc.connected,
+            "records": ioc.records,
+            "connects": ioc.connects,
+            "reconnects": max(ioc.connects - 1, 0),
+            "uploadBytes": ioc.upload_bytes,
+            "uploadSeconds": ioc.upload_seconds,
+            "uploaded": ioc.uploaded,
+            "commitSeconds": dict(ioc.commit_seconds),
+            "queuePosition": positions,
+        }
+
+
+class IOCStatsResource(Resource):
+    """Serves IOCStats.list() as JSON."""
+
+    isLeaf = True
+
+    def __init__(self, stats, max_limit=10000):
+        Resource.__init__(self)
+        self.stats, self.max_limit = stats, max_limit
+
+    def render_GET(self, request):
+        try:
+            args = query_args(request)
+        except ValueError:
+            return error(request, 400, "query arguments must be UTF-8")
+        try:
+            limit = min(int(args.get("limit", "100")), self.max_limit)
+        except ValueError:
+            return error(request, 400, "limit must be an integer")
+        if limit < 1:
+            return error(request, 400, "limit must be positive")
+        sort = args.get("sort")
+        if sort is not None and sort not in IOCStats._sorts:
+            return error(request, 400, "sort must be one of " + ", ".join(sorted(IOCStats._sorts)))
+        body = {"iocs": len(self.stats), "top": self.stats.list(sort, limit)}
+        request.setHeader(b"Content-Type", b"application/json")
+        return json.dumps(body).encode()
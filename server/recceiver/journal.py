@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""Binary journal of transactions, for replaying production traffic offline.
+
+The journal processor appends every transaction it is given to a file;
+read_journal() maps such a file and yields the transactions back, and
+running this module replays a journal into the processors of a
+configuration file:
+
+    python -m recceiver.journal -f demo.conf --speed 0 recceiver.journal
+
+File layout: MAGIC, then one entry per transaction of
+LENGTH(4) + BODY(LENGTH), in network byte order:
+
+    BODY    = TIME(8, float) + SRCID(8) + PORT(2) + FLAGS(1) + HOST(str)
+              + N(4) + N * (KEY(str) + VALUE(str))             client infos
+              + N(4) + N * (RECID(4) + RTYPE(str) + RNAME(str)) records
+              + N(4) + N * (RECID(4) + M(2) + M * ALIAS(str))  aliases
+              + N(4) + N * (RECID(4) + M(2) + M * (KEY(str) + VALUE(str)))
+              + N(4) + N * RECID(4)                            deletes
+    str     = LEN(2) + UTF-8(LEN)
+    FLAGS   = 1 (connected) | 2 (initial)
+
+String lengths have the same 16 bit limit as the RecSync wire protocol.
+"""
+
+import argparse
+import logging
+import mmap
+import struct
+import sys
+import time
+
+from twisted.application import service
+from twisted.internet import defer, task, threads
+from twisted.internet.address import IPv4Address
+from zope.interface import implementer
+
+from . import interfaces
+from .processors import ProcessorController
+from .recast import Transaction
+from .showfile import DumpWriter
+
+log = logging.getLogger(__name__)
+
+__all__ = ["JournalProcessor", "encode_transaction", "decode_transaction", "read_journal", "replay"]
+
+MAGIC = b"RCJOURN\x02"
+
+_entry = struct.Struct("!I")
+# srcid is the id() of the session, a 64 bit address
+_head = struct.Struct("!dQHB")
+_count = struct.Struct("!I")
+_short = struct.Struct("!H")
+_recid = struct.Struct("!I")
+
+_CONNECTED, _INITIAL = 1, 2
+
+
+def _pack_str(parts, text):
+    data = text.encode()
+    parts.append(_short.pack(len(data)))
+    parts.append(data)
+
+
+def encode_transaction(trans, stamp):
+    """The journal entry of trans, received at time stamp, including its length prefix."""
+    parts = []
+    flags = (_CONNECTED if trans.connected else 0) | (_INITIAL if trans.initial else 0)
+    parts.append(_head.pack(stamp, trans.srcid, trans.source_address.port, flags))
+    _pack_str(parts, trans.source_address.host)
+
+    parts.append(_count.pack(len(trans.client_infos)))
+    for key, value in trans.client_infos.items():
+        _pack_str(parts, key)
+        _pack_str(parts, value)
+
+    parts.append(_count.pack(len(trans.records_to_add)))
+    for recid, (name, rtype) in trans.records_to_add.items():
+        parts.append(_recid.pack(recid))
+        _pack_str(parts, rtype)
+        _pack_str(parts, name)
+
+    aliases = [(recid, names) for recid, names in trans.aliases.items() if names]
+    parts.append(_count.pack(len(aliases)))
+    for recid, names in aliases:
+        parts.append(_recid.pack(recid) + _short.pack(len(names)))
+        for name in names:
+            _pack_str(parts, name)
+
+    parts.append(_count.pack(len(trans.record_infos_to_add)))
+    for recid, infos in trans.record_infos_to_add.items():
+        parts.append(_recid.pack(recid) + _short.pack(len(infos)))
+        for key, value in infos.items():
+            _pack_str(parts, key)
+            _pack_str(parts, value)
+
+    deletes = sorted(trans.records_to_delete)
+    parts.append(_count.pack(len(deletes)) + struct.pack("!%dI" % len(deletes), *deletes))
+
+    body = b"".join(parts)
+    return _entry.pack(len(body)) + body
+
+
+class _Reader(object):
+    __slots__ = ("buf", "pos")
+
+    def __init__(self, buf, pos):
+        self.buf, self.pos = buf, pos
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.buf, self.pos)
+        self.pos += fmt.size
+        return values
+
+    def count(self):
+        return self.unpack(_count)[0]
+
+    def str(self):
+        (length,) = self.unpack(_short)
+        start = self.pos
+        self.pos += length
+        return bytes(self.buf[start : self.pos]).decode()
+
+
+def decode_transaction(buf, offset=0):
+    """Decode the entry at offset of buf; returns (stamp, transaction, offset of the next entry)."""
+    (length,) = _entry.unpack_from(buf, offset)
+    end = offset + _entry.size + length
+    if end > len(buf):
+        raise ValueError("Truncated journal entry at offset %d" % offset)
+    r = _Reader(buf, offset + _entry.size)
+    stamp, srcid, port, flags = r.unpack(_head)
+    trans = Transaction(IPv4Address("TCP", r.str(), port), srcid)
+    trans.connected = bool(flags & _CONNECTED)
+    trans.initial = bool(flags & _INITIAL)
+
+    for _ in range(r.count()):
+        key = r.str()
+        trans.client_infos[key] = r.str()
+    for _ in range(r.count()):
+        (recid,) = r.unpack(_recid)
+        rtype = r.str()
+        trans.records_to_add[recid] = (r.str(), rtype)
+    for _ in range(r.count()):
+        (recid,) = r.unpack(_recid)
+        (n,) = r.unpack(_short)
+        trans.aliases[recid] = [r.str() for _ in range(n)]
+    for _ in range(r.count()):
+        (recid,) = r.unpack(_recid)
+        (n,) = r.unpack(_short)
+        infos = trans.record_infos_to_add[recid] = {}
+        for _ in range(n):
+            key = r.str()
+            infos[key] = r.str()
+    n = r.count()
+    trans.records_to_delete = set(struct.unpack_from("!%dI" % n, buf, r.pos))
+    return stamp, trans, end
+
+
+def read_journal(path):
+    """Yield (stamp, transaction) for each entry of the journal at path.
+
+    A truncated last entry, as left by a crash, ends the journal.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a recceiver journal" % path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            offset = len(MAGIC)
+            while offset + _entry.size <= len(buf):
+                try:
+                    stamp, trans, offset = decode_transaction(buf, offset)
+                except (ValueError, struct.error):
+                    log.warning("Journal %s ends with a truncated entry at offset %d", path, offset)
+                    return
+                yield stamp, trans
+
+
+@implementer(interfaces.IProcessor)
+class JournalProcessor(service.Service):
+    """Appends each transaction to a binary journal file.
+
+    Encoding and writing happen on the thread of a showfile.DumpWriter,
+    which never rotates the journal nor drops a transaction.
+    """
+
+    def __init__(self, name, opts):
+        self.name = name
+        self.path = opts.get("path", "recceiver.journal")
+        self.writer = DumpWriter(self.path, encode_transaction, max_bytes=0, buffer_size=0, header=MAGIC)
+
+    def startService(self):
+        service.Service.startService(self)
+        self.writer.start()
+        log.info("Journal processor '%s' writing to %s", self.name, self.path)
+
+    def stopService(self):
+        service.Service.stopService(self)
+        return threads.deferToThread(self.writer.close)
+
+    def commit(self, transaction):
+        self.writer.put(transaction)
+        return defer.succeed(None)
+
+
+@defer.inlineCallbacks
+def replay(clock, ctrl, journal, speed=1.0):
+    """Commit the transactions of journal to ctrl in order.
+
+    With speed > 0 the recorded pacing is kept, scaled by speed; with
+    speed 0 transactions are committed as fast as ctrl accepts them.
+    Returns the number of transactions.
+    """
+    count = 0
+    first = start = None
+    for stamp, trans in journal:
+        if speed > 0:
+            if first is None:
+                first, start = stamp, clock.seconds()
+            delay = (stamp - first) / speed - (clock.seconds() - start)
+            if delay > 0:
+                yield task.deferLater(clock, delay, lambda: None)
+        yield ctrl.commit(trans)
+        count += 1
+    yield defer.DeferredList([queue.drained() for queue in ctrl.queues.values()])
+    return count
+
+
+def main(reactor, argv):
+    parser = argparse.ArgumentParser(prog="python -m recceiver.journal", description=__doc__.split("\n")[0])
+    parser.add_argument("journal", help="journal file written by the journal processor")
+    parser.add_argument("-f", "--config", required=True, help="recceiver configuration naming the processors")
+    parser.add_argument("--speed", type=float, default=1.0, help="pace relative to the recording, 0 for maximum")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    ctrl = ProcessorController(cfile=args.config)
+    ctrl.startService()
+    started = time.monotonic()
+
+    def report(count):
+        elapsed = time.monotonic() - started
+        log.info("Replayed %d transactions in %.3f s (%.1f/s)", count, elapsed, count / elapsed if elapsed else 0.0)
+        return ctrl.stopService()
+
+    return replay(reactor, ctrl, read_journal(args.journal), args.speed).addCallback(report)
+
+
+if __name__ == "__main__":
+    task.react(main, (sys.argv[1:],))
@@ -49,6 +49,116 @@ try:
         registry=_registry,
     )
 
+    cf_name_lookup_requests_total = Counter(
+        "recceiver_cf_name_lookup_requests_total",
+        "CF name lookup queries issued by strategy",
+        ["strategy"],
+        registry=_registry,
+    )
+    cf_name_lookup_duration_seconds = Histogram(
+        "recceiver_cf_name_lookup_duration_seconds",
+        "CF find-by-names duration in seconds by strategy",
+        ["strategy"],
+        buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0],
+        registry=_registry,
+    )
+
+    processor_queue_depth = Gauge(
+        "recceiver_processor_queue_depth",
+        "Transactions queued for a processor",
+        ["processor"],
+        registry=_registry,
+    )
+    processor_queue_lag_seconds = Gauge(
+        "recceiver_processor_queue_lag_seconds",
+        "Time the transaction last started by a processor spent in its queue",
+        ["processor"],
+        registry=_registry,
+    )
+
+    processor_parked = Gauge(
+        "recceiver_processor_parked",
+        "1 while a processor is parked after a failure",
+        ["processor"],
+        registry=_registry,
+    )
+    processor_backlog = Gauge(
+        "recceiver_processor_backlog",
+        "Transactions held for a parked processor, after compaction",
+        ["processor"],
+        registry=_registry,
+    )
+
+    span_seconds = Histogram(
+        "recceiver_span_seconds",
+        "Duration of the timing spans of traced transactions, by span",
+        ["span"],
+        buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0],
+        registry=_registry,
+    )
+    show_dropped_total = Counter(
+        "recceiver_show_dropped_total",
+        "Transactions the show processor dropped because its file writer fell behind",
+        ["processor"],
+        registry=_registry,
+    )
+
+    received_bytes_total = Counter(
+        "recceiver_received_bytes_total",
+        "Bytes received from IOCs",
+        registry=_registry,
+    )
+    frames_total = Counter(
+        "recceiver_frames_total",
+        "Messages received from IOCs, by message type",
+        ["message"],
+        registry=_registry,
+    )
+    protocol_errors_total = Counter(
+        "recceiver_protocol_errors_total",
+        "Messages from IOCs which failed to decode, by message type",
+        ["message"],
+        registry=_registry,
+    )
+    transaction_items = Histogram(
+        "recceiver_transaction_items",
+        "Entries per committed transaction, by kind",
+        ["kind"],
+        buckets=[0, 1, 10, 100, 1000, 5000, 10000, 50000],
+        registry=_registry,
+    )
+    transaction_size = Histogram(
+        "recceiver_transaction_size",
+        "Records, aliases, infos and deletions per committed transaction",
+        buckets=[1, 10, 100, 1000, 5000, 10000, 50000, 100000],
+        registry=_registry,
+    )
+    ping_rtt_seconds = Histogram(
+        "recceiver_ping_rtt_seconds",
+        "Round-trip time of the pings to IOCs",
+        buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 3.0],
+        registry=_registry,
+    )
+    upload_duration_seconds = Histogram(
+        "recceiver_upload_duration_seconds",
+        "Time from the server greeting to the upload done message of an IOC",
+        buckets=[0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0],
+        registry=_registry,
+    )
+    upload_bytes = Histogram(
+        "recceiver_upload_bytes",
+        "Bytes received from an IOC until its upload done message",
+        buckets=[1024, 16 * 1024, 128 * 1024, 1024 * 1024, 8 * 1024 * 1024, 64 * 1024 * 1024],
+        registry=_registry,
+    )
+
+    reactor_lag_seconds = Histogram(
+        "recceiver_reactor_lag_seconds",
+        "Delay of the periodic reactor lag probe call past its scheduled time",
+        buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0],
+        registry=_registry,
+    )
+
     class _MetricsResource(Resource):
         isLeaf = True
 
@@ -56,8 +166,20 @@ try:
             request.setHeader(b"Content-Type", CONTENT_TYPE_LATEST.encode())
             return generate_latest(_registry)
 
-    def make_site():
-        return Site(_MetricsResource())
+    class _RootResource(_MetricsResource):
+        """Metrics on any path but those of the children, such as /iocstats."""
+
+        isLeaf = False
+
+        def getChild(self, path, request):
+            return self
+
+    def make_site(children=None):
+        """A Site serving the metrics, and the resources of children {path: Resource}."""
+        root = _RootResource()
+        for path, resource in (children or {}).items():
+            root.putChild(path, resource)
+        return Site(root)
 
     available = True
 
@@ -84,6 +206,23 @@ except ImportError:
     tracked_channels = _Noop()
     cf_commits_total = _Noop()
     cf_commit_duration_seconds = _Noop()
-
-    def make_site():
+    cf_name_lookup_requests_total = _Noop()
+    cf_name_lookup_duration_seconds = _Noop()
+    processor_queue_depth = _Noop()
+    processor_queue_lag_seconds = _Noop()
+    processor_parked = _Noop()
+    processor_backlog = _Noop()
+    show_dropped_total = _Noop()
+    span_seconds = _Noop()
+    received_bytes_total = _Noop()
+    frames_total = _Noop()
+    protocol_errors_total = _Noop()
+    transaction_items = _Noop()
+    transaction_size = _Noop()
+    ping_rtt_seconds = _Noop()
+    upload_duration_seconds = _Noop()
+    upload_bytes = _Noop()
+    reactor_lag_seconds = _Noop()
+
+    def make_site(children=None):
         raise RuntimeError("prometheus_client is not installed")
@@ -3,22 +3,29 @@
 import configparser as ConfigParser
 import logging
 import os
+import random
+import time
+from collections import deque
 from configparser import ConfigParser as Parser
 from os.path import expanduser
 
 from twisted.application import service
-from twisted.internet import defer, task
+from twisted.internet import defer, task, threads
+from twisted.python.failure import Failure
 from zope.interface import implementer
 
 from twisted import plugin
 
-from . import interfaces
+from . import interfaces, metrics, showfile
+from .recast import Transaction
 
 log = logging.getLogger(__name__)
 
 __all__ = [
     "ShowProcessor",
     "ProcessorFactory",
+    "ProcessorQueue",
+    "Backlog",
 ]
 
 
@@ -63,6 +70,378 @@ class ConfigAdapter(object):
         return result
 
 
+def _copy_transaction(trans):
+    copy = Transaction(trans.source_address, trans.srcid)
+    copy.initial, copy.connected = trans.initial, trans.connected
+    copy.records_to_add = dict(trans.records_to_add)
+    copy.records_to_delete = set(trans.records_to_delete)
+    copy.client_infos = dict(trans.client_infos)
+    copy.record_infos_to_add = {recid: dict(infos) for recid, infos in trans.record_infos_to_add.items()}
+    for recid, aliases in trans.aliases.items():
+        copy.aliases[recid] = list(aliases)
+    return copy
+
+
+def _merge_transaction(base, trans):
+    """Fold trans, the next transaction of the same connection, into base."""
+    base.client_infos.update(trans.client_infos)
+    for recid in trans.records_to_delete:
+        base.records_to_add.pop(recid, None)
+        base.aliases.pop(recid, None)
+        base.record_infos_to_add.pop(recid, None)
+        if not base.initial:
+            base.records_to_delete.add(recid)
+    for recid, record in trans.records_to_add.items():
+        # added again after a delete: the add replaces the record
+        base.records_to_delete.discard(recid)
+        base.records_to_add[recid] = record
+        base.aliases.pop(recid, None)
+        if recid in trans.aliases:
+            base.aliases[recid] = list(trans.aliases[recid])
+        base.record_infos_to_add.pop(recid, None)
+    for recid, infos in trans.record_infos_to_add.items():
+        base.record_infos_to_add.setdefault(recid, {}).update(infos)
+
+
+class _BacklogEntry(object):
+    __slots__ = ("merged", "disconnect", "attempted")
+
+    def __init__(self, trans, attempted):
+        self.merged = _copy_transaction(trans) if trans.connected else None
+        self.disconnect = None if trans.connected else trans
+        # the processor may have applied part of it before failing
+        self.attempted = attempted
+
+    def transactions(self):
+        return [trans for trans in (self.merged, self.disconnect) if trans is not None]
+
+    def committed(self, _result, trans):
+        """Drop trans once the processor has committed it, so it is not replayed again."""
+        if trans is self.merged:
+            self.merged = None
+        else:
+            self.disconnect = None
+
+
+class Backlog(object):
+    """Transactions held for a parked processor, compacted per IOC connection.
+
+    The transactions of a connection are merged into one, followed by its
+    disconnect if that has happened. A connection that began and ended
+    while the processor was parked is dropped altogether.
+    """
+
+    def __init__(self):
+        self._entries = deque()
+        # srcid -> the entry still receiving transactions of that connection
+        self._open = {}
+        self.received = 0
+
+    def __len__(self):
+        return sum(len(entry.transactions()) for entry in self._entries)
+
+    def add(self, trans, attempted=False):
+        self.received += 1
+        entry = self._open.get(trans.srcid)
+        if entry is None:
+            entry = _BacklogEntry(trans, attempted)
+            self._entries.append(entry)
+            if trans.connected:
+                self._open[trans.srcid] = entry
+        elif not trans.connected:
+            del self._open[trans.srcid]
+            if entry.merged.initial and not entry.attempted:
+                self._entries.remove(entry)
+            else:
+                entry.disconnect = trans
+        else:
+            _merge_transaction(entry.merged, trans)
+
+    def popleft(self):
+        """The transactions of the oldest connection, or None when empty."""
+        if not self._entries:
+            return None
+        entry = self._entries.popleft()
+        srcid = (entry.merged or entry.disconnect).srcid
+        if self._open.get(srcid) is entry:
+            del self._open[srcid]
+        return entry
+
+    def appendleft(self, entry):
+        """Put back an entry that could not be replayed."""
+        entry.attempted = True
+        self._entries.appendleft(entry)
+
+    def clear(self):
+        dropped = len(self)
+        self._entries.clear()
+        self._open.clear()
+        return dropped
+
+
+class ProcessorQueue(object):
+    """Queue of the transactions for one processor, with a circuit breaker.
+
+    The transactions of a connection (srcid) are committed one at a
+    time, in order, each once the Deferred of the previous commit has
+    fired. Transactions of different connections are committed
+    concurrently, up to max_in_flight at a time. A processor whose commit
+    fails is parked: its transactions are kept in a Backlog until a
+    replay of the backlog succeeds, tried after retry_interval seconds
+    and then at doubling intervals up to retry_max.
+    """
+
+    CLOSED, OPEN, REPLAYING = "closed", "open", "replaying"
+
+    def __init__(
+        self,
+        processor,
+        maxsize=1000,
+        synchronous=False,
+        retry_interval=30.0,
+        retry_max=600.0,
+        clock=None,
+        max_in_flight=64,
+    ):
+        self.processor = processor
+        self.maxsize = maxsize
+        # the session waits for the commits of synchronous processors
+        self.synchronous = synchronous
+        self.retry_interval, self.retry_max = retry_interval, retry_max
+        self.max_in_flight = max_in_flight
+        self.state = self.CLOSED
+        self.backlog = Backlog()
+        self._clock = clock
+        self._retry = None
+        self._delay = retry_interval
+        # srcid -> deque of (trans, d, queued), the queued transactions of each connection
+        self._items = {}
+        self._count = 0
+        # srcids with queued transactions and no commit in progress, in turn
+        self._ready = deque()
+        # srcids with a commit in progress
+        self._inflight = set()
+        self._waiting = deque()
+        self._drained = []
+
+    def __len__(self):
+        return self._count
+
+    def put(self, trans):
+        """Queue trans; returns a Deferred firing with the result of its commit."""
+        if self.state != self.CLOSED and trans.srcid not in self._inflight:
+            self.backlog.add(trans)
+            metrics.processor_backlog.labels(processor=self.processor.name).set(len(self.backlog))
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._append((trans, d, time.monotonic()))
+        metrics.processor_queue_depth.labels(processor=self.processor.name).set(self._count)
+        self._next()
+        return d
+
+    def pending(self):
+        """The transactions waiting to be passed to the processor, in the order they were queued."""
+        return (trans for trans, _d, _queued in self._ordered(list(self._items)))
+
+    def room(self):
+        """A Deferred firing once the queue is below maxsize."""
+        if self._count < self.maxsize:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._waiting.append(d)
+        return d
+
+    def drained(self):
+        """A Deferred firing once every queued transaction has been committed or parked."""
+        if not self._count and not self._inflight:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._drained.append(d)
+        return d
+
+    def clear(self):
+        """Cancel the transactions not yet passed to the processor and drop the backlog."""
+        if self._retry is not None and self._retry.active():
+            self._retry.cancel()
+        self._retry = None
+        items = self._take(list(self._items))
+        self._wake()
+        for _trans, d, _queued in items:
+            d.errback(defer.CancelledError())
+        metrics.processor_queue_depth.labels(processor=self.processor.name).set(0)
+        return len(items) + self.backlog.clear()
+
+    def _append(self, item):
+        srcid = item[0].srcid
+        items = self._items.get(srcid)
+        if items is None:
+            items = self._items[srcid] = deque()
+            if srcid not in self._inflight:
+                self._ready.append(srcid)
+        items.append(item)
+        self._count += 1
+
+    def _ordered(self, srcids):
+        # the items of the connections srcids, in the order they were queued
+        return sorted((item for srcid in srcids for item in self._items[srcid]), key=lambda item: item[2])
+
+    def _take(self, srcids):
+        """Remove the items of the connections srcids; returns them in the order they were queued."""
+        items = self._ordered(srcids)
+        for srcid in srcids:
+            del self._items[srcid]
+        self._ready = deque(srcid for srcid in self._ready if srcid in self._items)
+        self._count -= len(items)
+        return items
+
+    def _wake(self):
+        while self._waiting and self._count < self.maxsize:
+            self._waiting.popleft().callback(None)
+
+    def _next(self):
+        # a loop rather than recursion, as many commits complete synchronously
+        while self._ready and self.state == self.CLOSED and len(self._inflight) < self.max_in_flight:
+            srcid = self._ready.popleft()
+            items = self._items[srcid]
+            trans, d, queued = items.popleft()
+            if not items:
+                del self._items[srcid]
+            self._count -= 1
+            name = self.processor.name
+            metrics.processor_queue_depth.labels(processor=name).set(self._count)
+            metrics.processor_queue_lag_seconds.labels(processor=name).set(time.monotonic() - queued)
+            self._wake()
+            self._inflight.add(srcid)
+            started = time.time()
+            trace = getattr(trans, "trace", None)
+            if trace is not None:
+                trace.add("queue:" + name, started - (time.monotonic() - queued), started)
+            c = defer.maybeDeferred(self.processor.commit, trans)
+            if c.called:
+                c.addBoth(self._finish, d, trans, started)
+            else:
+                c.addBoth(self._finish, d, trans, started).addBoth(lambda _: self._next())
+        if not self._count and not self._inflight:
+            drained, self._drained = self._drained, []
+            for d in drained:
+                d.callback(None)
+
+    def _finish(self, result, d, trans, started):
+        srcid = trans.srcid
+        self._inflight.discard(srcid)
+        trace = getattr(trans, "trace", None)
+        if trace is not None:
+            trace.add("commit:" + self.processor.name, started)
+        stats = getattr(trans, "stats", None)
+        if stats is not None:
+            stats.commit_seconds[self.processor.name] = time.time() - started
+        if not self._count:
+            metrics.processor_queue_lag_seconds.labels(processor=self.processor.name).set(0)
+        if isinstance(result, Failure) and not result.check(defer.CancelledError):
+            if self.state == self.CLOSED:
+                log.error("Park processor %s after a failed commit: %s", self.processor.name, result)
+                self._park(trans)
+            else:
+                # begun before the processor was parked
+                log.error("Commit of parked processor %s failed: %s", self.processor.name, result)
+                self.backlog.add(trans, attempted=True)
+                self._settle()
+            d.callback(None)
+            return
+        if self.state != self.CLOSED:
+            self._settle()
+        elif srcid in self._items:
+            self._ready.append(srcid)
+        if isinstance(result, Failure):
+            log.debug("Cancel processing: %s: %s", self.processor.name, trans)
+            d.errback(result)
+        else:
+            d.callback(result)
+
+    def _park(self, trans):
+        self.state = self.OPEN
+        metrics.processor_parked.labels(processor=self.processor.name).set(1)
+        self.backlog.add(trans, attempted=True)
+        self._settle()
+        self._schedule_retry()
+
+    def _settle(self):
+        """While parked, move the transactions of the connections with no commit in progress to the backlog.
+
+        The others wait for that commit, as it may yet fail and go to the
+        backlog before them.
+        """
+        items = self._take([srcid for srcid in self._items if srcid not in self._inflight])
+        for trans, _d, _queued in items:
+            self.backlog.add(trans)
+        self._wake()
+        for _trans, d, _queued in items:
+            d.callback(None)
+        metrics.processor_queue_depth.labels(processor=self.processor.name).set(self._count)
+        metrics.processor_backlog.labels(processor=self.processor.name).set(len(self.backlog))
+
+    def _schedule_retry(self):
+        if self._clock is None:
+            from twisted.internet import reactor
+
+            self._clock = reactor
+        log.info("Retry processor %s in %.0f seconds", self.processor.name, self._delay)
+        self._retry = self._clock.callLater(self._delay, self._replay)
+
+    def _replay(self):
+        """Replay the backlog, oldest connection first; the first commit doubles as the health probe."""
+        self._retry = None
+        if self._inflight:
+            # commits begun before the processor was parked have not finished yet
+            self._schedule_retry()
+            return
+        self.state = self.REPLAYING
+        while self.state == self.REPLAYING:
+            entry = self.backlog.popleft()
+            metrics.processor_backlog.labels(processor=self.processor.name).set(len(self.backlog))
+            if entry is None:
+                self._close()
+                return
+            d = defer.succeed(None)
+            for trans in entry.transactions():
+                d.addCallback(lambda _, trans=trans: self.processor.commit(trans))
+                d.addCallback(entry.committed, trans)
+            # marked by _replayed, or here if the processor has not finished yet
+            done = []
+            d.addBoth(self._replayed, entry, done)
+            if not done:
+                done.append(False)
+                return
+
+    def _replayed(self, result, entry, done):
+        inline = not done
+        done.append(True)
+        if isinstance(result, Failure):
+            self._reopen(result, entry)
+        elif not inline:
+            self._replay()
+
+    def _reopen(self, err, entry):
+        log.error("Processor %s still failing: %s", self.processor.name, err)
+        self.backlog.appendleft(entry)
+        metrics.processor_backlog.labels(processor=self.processor.name).set(len(self.backlog))
+        self.state = self.OPEN
+        self._delay = min(self._delay * 2, self.retry_max)
+        self._schedule_retry()
+
+    def _close(self):
+        log.info(
+            "Processor %s recovered, replayed its backlog of %d transactions",
+            self.processor.name,
+            self.backlog.received,
+        )
+        self.backlog.received = 0
+        self.state = self.CLOSED
+        self._delay = self.retry_interval
+        metrics.processor_parked.labels(processor=self.processor.name).set(0)
+        self._next()
+
+
 class ProcessorController(service.MultiService):
     defaults = {}
     paths = ["/etc/recceiver.conf", "~/.recceiver.conf"]
@@ -92,6 +471,8 @@ class ProcessorController(service.MultiService):
             plugs[plug.name] = plug
 
         self.procs = []
+        # processor -> ProcessorQueue
+        self.queues = {}
 
         for P in pnames:
             P = P.strip()
@@ -104,9 +485,18 @@ class ProcessorController(service.MultiService):
             if not parser.has_section(instname):
                 parser.add_section(instname)
 
-            inst = plug.build(instname, ConfigAdapter(parser, instname))
+            conf = ConfigAdapter(parser, instname)
+            inst = plug.build(instname, conf)
 
             self.procs.append(inst)
+            self.queues[inst] = ProcessorQueue(
+                inst,
+                maxsize=conf.getint("queueSize", 1000),
+                synchronous=conf.getboolean("waitForCommit", False),
+                retry_interval=float(conf.get("retryInterval", "30")),
+                retry_max=float(conf.get("retryMaxInterval", "600")),
+                max_in_flight=conf.getint("maxInFlight", 64),
+            )
             self.addService(inst)
 
         self._C = parser
@@ -116,19 +506,34 @@ class ProcessorController(service.MultiService):
             raise KeyError("No section")
         return ConfigAdapter(self._C, section)
 
-    def commit(self, trans):
-        def punish(err, processor):
-            if err.check(defer.CancelledError):
-                log.debug("Cancel processing: %s: %s", processor.name, trans)
-                return err
-            try:
-                self.procs.remove(processor)
-                log.error("Remove processor: %s: %s", processor.name, err)
-            except ValueError:
-                log.debug("Remove processor: %s: already removed", processor.name)
-            return err
+    def stopService(self):
+        for processor, queue in self.queues.items():
+            dropped = queue.clear()
+            if dropped:
+                log.warning("Drop %d queued or parked transactions of processor %s", dropped, processor.name)
+        return service.MultiService.stopService(self)
 
-        defers = [defer.maybeDeferred(P.commit, trans).addErrback(punish, P) for P in self.procs]
+    def commit(self, trans):
+        """Queue trans for every processor.
+
+        The returned Deferred fires once the synchronous processors have
+        committed trans, or parked it after a failure, and no processor
+        queue is full.
+        """
+        defers, puts = [], []
+        for P in self.procs:
+            queue = self.queues[P]
+            d = queue.put(trans)
+            puts.append(d)
+            if queue.synchronous:
+                defers.append(d)
+            else:
+                d.addErrback(lambda err: err.trap(defer.CancelledError))
+            defers.append(queue.room())
+
+        trace = getattr(trans, "trace", None)
+        if trace is not None:
+            defer.DeferredList(puts).addBoth(lambda _: trace.finish())
 
         def find_first_error(result_list):
             for success, result in result_list:
@@ -140,15 +545,42 @@ class ProcessorController(service.MultiService):
 
 @implementer(interfaces.IProcessor)
 class ShowProcessor(service.Service):
+    """Prints transactions to the daemon log, or dumps them to a file when output is set."""
+
     def __init__(self, name, opts):
         self.name = name
         self.lock = defer.DeferredLock()
+        self.writer = None
+        self.sample = 1.0
+        output = opts.get("output")
+        if output:
+            fmt = opts.get("format", "ndjson")
+            if fmt not in showfile.FORMATS:
+                raise ValueError("Show processor '%s': unknown format '%s'" % (name, fmt))
+            self.writer = showfile.DumpWriter(
+                output,
+                showfile.FORMATS[fmt],
+                max_bytes=opts.getint("maxBytes", 64 * 1024 * 1024),
+                backup_count=opts.getint("backupCount", 5),
+                buffer_size=opts.getint("bufferSize", 10000),
+            )
+            self.sample = float(opts.get("sample", "1.0"))
 
     def startService(self):
         service.Service.startService(self)
-        log.info("Show processor '%s' starting", self.name)
+        if self.writer is not None:
+            self.writer.start()
+            log.info("Show processor '%s' starting, writing to %s", self.name, self.writer.path)
+        else:
+            log.info("Show processor '%s' starting", self.name)
 
     def commit(self, transaction):
+        if self.writer is not None:
+            if self.sample >= 1.0 or random.random() < self.sample:
+                if not self.writer.put(transaction):
+                    metrics.show_dropped_total.labels(processor=self.name).inc()
+            return defer.succeed(None)
+
         def with_lock(_ignored):
             # Why doesn't coiterate() just handle cancellation!?
             t = task.cooperate(self._commit(transaction))
@@ -189,6 +621,10 @@ class ShowProcessor(service.Service):
     def stopService(self):
         service.Service.stopService(self)
         log.info("Show processor '%s' stopping", self.name)
+        if self.writer is not None:
+            if self.writer.dropped:
+                log.warning("Show processor '%s' dropped %d transactions", self.name, self.writer.dropped)
+            return threads.deferToThread(self.writer.close)
 
 
 @implementer(plugin.IPlugin, interfaces.IProcessorFactory)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""Reactor lag probe, and an on-demand profiler served on the metrics site.
+
+LagProbe schedules a call every interval and observes how late it runs
+in the recceiver_reactor_lag_seconds histogram: a busy reactor thread
+delays every other connection, timer and commit callback by as much.
+
+With profiling enabled in the [recceiver] section the metrics site also
+serves
+
+    GET /profile?seconds=N&format=collapsed&interval=MS
+
+which samples the stacks of the reactor thread and of the Twisted thread
+pools (the reactor pool, where the CF processor commits, and the
+connection pool of the db processor) every MS milliseconds for N
+seconds, and returns them as collapsed stacks ("frame;frame;... count"
+lines, as read by flamegraph.pl and speedscope), or
+
+    GET /profile?seconds=N&format=pstats
+
+which runs cProfile for N seconds and returns the stats in the format of
+pstats.Stats.dump_stats(). From Python 3.12 the profile covers every
+thread. Before, it covers the reactor thread and each job submitted to
+the reactor thread pool, merged; pool jobs already queued or running when
+the profile starts, or still running when it ends, are left out there.
+One profile runs at a time.
+"""
+
+import collections
+import cProfile
+import logging
+import marshal
+import pstats
+import sys
+import threading
+import time
+
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET
+
+from . import metrics
+from .webutil import error, query_args
+
+log = logging.getLogger(__name__)
+
+__all__ = ["LagProbe", "PoolProfile", "ProfileResource", "StackSampler"]
+
+
+class LagProbe(object):
+    """Observes the delay of a call scheduled every interval seconds."""
+
+    def __init__(self, clock, interval=1.0):
+        self.clock, self.interval = clock, interval
+        self.last = 0.0
+        self._call = None
+
+    def start(self):
+        self._schedule()
+
+    def stop(self):
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def _schedule(self):
+        self._expected = self.clock.seconds() + self.interval
+        self._call = self.clock.callLater(self.interval, self._tick)
+
+    def _tick(self):
+        self.last = max(self.clock.seconds() - self._expected, 0.0)
+        metrics.reactor_lag_seconds.observe(self.last)
+        self._schedule()
+
+
+def _frame_name(code):
+    return "%s (%s:%d)" % (code.co_name, code.co_filename, code.co_firstlineno)
+
+
+class StackSampler(object):
+    """Counts the stacks of the reactor thread and of the Twisted thread pools.
+
+    reactor_ident is the thread id of the reactor. Pool threads are
+    recognized by the name Twisted gives them, "PoolThread-<pool>-<n>":
+    the threads of the reactor pool are counted together as threadpool,
+    those of other pools (such as the adbapi.ConnectionPool of the db
+    processor) under the name of their pool.
+    """
+
+    pool_prefix = "PoolThread-"
+    reactor_pool = "twisted.internet.reactor"
+
+    def __init__(self, reactor_ident, interval=0.005):
+        self.reactor_ident, self.interval = reactor_ident, interval
+
+    def _label(self, ident, names):
+        if ident == self.reactor_ident:
+            return "reactor"
+        name = names.get(ident, "")
+        if not name.startswith(self.pool_prefix):
+            return None
+        pool = name[len(self.pool_prefix) :].rpartition("-")[0]
+        return "threadpool" if pool == self.reactor_pool else pool or None
+
+    def sample(self, seconds):
+        """Sample for seconds from the calling thread; returns a Counter of stack lines."""
+        counts = collections.Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                label = self._label(ident, names) if ident != me else None
+                if label is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(label)
+                counts[";".join(reversed(stack))] += 1
+            if time.monotonic() >= deadline:
+                return counts
+            time.sleep(self.interval)
+
+
+class PoolProfile(object):
+    """Runs each job submitted to a thread pool under its own cProfile.Profile.
+
+    cProfile only sees the thread it is enabled in, so the jobs are wrapped
+    while installed, and their profiles are collected for pstats.Stats.add().
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def install(self):
+        submit = self.pool.callInThreadWithCallback
+
+        def profiled(onResult, func, *args, **kwargs):
+            return submit(onResult, self._wrap(func), *args, **kwargs)
+
+        # callInThread() goes through callInThreadWithCallback() as well
+        self.pool.callInThreadWithCallback = profiled
+
+    def uninstall(self):
+        """Stop wrapping new jobs; returns the profiles of the jobs that have finished."""
+        del self.pool.callInThreadWithCallback
+        with self._lock:
+            return list(self.profiles)
+
+    def _wrap(self, func):
+        def run(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is active, the job must run all the same
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self.profiles.append(profile)
+
+        return run
+
+
+def collapsed(counts):
+    """counts as collapsed stack lines, the most frequent first."""
+    return "".join("%s %d\n" % (stack, count) for stack, count in counts.most_common())
+
+
+class ProfileResource(Resource):
+    """Serves time-bounded profiles of the reactor, see the module docstring.
+
+    Must be created on the reactor thread.
+    """
+
+    isLeaf = True
+
+    def __init__(self, reactor, max_seconds=60.0, threadpool=None):
+        Resource.__init__(self)
+        self.reactor, self.max_seconds = reactor, max_seconds
+        # profiled along with the reactor thread by format=pstats
+        self.threadpool = threadpool
+        self.reactor_ident = threading.get_ident()
+        self.busy = False
+        # thread of the running collapsed profile, if any
+        self.thread = None
+
+    def render_GET(self, request):
+        try:
+            args = query_args(request)
+        except ValueError:
+            return error(request, 400, "query arguments must be UTF-8")
+        try:
+            seconds = float(args.get("seconds", "10"))
+            interval = float(args.get("interval", "5")) / 1000.0
+        except ValueError:
+            return error(request, 400, "seconds and interval must be numbers")
+        if not 0 < seconds <= self.max_seconds or interval <= 0:
+            return error(request, 400, "seconds must be in (0, %g] and interval positive" % self.max_seconds)
+        fmt = args.get("format", "collapsed")
+        if fmt not in ("collapsed", "pstats"):
+            return error(request, 400, "format must be collapsed or pstats")
+        if self.busy:
+            return error(request, 409, "a profile is already running")
+
+        self.busy = True
+        log.info("Profiling for %g s (%s)", seconds, fmt)
+        # the profile runs to its end anyway, but is not sent to a client gone meanwhile
+        lost = []
+        request.notifyFinish().addErrback(lambda _: lost.append(True))
+        if fmt == "pstats":
+            self._profile(request, lost, seconds)
+        else:
+            self._sample(request, lost, seconds, interval)
+        return NOT_DONE_YET
+
+    def _profile(self, request, lost, seconds):
+        # From Python 3.12 cProfile sees every thread, and allows one profiler at a time
+        per_thread = sys.version_info < (3, 12)
+        pool = PoolProfile(self.threadpool) if per_thread and self.threadpool is not None else None
+        if pool is not None:
+            pool.install()
+        profile = cProfile.Profile()
+        profile.enable()
+
+        def done():
+            profile.disable()
+            stats = pstats.Stats(profile)
+            if pool is not None:
+                for job in pool.uninstall():
+                    stats.add(job)
+            request.setHeader(b"Content-Type", b"application/octet-stream")
+            request.setHeader(b"Content-Disposition", b'attachment; filename="recceiver.pstats"')
+            self._finish(request, lost, marshal.dumps(stats.stats))
+
+        self.reactor.callLater(seconds, done)
+
+    def _sample(self, request, lost, seconds, interval):
+        sampler = StackSampler(self.reactor_ident, interval)
+
+        def run():
+            counts = sampler.sample(seconds)
+            self.reactor.callFromThread(done, counts)
+
+        def done(counts):
+            request.setHeader(b"Content-Type", b"text/plain; charset=utf-8")
+            self._finish(request, lost, collapsed(counts).encode())
+
+        self.thread = threading.Thread(target=run, name="recceiver-profiler", daemon=True)
+        self.thread.start()
+
+    def _finish(self, request, lost, body):
+        self.busy = False
+        if lost:
+            return
+        request.write(body)
+        request.finish()
@@ -10,6 +10,7 @@ from twisted.internet.interfaces import IAddress
 from twisted.protocols import stateful
 from zope.interface import implementer
 
+from . import metrics
 from .interfaces import ITransaction
 from .protocol import messages
 
@@ -17,10 +18,25 @@ log = logging.getLogger(__name__)
 
 _PROTOCOL_ERROR_MSG = "Protocol error! %s"
 
+# metric label of each client message type
+_MESSAGE_NAMES = {
+    cls.msg_id: cls.__name__
+    for cls in (
+        messages.ClientGreeting,
+        messages.Pong,
+        messages.AddRecord,
+        messages.DelRecord,
+        messages.UploadDone,
+        messages.AddInfo,
+    )
+}
+
 
 class CastReceiver(stateful.StatefulProtocol):
     timeout = 3.0
     version = 0
+    # messages counted before the ingest metrics are updated
+    metricsBatch = 1000
 
     def __init__(self, active=True):
         from twisted.internet import reactor
@@ -29,6 +45,14 @@ class CastReceiver(stateful.StatefulProtocol):
 
         self.sess, self.active = None, active
         self.uploadSize, self.uploadStart = 0, 0
+        # session id in the capture file of the factory, if any
+        self.captureId = None
+        self.pingSent = None
+
+        # ingest counts not yet added to the metrics, see flushMetrics()
+        self._bytesCounted, self._framesCounted = 0, 0
+        self._frames = collections.Counter()
+        self._errors = collections.Counter()
 
         self.rxfn = collections.defaultdict(self.dfact)
 
@@ -41,6 +65,11 @@ class CastReceiver(stateful.StatefulProtocol):
 
     def dataReceived(self, data):
         self.uploadSize += len(data)
+        capture = self.factory.capture
+        if capture is not None:
+            if self.captureId is None:
+                self.captureId = capture.open(self.transport.getPeer())
+            capture.data(self.captureId, data)
         stateful.StatefulProtocol.dataReceived(self, data)
 
     def connectionMade(self):
@@ -55,7 +84,10 @@ class CastReceiver(stateful.StatefulProtocol):
             self.transport.pauseProducing()
 
     def connectionLost(self, reason=protocol.connectionDone):
+        self.flushMetrics()
         self.factory.isDone(self, self.active)
+        if self.captureId is not None:
+            self.factory.capture.close(self.captureId)
         if self._ping_timer and self._ping_timer.active():
             self._ping_timer.cancel()
         del self._ping_timer
@@ -76,20 +108,45 @@ class CastReceiver(stateful.StatefulProtocol):
             self.restartPingTimer()
             self.phase = 2
             self.nonce = random.randint(0, 0xFFFFFFFF)
+            self.pingSent = time.time()
             self.transport.write(messages.Ping(self.nonce).frame())
             log.debug("ping nonce: %s", self.nonce)
 
     def getInitialState(self):
         return (self.recvHeader, messages.Header.payload.size)
 
+    def flushMetrics(self):
+        """Add the counts accumulated since the last call to the ingest metrics.
+
+        Counting in plain attributes and updating the metrics once per
+        metricsBatch messages keeps the per-message cost to a dict update.
+        """
+        metrics.received_bytes_total.inc(self.uploadSize - self._bytesCounted)
+        self._bytesCounted = self.uploadSize
+        for msg_id, count in self._frames.items():
+            metrics.frames_total.labels(message=_MESSAGE_NAMES.get(msg_id, "unknown")).inc(count)
+        for name, count in self._errors.items():
+            metrics.protocol_errors_total.labels(message=name).inc(count)
+        self._frames.clear()
+        self._errors.clear()
+        self._framesCounted = 0
+
+    def protocolError(self, msg_cls):
+        self._errors[msg_cls.__name__] += 1
+
     def recvHeader(self, data):
         self.restartPingTimer()
         try:
             header = messages.Header.decode(data)
         except messages.ProtocolError as exc:
+            self.protocolError(messages.Header)
             log.exception(_PROTOCOL_ERROR_MSG, exc)
             self.transport.loseConnection()
             return
+        self._frames[header.msg_id] += 1
+        self._framesCounted += 1
+        if self._framesCounted >= self.metricsBatch:
+            self.flushMetrics()
         if header.body_length == 0:
             log.debug("Ignoring empty message %#06x", header.msg_id)
             return self.getInitialState()
@@ -105,6 +162,7 @@ class CastReceiver(stateful.StatefulProtocol):
         try:
             greeting = messages.ClientGreeting.decode(body)
         except messages.ProtocolError as exc:
+            self.protocolError(messages.ClientGreeting)
             log.exception(_PROTOCOL_ERROR_MSG, exc)
             self.transport.loseConnection()
             return
@@ -122,6 +180,7 @@ class CastReceiver(stateful.StatefulProtocol):
         try:
             pong = messages.Pong.decode(body)
         except messages.ProtocolError as exc:
+            self.protocolError(messages.Pong)
             log.exception(_PROTOCOL_ERROR_MSG, exc)
             self.transport.loseConnection()
             return
@@ -130,6 +189,7 @@ class CastReceiver(stateful.StatefulProtocol):
             self.transport.loseConnection()
         else:
             log.debug("pong nonce match")
+            metrics.ping_rtt_seconds.observe(time.time() - self.pingSent)
             self.phase = 1
         return self.getInitialState()
 
@@ -138,6 +198,7 @@ class CastReceiver(stateful.StatefulProtocol):
         try:
             info = messages.AddInfo.decode(body)
         except messages.ProtocolError:
+            self.protocolError(messages.AddInfo)
             log.error("Ignoring info update")
             return self.getInitialState()
         if info.record_id:
@@ -151,6 +212,7 @@ class CastReceiver(stateful.StatefulProtocol):
         try:
             record = messages.AddRecord.decode(body)
         except messages.ProtocolError:
+            self.protocolError(messages.AddRecord)
             log.error("Ignoring record update")
             return self.getInitialState()
         if record.is_alias:
@@ -165,6 +227,7 @@ class CastReceiver(stateful.StatefulProtocol):
         try:
             record = messages.DelRecord.decode(body)
         except messages.ProtocolError:
+            self.protocolError(messages.DelRecord)
             log.error("Ignoring delete record update")
             return self.getInitialState()
         self.sess.del_record(record.record_id)
@@ -175,6 +238,7 @@ class CastReceiver(stateful.StatefulProtocol):
         try:
             messages.UploadDone.decode(body)
         except messages.ProtocolError:
+            self.protocolError(messages.UploadDone)
             log.error("Ignoring done update")
             return self.getInitialState()
         self.factory.isDone(self, self.active)
@@ -183,6 +247,11 @@ class CastReceiver(stateful.StatefulProtocol):
             self.writePing()
 
         elapsed_s = time.time() - self.uploadStart
+        self.flushMetrics()
+        metrics.upload_duration_seconds.observe(elapsed_s)
+        metrics.upload_bytes.observe(self.uploadSize)
+        if self.factory.iocstats is not None:
+            self.factory.iocstats.uploaded(self.sess.transaction.srcid, self.uploadSize, elapsed_s)
         size_kb = self.uploadSize / 1024
         rate_kbs = size_kb / elapsed_s
         log.info(
@@ -224,6 +293,8 @@ class Transaction:
         self.records_to_add, self.client_infos, self.record_infos_to_add = {}, {}, {}
         self.aliases = collections.defaultdict(list)
         self.records_to_delete = set()
+        self.trace = None
+        self.stats = None
 
     def show(self):
         log.info(str(self))
@@ -251,6 +322,19 @@ class Transaction:
         )
 
 
+def _observe_transaction(transaction):
+    """Add the entry counts of a transaction to the ingest metrics."""
+    counts = (
+        ("record", len(transaction.records_to_add)),
+        ("alias", sum(len(names) for names in transaction.aliases.values())),
+        ("info", sum(len(infos) for infos in transaction.record_infos_to_add.values())),
+        ("delete", len(transaction.records_to_delete)),
+    )
+    for kind, count in counts:
+        metrics.transaction_items.labels(kind=kind).observe(count)
+    metrics.transaction_size.observe(sum(count for _, count in counts))
+
+
 class CollectionSession:
     timeout = 5.0
     trlimit = 5000
@@ -277,6 +361,7 @@ class CollectionSession:
         # once all preceding commits have finished.
         self.transaction = Transaction(self.ep, id(self))
         self.transaction.connected = False
+        self._start_trace()
         self.dirty = True
         self.flush()
 
@@ -289,8 +374,19 @@ class CollectionSession:
         transaction, self.transaction = self.transaction, Transaction(self.ep, id(self))
         self.transaction.client_infos = dict(transaction.client_infos)
         self.dirty = False
+        if transaction.connected:
+            _observe_transaction(transaction)
+        iocstats = self.factory.iocstats
+        if iocstats is not None:
+            transaction.stats = iocstats.observe(transaction)
+        trace = transaction.trace
+        if trace is not None:
+            flushed = time.time()
+            trace.add("receive", trace.started, flushed)
 
         def commit(_ignored):
+            if trace is not None:
+                trace.add("session.queue", flushed)
             log.info("Commit: %s", transaction)
             return defer.maybeDeferred(self.factory.commit, transaction)
 
@@ -321,8 +417,15 @@ class CollectionSession:
     def mark_dirty(self):
         if not self._flush_deadline:
             self._flush_deadline = time.time() + self.timeout
+        if not self.dirty:
+            self._start_trace()
         self.dirty = True
 
+    def _start_trace(self):
+        tracer = self.factory.tracer
+        if tracer is not None and self.transaction.trace is None:
+            self.transaction.trace = tracer.new_trace()
+
     def done(self):
         self.flush()
 
@@ -361,6 +464,12 @@ class CastFactory(protocol.ServerFactory):
     session = CollectionSession
 
     maxActive = 3
+    # CaptureFile receiving the raw streams of the connections
+    capture = None
+    # tracing.Tracer of the transactions, if enabled
+    tracer = None
+    # iocstats.IOCStats updated by the sessions, if any
+    iocstats = None
 
     def __init__(self):
         # Flow control by limiting the number of concurrent
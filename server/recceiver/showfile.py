@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Transaction dumps of the show processor, written to a rotating file.
+
+Formatting and writing happen on a background thread; the reactor only
+queues the transactions. When the queue is full, transactions are
+dropped rather than holding up ingest.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+__all__ = ["DumpWriter", "format_db", "format_ndjson", "FORMATS"]
+
+
+def format_ndjson(trans, stamp):
+    """One JSON object per transaction, on one line."""
+    address = trans.source_address
+    dump = {
+        "time": stamp,
+        "host": address.host,
+        "port": address.port,
+        "srcid": trans.srcid,
+        "connected": trans.connected,
+        "initial": trans.initial,
+        "infos": trans.client_infos,
+        "records": [
+            {
+                "id": recid,
+                "name": name,
+                "type": rtype,
+                "aliases": trans.aliases.get(recid, []),
+                "infos": trans.record_infos_to_add.get(recid, {}),
+            }
+            for recid, (name, rtype) in trans.records_to_add.items()
+        ],
+        "deleted": sorted(trans.records_to_delete),
+    }
+    return json.dumps(dump) + "\n"
+
+
+def format_db(trans, stamp):
+    """The transaction as EPICS database file syntax, as logged by the show processor."""
+    address = trans.source_address
+    lines = [
+        "# %s From %s:%s" % (time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(stamp)), address.host, address.port)
+    ]
+    if not trans.connected:
+        lines.append("#  connection lost")
+    for key, value in trans.client_infos.items():
+        lines.append("epicsEnvSet('%s','%s')" % (key, value))
+    for recid, (name, rtype) in trans.records_to_add.items():
+        lines.append('record(%s, "%s") {' % (rtype, name))
+        for alias in trans.aliases.get(recid, []):
+            lines.append(' alias("%s")' % alias)
+        for key, value in trans.record_infos_to_add.get(recid, {}).items():
+            lines.append(' info(%s,"%s")' % (key, value))
+        lines.append("}")
+    for recid in sorted(trans.records_to_delete):
+        lines.append("# deleted %d" % recid)
+    lines.append("# End")
+    return "\n".join(lines) + "\n"
+
+
+FORMATS = {"ndjson": format_ndjson, "db": format_db}
+
+
+class DumpWriter(object):
+    """Writes formatted transactions to path from a thread of its own.
+
+    formatter(trans, stamp) returns text, or bytes for a binary file;
+    header is written at the start of every new file. The file is
+    rotated like logging.handlers.RotatingFileHandler: once it would
+    grow past max_bytes it is renamed to path.1, path.1 to path.2 and
+    so on, keeping backup_count old files. A max_bytes of 0 never
+    rotates, and a buffer_size of 0 never drops.
+    """
+
+    def __init__(self, path, formatter, max_bytes=64 * 1024 * 1024, backup_count=5, buffer_size=10000, header=b""):
+        self.path, self.formatter, self.header = path, formatter, header
+        self.max_bytes, self.backup_count = max_bytes, backup_count
+        self._queue = queue.Queue(buffer_size)
+        self._thread = None
+        self._file = None
+        self._size = 0
+        self.dropped = 0
+
+    def start(self):
+        self._open("ab")
+        self._thread = threading.Thread(target=self._run, name="show %s" % self.path, daemon=True)
+        self._thread.start()
+
+    def put(self, trans):
+        """Queue trans for writing; returns False if it was dropped."""
+        try:
+            self._queue.put_nowait((trans, time.time()))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self):
+        """Write what is queued, then stop the thread. Blocks until done."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            # write what has accumulated, then flush once
+            while item is not None:
+                try:
+                    self._write(self.formatter(*item))
+                except Exception:
+                    log.exception("Failed to write transaction dump to %s", self.path)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._file.flush()
+            if item is None:
+                return
+
+    def _open(self, mode):
+        self._file = open(self.path, mode, buffering=1024 * 1024)
+        self._size = os.fstat(self._file.fileno()).st_size
+        if self._size == 0 and self.header:
+            self._file.write(self.header)
+            self._size = len(self.header)
+
+    def _write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if self.max_bytes and self._size > len(self.header) and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        for n in range(self.backup_count - 1, 0, -1):
+            source = "%s.%d" % (self.path, n)
+            if os.path.exists(source):
+                os.replace(source, "%s.%d" % (self.path, n + 1))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path + ".1")
+        self._open("wb")
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Per-transaction timing spans, from the first message received to the processor commits.
+
+With tracing enabled in the [recceiver] section, each transaction of a
+CollectionSession carries a Trace. Its spans are
+
+    receive           first message of the transaction until it is flushed
+    session.queue     waiting behind earlier commits of the same IOC
+    queue:<proc>      waiting in the queue of processor <proc>
+    commit:<proc>     the commit of processor <proc>
+    cf.lock           waiting for the CF processor lock
+    cf.<call>         each ChannelFinder request made by the commit
+
+Once every processor is done with the transaction the span durations
+are observed in the recceiver_span_seconds histogram and, if traceFile
+is set, the trace is written to it as one line of OpenTelemetry (OTLP)
+JSON by a background thread.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from . import metrics, showfile
+
+__all__ = ["Tracer", "Trace", "activate", "current", "span"]
+
+# trace of the transaction being committed by this thread, for spans deeper in the call stack
+_local = threading.local()
+
+
+class Span(object):
+    __slots__ = ("name", "start", "end", "span_id", "attributes")
+
+    def __init__(self, name, start, end, attributes):
+        self.name, self.start, self.end = name, start, end
+        self.span_id = os.urandom(8).hex()
+        self.attributes = attributes
+
+
+class Trace(object):
+    """The spans of one transaction. Times are from time.time()."""
+
+    def __init__(self, tracer, started=None):
+        self.tracer = tracer
+        self.trace_id = os.urandom(16).hex()
+        self.started = time.time() if started is None else started
+        self.spans = []
+        self.finished = False
+
+    def add(self, name, start, end=None, **attributes):
+        span = Span(name, start, time.time() if end is None else end, attributes)
+        self.spans.append(span)
+        return span
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            self.tracer.finish(self)
+
+
+def current():
+    """The trace activated in this thread, or None."""
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def activate(trace):
+    """Make trace current in this thread for the duration of the block.
+
+    The block must not yield to the reactor, or the trace would be current
+    in whatever else runs on the thread meanwhile.
+    """
+    previous, _local.trace = current(), trace
+    try:
+        yield
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time the block as a span of the current trace, if any."""
+    trace = current()
+    if trace is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        trace.add(name, start, **attributes)
+
+
+def otlp_json(trace, stamp):
+    """trace as an OTLP/JSON ExportTraceServiceRequest, on one line."""
+
+    def attributes(values):
+        return [{"key": key, "value": {"stringValue": str(value)}} for key, value in values.items()]
+
+    root = Span("transaction", trace.started, max((s.end for s in trace.spans), default=stamp), {})
+    spans = [
+        {
+            "traceId": trace.trace_id,
+            "spanId": root.span_id,
+            "name": root.name,
+            "kind": 1,
+            "startTimeUnixNano": int(root.start * 1e9),
+            "endTimeUnixNano": int(root.end * 1e9),
+            "attributes": [],
+        }
+    ]
+    spans.extend(
+        {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": root.span_id,
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": int(s.start * 1e9),
+            "endTimeUnixNano": int(s.end * 1e9),
+            "attributes": attributes(s.attributes),
+        }
+        for s in trace.spans
+    )
+    request = {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": attributes({"service.name": "recceiver"})},
+                "scopeSpans": [{"scope": {"name": "recceiver"}, "spans": spans}],
+            }
+        ]
+    }
+    return json.dumps(request) + "\n"
+
+
+class Tracer(object):
+    """Creates the traces of sampled transactions and exports the finished ones."""
+
+    def __init__(self, path=None, sample=1.0, max_bytes=64 * 1024 * 1024, backup_count=5):
+        self.sample = sample
+        self.writer = showfile.DumpWriter(path, otlp_json, max_bytes, backup_count) if path else None
+
+    def start(self):
+        if self.writer is not None:
+            self.writer.start()
+
+    def stop(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def new_trace(self, started=None):
+        """A Trace, or None if the transaction is not sampled."""
+        if self.sample < 1.0 and random.random() >= self.sample:
+            return None
+        return Trace(self, started)
+
+    def finish(self, trace):
+        for s in trace.spans:
+            metrics.span_seconds.labels(span=s.name).observe(s.end - s.start)
+        if self.writer is not None:
+            self.writer.put(trace)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""Helpers shared by the JSON resources of the metrics site."""
+
+import json
+
+__all__ = ["query_args", "error"]
+
+
+def query_args(request):
+    """The query arguments of request as str, the last value of each.
+
+    Raises UnicodeDecodeError, a ValueError, when one is not UTF-8.
+    """
+    return {k.decode(): v[-1].decode() for k, v in request.args.items()}
+
+
+def error(request, code, message):
+    """Set the response code of request and return the JSON body reporting message."""
+    request.setResponseCode(code)
+    request.setHeader(b"Content-Type", b"application/json")
+    return json.dumps({"error": message}).encode()
@@ -0,0 +1,167 @@
+"""Benchmark CFProcessor.commit() against a fake ChannelFinder.
+
+Drives a synthetic IOC fleet through CFProcessor.commit() and reports
+commits/s, ChannelFinder calls and peak RSS per phase:
+
+    initial  every IOC connects and uploads its records
+    storm    every IOC disconnects, then every IOC reconnects (--storm)
+
+By default the processor talks to an in-process MockCFAdapter through the
+threaded pyCFClient code path. With --http it uses the Agent client against
+a local HTTP ChannelFinder stand-in on the same reactor.
+
+    python -m tests.benchmark.bench_cf_processor --iocs 200 --records 2000 --alias-ratio 0.1 --storm
+"""
+
+import argparse
+import json
+import logging
+import resource
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List
+
+from twisted.internet import defer, task
+
+from recceiver.cf.processor import CFProcessor
+from tests.benchmark.cf_server import MockCFResource, listen
+from tests.benchmark.fleet import Fleet
+from tests.unit.cf.mock_adapter import MockCFAdapter
+from tests.unit.conftest import make_adapter
+
+
+@dataclass
+class PhaseResult:
+    phase: str
+    commits: int
+    seconds: float
+    commits_per_second: float
+    cf_calls: int
+    peak_rss_mib: float
+
+
+def peak_rss_mib() -> float:
+    """Peak resident set size of this process so far."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux but bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def make_processor(fleet: Fleet, options: argparse.Namespace, base_url: str = None) -> CFProcessor:
+    values = {
+        "recceiverId": "bench",
+        "alias": str(fleet.alias_ratio > 0),
+        "infotags": " ".join(fleet.info_tag_names),
+        "cleanOnStart": "False",
+        "cleanOnStop": "False",
+        "statusInterval": "0",
+        "pushMaxRetries": "1",
+        "findSizeLimit": str(options.size_limit),
+        "nameLookup": options.name_lookup,
+    }
+    if base_url:
+        values.update(cfClient="agent", baseUrl=base_url, cfMaxConnections=str(options.max_connections))
+    return CFProcessor("bench", make_adapter(values=values))
+
+
+@defer.inlineCallbacks
+def run_phase(name: str, proc: CFProcessor, transactions, calls: Callable[[], int]):
+    before = calls()
+    start = time.perf_counter()
+    count = 0
+    for tr in transactions:
+        yield proc.commit(tr)
+        count += 1
+    seconds = time.perf_counter() - start
+    return PhaseResult(name, count, seconds, count / seconds if seconds else 0.0, calls() - before, peak_rss_mib())
+
+
+@defer.inlineCallbacks
+def run(reactor, fleet: Fleet, options: argparse.Namespace):
+    port = None
+    if options.http:
+        cf = MockCFResource(latency=options.latency, reactor=reactor)
+        port = listen(cf, reactor=reactor)
+        proc = make_processor(fleet, options, f"http://127.0.0.1:{port.getHost().port}/ChannelFinder")
+        proc.startService()
+        # Commits queue on the processor lock until the async start-up has registered the CF properties.
+
+        def calls():
+            return sum(cf.requests.values())
+
+    else:
+        adapter = MockCFAdapter(latency=options.latency)
+        proc = make_processor(fleet, options)
+        proc.client = adapter
+        proc.startService()
+        proc._setup_cf_properties(set(adapter.get_property_names()))
+
+        def calls():
+            return sum(adapter.calls.values())
+
+    results = [(yield run_phase("initial", proc, (fleet.upload(i) for i in range(fleet.iocs)), calls))]
+    if options.storm:
+        results.append((yield run_phase("disconnect", proc, (fleet.disconnect(i) for i in range(fleet.iocs)), calls)))
+        results.append((yield run_phase("reconnect", proc, (fleet.upload(i) for i in range(fleet.iocs)), calls)))
+
+    yield proc.stopService()
+    if port is not None:
+        yield port.stopListening()
+    return results
+
+
+def report(fleet: Fleet, options: argparse.Namespace, results: List[PhaseResult]) -> Dict:
+    return {
+        "fleet": asdict(fleet),
+        "client": "agent+http" if options.http else "in-process",
+        "latency": options.latency,
+        "phases": [asdict(r) for r in results],
+    }
+
+
+def print_table(results: List[PhaseResult]) -> None:
+    print(f"{'phase':<12}{'commits':>9}{'seconds':>10}{'commits/s':>11}{'cf calls':>10}{'peak RSS MiB':>14}")
+    for r in results:
+        print(
+            f"{r.phase:<12}{r.commits:>9}{r.seconds:>10.2f}{r.commits_per_second:>11.1f}"
+            f"{r.cf_calls:>10}{r.peak_rss_mib:>14.1f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iocs", type=int, default=50, help="number of IOCs in the fleet")
+    parser.add_argument("--records", type=int, default=1000, help="records per IOC")
+    parser.add_argument("--alias-ratio", type=float, default=0.0, help="fraction of records with an alias")
+    parser.add_argument("--info-tags", type=int, default=0, help="info tags per record")
+    parser.add_argument("--storm", action="store_true", help="disconnect and reconnect every IOC after the upload")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every ChannelFinder call")
+    parser.add_argument("--http", action="store_true", help="use the Agent client against a local HTTP server")
+    parser.add_argument("--max-connections", type=int, default=16, help="Agent client connection limit")
+    parser.add_argument("--size-limit", type=int, default=10000, help="findSizeLimit for the processor")
+    parser.add_argument("--name-lookup", default="auto", help="nameLookup strategy for the processor")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--log-level", default="ERROR", help="log level while the benchmark runs")
+    options = parser.parse_args(argv)
+    logging.getLogger().setLevel(options.log_level.upper())
+
+    fleet = Fleet(options.iocs, options.records, options.alias_ratio, options.info_tags, options.seed)
+
+    def run_and_report(reactor):
+        d = run(reactor, fleet, options)
+
+        def show(results):
+            if options.json:
+                print(json.dumps(report(fleet, options, results), indent=2))
+            else:
+                print_table(results)
+
+        return d.addCallback(show)
+
+    task.react(run_and_report)
+
+
+if __name__ == "__main__":
+    main()
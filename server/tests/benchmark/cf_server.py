@@ -0,0 +1,135 @@
+"""Local HTTP ChannelFinder stand-in backed by MockCFAdapter.
+
+Implements the subset of the ChannelFinder REST API used by PyCFClientAdapter
+and AgentCFAdapter, so either client can be benchmarked against it.
+"""
+
+import fnmatch
+import json
+from collections import Counter
+from typing import List, Optional
+from urllib.parse import unquote
+
+from twisted.internet import reactor as default_reactor
+from twisted.web import resource, server
+
+from recceiver.cf.model import CFChannel, CFProperty, CFPropertyName
+from tests.unit.cf.mock_adapter import MockCFAdapter
+
+CHANNELS = b"/ChannelFinder/resources/channels"
+PROPERTIES = b"/ChannelFinder/resources/properties"
+
+
+class MockCFResource(resource.Resource):
+    """Serves /ChannelFinder/resources/{channels,properties} from a MockCFAdapter.
+
+    Responses are delayed by latency seconds on the reactor, so a slow
+    ChannelFinder does not block other requests. requests counts the calls
+    made per (method, resource).
+    """
+
+    isLeaf = True
+
+    def __init__(self, adapter: Optional[MockCFAdapter] = None, latency: float = 0.0, reactor=None):
+        super().__init__()
+        self.adapter = adapter or MockCFAdapter()
+        self.latency = latency
+        self.requests: Counter = Counter()
+        self._reactor = reactor or default_reactor
+
+    def render(self, request):
+        path = request.path.rstrip(b"/")
+        try:
+            if path == CHANNELS:
+                kind = "channels"
+                body = self._channels(request)
+            elif path == PROPERTIES:
+                kind = "properties"
+                body = self._property_list(request)
+            elif path.startswith(PROPERTIES + b"/"):
+                kind = "property"
+                body = self._property(request, unquote(path[len(PROPERTIES) + 1 :].decode()))
+            else:
+                request.setResponseCode(404)
+                return b""
+        except (KeyError, ValueError) as exc:
+            request.setResponseCode(400)
+            return str(exc).encode()
+        self.requests[(request.method.decode(), kind)] += 1
+        request.setHeader(b"Content-Type", b"application/json")
+        if not self.latency:
+            return body
+        call = self._reactor.callLater(self.latency, _finish, request, body)
+        request.notifyFinish().addErrback(lambda _: call.active() and call.cancel())
+        return server.NOT_DONE_YET
+
+    def _channels(self, request) -> bytes:
+        if request.method == b"PUT":
+            self.adapter.set_channels([CFChannel.from_dict(ch) for ch in _json_body(request)])
+            return b""
+        if request.method != b"GET":
+            raise ValueError(f"Unsupported method {request.method!r}")
+        args = {k.decode(): v[0].decode() for k, v in request.args.items()}
+        size = int(args.pop("~size", 0))
+        channels = self._query(args)
+        if size:
+            channels = channels[:size]
+        return json.dumps([ch.as_dict() for ch in channels]).encode()
+
+    def _query(self, args) -> List[CFChannel]:
+        if "~name" in args:
+            patterns = args.pop("~name").split("|")
+            exact = [p for p in patterns if not any(c in p for c in "*?")]
+            channels = self.adapter.find_by_names(exact)
+            for pattern in patterns:
+                if pattern not in exact:
+                    channels.extend(
+                        self.adapter._channels[name]
+                        for name in sorted(self.adapter._channels)
+                        if fnmatch.fnmatchcase(name, pattern)
+                    )
+        elif CFPropertyName.IOC_ID.value in args:
+            channels = self.adapter.find_by_ioc_id(args.pop(CFPropertyName.IOC_ID.value))
+        elif CFPropertyName.RECCEIVER_ID.value in args:
+            channels = self.adapter.find_active_for_recceiver(args.pop(CFPropertyName.RECCEIVER_ID.value))
+        else:
+            channels = list(self.adapter._channels.values())
+        return [ch for ch in channels if all(_matches(ch, name, value) for name, value in args.items())]
+
+    def _property_list(self, request) -> bytes:
+        names = self.adapter.get_property_names()
+        return json.dumps([{"name": name, "owner": "admin"} for name in names]).encode()
+
+    def _property(self, request, name: str) -> bytes:
+        payload = _json_body(request)
+        if request.method == b"PUT":
+            self.adapter.set_property(name, payload.get("owner", ""))
+        elif request.method == b"POST":
+            prop = CFProperty(name, payload.get("owner", ""), payload.get("value"))
+            self.adapter.update_property(prop, [ch["name"] for ch in payload.get("channels", [])])
+        else:
+            raise ValueError(f"Unsupported method {request.method!r}")
+        return json.dumps({"name": name, "owner": payload.get("owner", "")}).encode()
+
+
+def _json_body(request):
+    data = request.content.read()
+    return json.loads(data) if data else {}
+
+
+def _matches(channel: CFChannel, name: str, value: str) -> bool:
+    return any(p.name == name and fnmatch.fnmatchcase(p.value or "", value) for p in channel.properties)
+
+
+def _finish(request, body: bytes) -> None:
+    request.write(body)
+    request.finish()
+
+
+def listen(cf_resource: MockCFResource, port: int = 0, interface: str = "127.0.0.1", reactor=None):
+    """Start serving cf_resource over HTTP; returns the IListeningPort.
+
+    The ChannelFinder base URL is http://<interface>:<port>/ChannelFinder.
+    """
+    reactor = reactor or default_reactor
+    return reactor.listenTCP(port, server.Site(cf_resource), interface=interface)
@@ -0,0 +1,52 @@
+"""Shape of a synthetic IOC fleet, shared by the benchmarks."""
+
+import random
+from dataclasses import dataclass
+from typing import List
+
+from twisted.internet.address import IPv4Address
+
+from recceiver.recast import Transaction
+
+RECORD_TYPES = ("ai", "ao", "bi", "bo", "calc", "longin", "mbbi", "stringin")
+
+
+@dataclass
+class Fleet:
+    """Shape of the synthetic IOC fleet."""
+
+    iocs: int = 50
+    records: int = 1000
+    alias_ratio: float = 0.0
+    info_tags: int = 0
+    seed: int = 0
+    env_vars: int = 0
+
+    @property
+    def info_tag_names(self) -> List[str]:
+        return [f"tag{i}" for i in range(self.info_tags)]
+
+    def address(self, index: int) -> IPv4Address:
+        return IPv4Address("TCP", f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}", 5064)
+
+    def upload(self, index: int) -> Transaction:
+        """The initial transaction IOC index sends after connecting."""
+        rng = random.Random(self.seed * 1000003 + index)
+        tr = Transaction(self.address(index), index)
+        tr.initial = True
+        tr.client_infos = {"IOCNAME": f"IOC{index:05d}", "HOSTNAME": f"ioc{index:05d}.example.com"}
+        tr.client_infos.update((f"ENV{i}", f"value{i}") for i in range(self.env_vars))
+        for rec in range(self.records):
+            name = f"IOC{index:05d}:DEV{rec // 100:03d}:PV{rec % 100:02d}"
+            tr.records_to_add[rec] = (name, rng.choice(RECORD_TYPES))
+            if rng.random() < self.alias_ratio:
+                tr.aliases[rec].append(name + ":ALIAS")
+            if self.info_tags:
+                tr.record_infos_to_add[rec] = {tag: f"{tag}-{rec}" for tag in self.info_tag_names}
+        return tr
+
+    def disconnect(self, index: int) -> Transaction:
+        """The transaction sent when IOC index drops its connection."""
+        tr = Transaction(self.address(index), index)
+        tr.connected = False
+        return tr
@@ -0,0 +1,329 @@
+"""Drive a running recceiver with a synthetic RecCaster fleet over TCP.
+
+Every simulated IOC connects, uploads its records, answers pings and,
+for --duration seconds after the uploads, churns its records (DelRecord
+then AddRecord) and reconnects at the given rates. Reports, per phase:
+
+    upload    time from the server greeting to the server's ping after
+              UploadDone (sent once it has parsed the whole upload), and
+              the aggregate upload rate
+    steady    churn messages sent and reconnect uploads
+
+With --metrics, the histograms of the recceiver metrics endpoint
+(eg. commit durations) are scraped before and after the run and their
+mean over the run is reported.
+
+    python -m tests.benchmark.loadgen --port 5049 --iocs 200 --records 2000 --duration 60 --churn 0.5 --reconnect 0.01
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+import urllib.request
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+from twisted.internet import defer, protocol, task, threads
+
+from recceiver.protocol import messages
+from recceiver.recast import Transaction
+from tests.benchmark.fleet import RECORD_TYPES, Fleet
+
+log = logging.getLogger(__name__)
+
+
+def upload_frames(tr: Transaction) -> bytes:
+    """The messages a RecCaster sends for tr, up to and including UploadDone.
+
+    Record ids are shifted by one, as id 0 addresses the IOC itself.
+    """
+    frames = [messages.ClientGreeting(0, 0, 0).frame()]
+    frames.extend(messages.AddInfo(0, key, value).frame() for key, value in tr.client_infos.items())
+    for rec, (name, rtype) in tr.records_to_add.items():
+        frames.append(messages.AddRecord(rec + 1, messages.RecordKind.RECORD, rtype, name).frame())
+        frames.extend(
+            messages.AddRecord(rec + 1, messages.RecordKind.ALIAS, "", alias).frame() for alias in tr.aliases[rec]
+        )
+        frames.extend(
+            messages.AddInfo(rec + 1, key, value).frame() for key, value in tr.record_infos_to_add.get(rec, {}).items()
+        )
+    frames.append(messages.UploadDone().frame())
+    return b"".join(frames)
+
+
+@dataclass
+class Stats:
+    uploads: int = 0
+    upload_bytes: int = 0
+    # seconds from the server greeting to the ping answering UploadDone
+    time_to_done: List[float] = field(default_factory=list)
+    churn_messages: int = 0
+    reconnects: int = 0
+    lost_before_done: int = 0
+
+
+class SimulatedIOC(protocol.Protocol):
+    def __init__(self, index: int, upload: bytes, options: argparse.Namespace, stats: Stats, clock):
+        self.index, self.upload, self.options, self.stats, self.clock = index, upload, options, stats, clock
+        self.rng = random.Random(options.seed * 7919 + index)
+        self.buf = b""
+        self.greeted_at = None
+        self.done = False
+        self.calls = []
+        self.churn = None
+        # ids of the records the server holds, the uploaded ones and those churned in since
+        self.live = list(range(1, options.records + 1))
+        self.next_recid = options.records + 1
+
+    def dataReceived(self, data):
+        self.buf += data
+        size = messages.Header.payload.size
+        while len(self.buf) >= size:
+            header = messages.Header.decode(self.buf[:size])
+            end = size + header.body_length
+            if len(self.buf) < end:
+                return
+            body, self.buf = self.buf[size:end], self.buf[end:]
+            if header.msg_id == messages.ServerGreeting.msg_id:
+                self.greeted_at = self.clock.seconds()
+                self.transport.write(self.upload)
+            elif header.msg_id == messages.Ping.msg_id:
+                self.transport.write(messages.Pong(messages.Ping.decode(body).nonce).frame())
+                if not self.done and self.greeted_at is not None:
+                    self.uploaded()
+
+    def uploaded(self):
+        self.done = True
+        self.stats.uploads += 1
+        self.stats.upload_bytes += len(self.upload)
+        self.stats.time_to_done.append(self.clock.seconds() - self.greeted_at)
+        self.factory.uploaded(self)
+
+    def start_steady(self):
+        """Churn and reconnect at the configured rates until stopped."""
+        if self.options.churn > 0:
+            self.churn = task.LoopingCall(self.churn_record)
+            self.churn.clock = self.clock
+            self.churn.start(1.0 / self.options.churn, now=False)
+        if self.options.reconnect > 0:
+            self.calls.append(self.clock.callLater(self.rng.expovariate(self.options.reconnect), self.reconnect))
+
+    def churn_record(self):
+        recid, self.next_recid = self.next_recid, self.next_recid + 1
+        # swap the deleted id for the added one, so each id is deleted at most once
+        slot = self.rng.randrange(len(self.live))
+        old, self.live[slot] = self.live[slot], recid
+        name = f"IOC{self.index:05d}:CHURN{recid}"
+        self.transport.write(
+            messages.DelRecord(old).frame()
+            + messages.AddRecord(recid, messages.RecordKind.RECORD, self.rng.choice(RECORD_TYPES), name).frame()
+        )
+        self.stats.churn_messages += 2
+
+    def reconnect(self):
+        self.stats.reconnects += 1
+        self.factory.reconnecting = True
+        self.transport.loseConnection()
+
+    def stop(self):
+        self.factory.stopping = True
+        self.transport.loseConnection()
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        if self.churn is not None and self.churn.running:
+            self.churn.stop()
+        for call in self.calls:
+            if call.active():
+                call.cancel()
+        if not self.done:
+            self.stats.lost_before_done += 1
+        self.factory.lost(self)
+
+
+class IOCFactory(protocol.ClientFactory):
+    def __init__(self, index: int, fleet: Fleet, options: argparse.Namespace, stats: Stats, reactor, upload_done):
+        self.index, self.options, self.stats, self.reactor = index, options, stats, reactor
+        self.upload = upload_frames(fleet.upload(index))
+        self.upload_done = upload_done
+        self.proto = None
+        self.steady = False
+        self.reconnecting = self.stopping = False
+        self.closed = defer.Deferred()
+
+    def connect(self):
+        self.reactor.connectTCP(self.options.host, self.options.port, self)
+
+    def buildProtocol(self, addr):
+        self.proto = SimulatedIOC(self.index, self.upload, self.options, self.stats, self.reactor)
+        self.proto.factory = self
+        return self.proto
+
+    def uploaded(self, proto):
+        if self.upload_done is not None:
+            d, self.upload_done = self.upload_done, None
+            d.callback(None)
+        if self.steady:
+            proto.start_steady()
+
+    def lost(self, proto):
+        self.proto = None
+        if self.upload_done is not None:
+            d, self.upload_done = self.upload_done, None
+            d.callback(None)
+        if self.reconnecting and not self.stopping:
+            self.reconnecting = False
+            self.connect()
+        elif not self.closed.called:
+            self.closed.callback(None)
+
+    def clientConnectionFailed(self, connector, reason):
+        log.error("IOC %d failed to connect: %s", self.index, reason.getErrorMessage())
+        if self.upload_done is not None:
+            d, self.upload_done = self.upload_done, None
+            d.callback(None)
+        self.closed.callback(None)
+
+
+def scrape_histograms(url: str) -> Dict[str, float]:
+    """The _sum and _count samples of the histograms at a Prometheus text endpoint."""
+    samples = {}
+    with urllib.request.urlopen(url, timeout=10) as response:
+        for line in response.read().decode().splitlines():
+            if line.startswith("#"):
+                continue
+            name, _, value = line.rpartition(" ")
+            if name.partition("{")[0].endswith(("_sum", "_count")):
+                samples[name] = float(value)
+    return samples
+
+
+def histogram_means(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    """Mean of each histogram over the observations made between two scrapes."""
+    means = {}
+    for name, total in after.items():
+        base, sep, labels = name.partition("{")
+        if not base.endswith("_sum"):
+            continue
+        count_name = base[: -len("_sum")] + "_count" + sep + labels
+        count = after.get(count_name, 0.0) - before.get(count_name, 0.0)
+        if count > 0:
+            means[base[: -len("_sum")] + sep + labels] = (total - before.get(name, 0.0)) / count
+    return means
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+@defer.inlineCallbacks
+def run(reactor, fleet: Fleet, options: argparse.Namespace):
+    stats = Stats()
+    before = (yield threads.deferToThread(scrape_histograms, options.metrics)) if options.metrics else {}
+
+    start = time.monotonic()
+    factories = []
+    for index in range(fleet.iocs):
+        factory = IOCFactory(index, fleet, options, stats, reactor, defer.Deferred())
+        factories.append(factory)
+        factory.connect()
+        if options.connect_rate > 0:
+            yield task.deferLater(reactor, 1.0 / options.connect_rate, lambda: None)
+    yield defer.DeferredList([f.upload_done for f in factories if f.upload_done is not None])
+    upload_seconds = time.monotonic() - start
+    result = {
+        "upload": {
+            "uploads": stats.uploads,
+            "seconds": upload_seconds,
+            "kib_per_second": stats.upload_bytes / 1024 / upload_seconds if upload_seconds else 0.0,
+            "time_to_done_p50": percentile(stats.time_to_done, 0.5),
+            "time_to_done_p95": percentile(stats.time_to_done, 0.95),
+            "time_to_done_max": max(stats.time_to_done, default=0.0),
+        }
+    }
+
+    if options.duration > 0:
+        uploads = stats.uploads
+        for factory in factories:
+            factory.steady = True
+            if factory.proto is not None and factory.proto.done:
+                factory.proto.start_steady()
+        yield task.deferLater(reactor, options.duration, lambda: None)
+        result["steady"] = {
+            "seconds": options.duration,
+            "churn_messages": stats.churn_messages,
+            "reconnects": stats.reconnects,
+            "reconnect_uploads": stats.uploads - uploads,
+            "time_to_done_p95": percentile(stats.time_to_done[uploads:], 0.95),
+        }
+
+    for factory in factories:
+        if factory.proto is not None:
+            factory.proto.stop()
+    yield defer.DeferredList([f.closed for f in factories])
+    result["lost_before_done"] = stats.lost_before_done
+
+    if options.metrics:
+        after = yield threads.deferToThread(scrape_histograms, options.metrics)
+        result["server_means"] = histogram_means(before, after)
+    return result
+
+
+def print_report(result: Dict) -> None:
+    upload = result["upload"]
+    print(
+        f"upload  {upload['uploads']} IOCs in {upload['seconds']:.2f} s, {upload['kib_per_second']:.1f} KiB/s, "
+        f"time to Done p50 {upload['time_to_done_p50']:.3f} s p95 {upload['time_to_done_p95']:.3f} s "
+        f"max {upload['time_to_done_max']:.3f} s"
+    )
+    if "steady" in result:
+        steady = result["steady"]
+        print(
+            f"steady  {steady['churn_messages']} churn messages, {steady['reconnects']} reconnects "
+            f"({steady['reconnect_uploads']} uploads, time to Done p95 {steady['time_to_done_p95']:.3f} s)"
+        )
+    if result["lost_before_done"]:
+        print(f"lost    {result['lost_before_done']} connections closed before their upload was done")
+    for name, mean in sorted(result.get("server_means", {}).items()):
+        print(f"server  {name} mean {mean:.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1", help="recceiver address")
+    parser.add_argument("--port", type=int, required=True, help="recceiver TCP port")
+    parser.add_argument("--iocs", type=int, default=50, help="number of simulated IOCs")
+    parser.add_argument("--records", type=int, default=1000, help="records per IOC")
+    parser.add_argument("--alias-ratio", type=float, default=0.0, help="fraction of records with an alias")
+    parser.add_argument("--info-tags", type=int, default=0, help="info tags per record")
+    parser.add_argument("--env-vars", type=int, default=0, help="environment variables per IOC besides IOCNAME")
+    parser.add_argument("--connect-rate", type=float, default=0.0, help="IOC connections per second, 0 for all at once")
+    parser.add_argument("--duration", type=float, default=0.0, help="seconds of churn and reconnects after the uploads")
+    parser.add_argument("--churn", type=float, default=0.0, help="record replacements per IOC per second")
+    parser.add_argument("--reconnect", type=float, default=0.0, help="reconnects per IOC per second")
+    parser.add_argument("--metrics", help="recceiver metrics URL, eg. http://127.0.0.1:9090/metrics")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    options = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    fleet = Fleet(options.iocs, options.records, options.alias_ratio, options.info_tags, options.seed, options.env_vars)
+
+    def run_and_report(reactor):
+        def show(result):
+            if options.json:
+                print(json.dumps(dict(result, fleet=asdict(fleet)), indent=2))
+            else:
+                print_report(result)
+
+        return run(reactor, fleet, options).addCallback(show)
+
+    task.react(run_and_report)
+
+
+if __name__ == "__main__":
+    main()
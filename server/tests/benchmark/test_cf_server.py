@@ -0,0 +1,73 @@
+import json
+from io import BytesIO
+
+from twisted.web.test.requesthelper import DummyRequest
+
+from recceiver.cf.model import CFProperty, CFPropertyName
+from tests.benchmark.bench_cf_processor import Fleet
+from tests.benchmark.cf_server import CHANNELS, PROPERTIES, MockCFResource
+from tests.unit.cf.conftest import make_channel
+
+
+def make_request(method: bytes, path: bytes, args=None, body=None) -> DummyRequest:
+    request = DummyRequest([])
+    request.method = method
+    request.path = path
+    request.args = {k.encode(): [str(v).encode()] for k, v in (args or {}).items()}
+    request.content = BytesIO(json.dumps(body).encode() if body is not None else b"")
+    return request
+
+
+def ioc_channel(name: str, iocid: str):
+    channel = make_channel(name)
+    channel.properties.append(CFProperty(CFPropertyName.IOC_ID.value, "admin", iocid))
+    return channel
+
+
+class TestMockCFResource:
+    def test_put_then_find_by_iocid(self):
+        cf = MockCFResource()
+        cf.render(make_request(b"PUT", CHANNELS, body=[ioc_channel("PV:1", "ioc1").as_dict()]))
+
+        body = cf.render(make_request(b"GET", CHANNELS, {"iocid": "ioc1"}))
+
+        assert [ch["name"] for ch in json.loads(body)] == ["PV:1"]
+        assert cf.requests == {("PUT", "channels"): 1, ("GET", "channels"): 1}
+
+    def test_name_query_supports_wildcards_and_size(self):
+        cf = MockCFResource()
+        cf.adapter.set_channels([make_channel(n) for n in ("A:1", "A:2", "A:3", "B:1")])
+
+        body = cf.render(make_request(b"GET", CHANNELS, {"~name": "A:*|B:1", "~size": 3}))
+
+        assert [ch["name"] for ch in json.loads(body)] == ["B:1", "A:1", "A:2"]
+
+    def test_post_property_updates_channels(self):
+        cf = MockCFResource()
+        cf.adapter.set_channels([make_channel("PV:1")])
+        payload = {"name": "pvStatus", "owner": "admin", "value": "Inactive", "channels": [{"name": "PV:1"}]}
+
+        cf.render(make_request(b"POST", PROPERTIES + b"/pvStatus", body=payload))
+
+        assert cf.adapter.find_active_for_recceiver("test-recceiver") == []
+
+    def test_unknown_path_is_not_found(self):
+        request = make_request(b"GET", b"/elsewhere")
+        MockCFResource().render(request)
+        assert request.responseCode == 404
+
+
+class TestFleet:
+    def test_upload_shape(self):
+        fleet = Fleet(iocs=2, records=10, alias_ratio=1.0, info_tags=2)
+        tr = fleet.upload(1)
+        assert tr.initial and tr.connected
+        assert len(tr.records_to_add) == 10
+        assert all(len(aliases) == 1 for aliases in tr.aliases.values())
+        assert set(tr.record_infos_to_add[0]) == {"tag0", "tag1"}
+        assert tr.source_address != fleet.upload(0).source_address
+
+    def test_disconnect_matches_upload_address(self):
+        fleet = Fleet()
+        assert fleet.disconnect(3).source_address == fleet.upload(3).source_address
+        assert not fleet.disconnect(3).connected
@@ -0,0 +1,101 @@
+import argparse
+
+from twisted.internet import task
+from twisted.internet.address import IPv4Address
+from twisted.internet.testing import StringTransport
+
+from recceiver.protocol import messages
+from recceiver.recast import CastFactory
+from tests.benchmark.fleet import Fleet
+from tests.benchmark.loadgen import IOCFactory, Stats, histogram_means, upload_frames
+
+PEER = IPv4Address("TCP", "10.0.0.1", 5001)
+
+
+def make_options(**overrides):
+    values = dict(host="127.0.0.1", port=5049, records=3, churn=0.0, reconnect=0.0, seed=0)
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+
+class TestUploadFrames:
+    def test_recceiver_decodes_the_upload(self):
+        fleet = Fleet(iocs=1, records=3, alias_ratio=1.0, info_tags=1, env_vars=2)
+        factory = CastFactory()
+        committed = []
+        factory.commit = committed.append
+        proto = factory.buildProtocol(PEER)
+        proto.makeConnection(StringTransport(peerAddress=PEER))
+
+        proto.dataReceived(upload_frames(fleet.upload(0)))
+        proto._ping_timer.cancel()
+
+        (tr,) = committed
+        assert sorted(name for name, _ in tr.records_to_add.values()) == [
+            "IOC00000:DEV000:PV00",
+            "IOC00000:DEV000:PV01",
+            "IOC00000:DEV000:PV02",
+        ]
+        assert tr.aliases[1] == ["IOC00000:DEV000:PV00:ALIAS"]
+        assert tr.record_infos_to_add[1] == {"tag0": "tag0-0"}
+        assert tr.client_infos["ENV1"] == "value1"
+
+
+class TestSimulatedIOC:
+    def connect(self, options):
+        clock, stats = task.Clock(), Stats()
+        factory = IOCFactory(0, Fleet(iocs=1, records=3), options, stats, clock, None)
+        proto = factory.buildProtocol(PEER)
+        transport = StringTransport()
+        proto.makeConnection(transport)
+        return clock, stats, factory, proto, transport
+
+    def test_upload_and_time_to_done(self):
+        clock, stats, factory, proto, transport = self.connect(make_options())
+        proto.dataReceived(messages.ServerGreeting().frame())
+        assert transport.value() == factory.upload
+        transport.clear()
+
+        clock.advance(0.25)
+        proto.dataReceived(messages.Ping(99).frame())
+
+        assert transport.value() == messages.Pong(99).frame()
+        assert (stats.uploads, stats.time_to_done) == (1, [0.25])
+
+    def test_churn(self):
+        clock, stats, factory, proto, transport = self.connect(make_options(churn=2.0))
+        factory.steady = True
+        proto.dataReceived(messages.ServerGreeting().frame() + messages.Ping(1).frame())
+        transport.clear()
+
+        clock.advance(0.5)
+        clock.advance(0.5)
+
+        assert stats.churn_messages == 4
+        assert transport.value().count(messages.Header(messages.DelRecord.msg_id, 4).encode()) == 2
+
+    def test_churn_deletes_live_records_once(self):
+        clock, stats, factory, proto, transport = self.connect(make_options(churn=1.0))
+        factory.steady = True
+        proto.dataReceived(messages.ServerGreeting().frame() + messages.Ping(1).frame())
+        transport.clear()
+
+        for _ in range(20):
+            clock.advance(1.0)
+
+        data, deleted = transport.value(), []
+        while data:
+            header = messages.Header.decode(data[: messages.Header.payload.size])
+            end = messages.Header.payload.size + header.body_length
+            if header.msg_id == messages.DelRecord.msg_id:
+                deleted.append(messages.DelRecord.decode(data[messages.Header.payload.size : end]).record_id)
+            data = data[end:]
+        assert len(deleted) == len(set(deleted)) == 20
+        assert any(recid > 3 for recid in deleted)
+        assert sorted(proto.live) == sorted(set(range(1, 24)) - set(deleted))
+
+
+def test_histogram_means():
+    before = {"d_seconds_sum": 1.0, "d_seconds_count": 2.0}
+    after = {"d_seconds_sum": 4.0, "d_seconds_count": 5.0, 'q_sum{p="a"}': 1.0, 'q_count{p="a"}': 4.0}
+    assert histogram_means(before, after) == {"d_seconds": 1.0, 'q{p="a"}': 0.25}
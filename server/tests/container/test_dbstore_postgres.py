@@ -0,0 +1,88 @@
+"""DBProcessor against a PostgreSQL server in a container."""
+
+from pathlib import Path
+
+import pytest
+
+from recceiver.dbstore import DBProcessor
+from tests.unit.conftest import make_adapter
+from tests.unit.test_dbstore import disconnect, upload
+
+psycopg2 = pytest.importorskip("psycopg2")
+postgres = pytest.importorskip("testcontainers.postgres")
+
+SCHEMA = Path(__file__).parents[2] / "recceiver.pgsql"
+
+
+@pytest.fixture(scope="module")
+def dsn():
+    with postgres.PostgresContainer("postgres:16-alpine", driver=None) as container:
+        yield container.get_connection_url()
+
+
+@pytest.fixture
+def cur(dsn):
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as setup:
+        setup.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+        setup.execute(SCHEMA.read_text())
+    conn.commit()
+    yield conn.cursor()
+    conn.close()
+
+
+def make_processor(**values) -> DBProcessor:
+    values = {"idkey": 42, "dbtype": "psycopg2", "dbname": "", **values}
+    proc = DBProcessor("db", make_adapter("db", values=values))
+    proc.sources = {}
+    proc.scheduled = []
+    proc._call_in_reactor = lambda fn, *args, **kwargs: fn(*args, **kwargs)
+    proc._schedule = lambda op, *args, **kwargs: proc.scheduled.append((op, args))
+    proc._start_purge = lambda: None
+    return proc
+
+
+def names(cur, prim: int):
+    cur.execute("SELECT r.id, n.rname FROM record r JOIN record_name n ON n.rec = r.pkey WHERE n.prim = %s", (prim,))
+    return sorted(cur.fetchall())
+
+
+class TestDBProcessorPostgres:
+    @pytest.mark.parametrize("copy_min", [1, 1000], ids=["copy", "insert"])
+    def test_initial_upload(self, cur, copy_min):
+        proc = make_processor(copyMin=copy_min)
+        tr = upload(1, {1: "PV:1", 2: "PV:2\twith tab"}, {1: {"archive": "yes"}})
+        tr.aliases[1].append("PV:1:ALIAS")
+
+        results = proc._commit_batch(cur, [(proc._commit, (tr,))])
+
+        assert results == [None]
+        assert names(cur, 1) == [(1, "PV:1"), (2, "PV:2\twith tab")]
+        assert names(cur, 0) == [(1, "PV:1:ALIAS")]
+        cur.execute("SELECT key, value FROM recinfo")
+        assert cur.fetchall() == [("archive", "yes")]
+
+    def test_reconnect_updates_client_infos(self, cur):
+        proc = make_processor()
+        proc._commit(cur, upload(1, {1: "PV:1"}))
+        proc._commit(cur, disconnect(1))
+        again = upload(2, {1: "PV:1"}, {1: {"archive": "no"}})
+        again.client_infos["ENGINEER"] = "someone"
+        proc._commit(cur, again)
+
+        cur.execute("SELECT key, value FROM servinfo ORDER BY key")
+        assert cur.fetchall() == [("ENGINEER", "someone"), ("IOCNAME", "IOC1")]
+        cur.execute("SELECT COUNT(*) FROM server")
+        assert cur.fetchone() == (1,)
+
+    def test_purge(self, cur):
+        proc = make_processor(reconnectGrace=0)
+        proc.purge_batch = 2
+        proc._commit(cur, upload(1, {i: "PV:%d" % i for i in range(5)}))
+        proc._commit(cur, disconnect(1))
+
+        while proc._purge_step(cur):
+            pass
+
+        cur.execute("SELECT COUNT(*) FROM record")
+        assert cur.fetchone() == (0,)
@@ -1,6 +1,9 @@
-from typing import Dict, List
+import time
+from collections import Counter, defaultdict
+from typing import AbstractSet, Dict, Iterator, List, Optional, Set, Tuple
 
 from requests import HTTPError
+from twisted.internet import defer
 
 from recceiver.cf.model import CFChannel, CFProperty, CFPropertyName, PVStatus
 
@@ -8,64 +11,137 @@ MOCK_CF_HTTP_ERROR = "Mock Channelfinder Client HTTPError"
 
 
 class MockCFAdapter:
-    """In-memory ChannelFinderAdapter for unit tests."""
+    """In-memory ChannelFinderAdapter for unit tests and benchmarks.
 
-    def __init__(self):
+    Channels are indexed by iocid and by active recceiverID so lookups stay
+    cheap with very large channel counts. latency seconds are slept before
+    every call to model a remote ChannelFinder, and calls counts the calls
+    made per method.
+    """
+
+    def __init__(self, latency: float = 0.0):
         self._channels: Dict[str, CFChannel] = {}
+        self._by_ioc: Dict[str, Set[str]] = defaultdict(set)
+        self._active_by_recceiver: Dict[str, Set[str]] = defaultdict(set)
+        self._index_keys: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.latency = latency
+        self.calls: Counter = Counter()
         self.connected = True
         self.fail_find = False
         self.fail_set = False
 
-    def find_by_ioc_id(self, iocid: str) -> List[CFChannel]:
-        if not self.connected or self.fail_find:
-            raise HTTPError(MOCK_CF_HTTP_ERROR, response=self)
-        return [
-            ch
-            for ch in self._channels.values()
-            if any(p.name == CFPropertyName.IOC_ID.value and p.value == iocid for p in ch.properties)
-        ]
-
-    def find_by_names(self, names: List[str]) -> List[CFChannel]:
-        if not self.connected or self.fail_find:
+    def _call(self, method: str, fail: bool) -> None:
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.connected or fail:
             raise HTTPError(MOCK_CF_HTTP_ERROR, response=self)
-        return [self._channels[n] for n in names if n in self._channels]
 
-    def find_active_for_recceiver(self, recceiverid: str) -> List[CFChannel]:
-        if not self.connected or self.fail_find:
-            raise HTTPError(MOCK_CF_HTTP_ERROR, response=self)
-        return [
-            ch
-            for ch in self._channels.values()
-            if any(p.name == CFPropertyName.PV_STATUS.value and p.value == PVStatus.ACTIVE.value for p in ch.properties)
-            and any(p.name == CFPropertyName.RECCEIVER_ID.value and p.value == recceiverid for p in ch.properties)
-        ]
+    def find_by_ioc_id(self, iocid: str, properties: Optional[AbstractSet[str]] = None) -> List[CFChannel]:
+        self._call("find_by_ioc_id", self.fail_find)
+        # The index may lag channels mutated in place by a caller, so re-check each candidate.
+        return _project(
+            [
+                ch
+                for ch in self._lookup(self._by_ioc.get(iocid, ()))
+                if _property_value(ch, CFPropertyName.IOC_ID.value) == iocid
+            ],
+            properties,
+        )
+
+    def iter_by_ioc_id(self, iocid: str, properties: Optional[AbstractSet[str]] = None) -> Iterator[CFChannel]:
+        return iter(self.find_by_ioc_id(iocid, properties))
+
+    def find_by_names(self, names: List[str], properties: Optional[AbstractSet[str]] = None) -> List[CFChannel]:
+        self._call("find_by_names", self.fail_find)
+        return _project([self._channels[n] for n in names if n in self._channels], properties)
+
+    def find_active_for_recceiver(
+        self, recceiverid: str, properties: Optional[AbstractSet[str]] = None
+    ) -> List[CFChannel]:
+        self._call("find_active_for_recceiver", self.fail_find)
+        return _project(
+            [
+                ch
+                for ch in self._lookup(self._active_by_recceiver.get(recceiverid, ()))
+                if _active_recceiver(ch) == recceiverid
+            ],
+            properties,
+        )
 
     def set_channels(self, channels: List[CFChannel]) -> None:
-        if not self.connected or self.fail_set:
-            raise HTTPError(MOCK_CF_HTTP_ERROR, response=self)
+        self._call("set_channels", self.fail_set)
         for channel in channels:
             self._channels[channel.name] = channel
+            self._reindex(channel)
 
     def update_property(self, prop: CFProperty, channel_names: List[str]) -> None:
-        if not self.connected or self.fail_find:
-            raise HTTPError(MOCK_CF_HTTP_ERROR, response=self)
+        self._call("update_property", self.fail_find)
         for name in channel_names:
             self._update_channel_with_prop(prop, name)
 
     def get_property_names(self) -> List[str]:
-        if not self.connected:
-            raise HTTPError(MOCK_CF_HTTP_ERROR, response=self)
+        self._call("get_property_names", False)
         return ["hostName", "iocName", "pvStatus", "time", "iocid", "iocIP", "recceiverID"]
 
     def set_property(self, _name: str, _owner: str) -> None:
-        if not self.connected:
-            raise HTTPError(MOCK_CF_HTTP_ERROR, response=self)
+        self._call("set_property", False)
+
+    def _lookup(self, names) -> List[CFChannel]:
+        return [self._channels[n] for n in sorted(names)]
+
+    def _reindex(self, channel: CFChannel) -> None:
+        old_ioc, old_recceiver = self._index_keys.get(channel.name, (None, None))
+        new_ioc = _property_value(channel, CFPropertyName.IOC_ID.value)
+        new_recceiver = _active_recceiver(channel)
+        if old_ioc != new_ioc:
+            self._by_ioc[old_ioc].discard(channel.name)
+            self._by_ioc[new_ioc].add(channel.name)
+        if old_recceiver != new_recceiver:
+            self._active_by_recceiver[old_recceiver].discard(channel.name)
+            self._active_by_recceiver[new_recceiver].add(channel.name)
+        self._index_keys[channel.name] = (new_ioc, new_recceiver)
 
     def _update_channel_with_prop(self, prop: CFProperty, channel_name: str) -> None:
         if channel_name not in self._channels:
             return
-        for p in self._channels[channel_name].properties:
+        channel = self._channels[channel_name]
+        for p in channel.properties:
             if p.name == prop.name:
                 p.value = prop.value
                 p.owner = prop.owner
-                return
+                break
+        self._reindex(channel)
+
+
+def _property_value(channel: CFChannel, name: str) -> Optional[str]:
+    return next((p.value for p in channel.properties if p.name == name), None)
+
+
+def _active_recceiver(channel: CFChannel) -> Optional[str]:
+    if _property_value(channel, CFPropertyName.PV_STATUS.value) != PVStatus.ACTIVE.value:
+        return None
+    return _property_value(channel, CFPropertyName.RECCEIVER_ID.value)
+
+
+def _project(channels: List[CFChannel], properties: Optional[AbstractSet[str]]) -> List[CFChannel]:
+    """Mimic the adapters' projection: decoded copies carrying only the selected properties."""
+    if properties is None:
+        return channels
+    return [CFChannel.from_dict(ch.as_dict(), properties) for ch in channels]
+
+
+class AsyncMockCFAdapter:
+    """AsyncChannelFinderAdapter over a MockCFAdapter; every call returns an already-fired Deferred."""
+
+    def __init__(self, adapter: MockCFAdapter = None):
+        self.adapter = adapter or MockCFAdapter()
+        self.closed = False
+
+    def __getattr__(self, name):
+        method = getattr(self.adapter, name)
+        return lambda *args: defer.maybeDeferred(method, *args)
+
+    def close(self):
+        self.closed = True
+        return defer.succeed(None)
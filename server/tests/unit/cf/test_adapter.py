@@ -0,0 +1,169 @@
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from recceiver.cf.adapter import (
+    NAME_LOOKUP_AUTO,
+    NAME_LOOKUP_CHUNKED,
+    NAME_LOOKUP_PREFIX,
+    NameLookupPlanner,
+    PyCFClientAdapter,
+    name_prefix_groups,
+    name_query_chunks,
+)
+from tests.unit.cf.conftest import make_channel
+
+
+class FakeStreamResponse:
+    def __init__(self, body: bytes):
+        self._body = body
+        self.raise_for_status = MagicMock()
+
+    def iter_content(self, chunk_size):
+        return (self._body[i : i + 5] for i in range(0, len(self._body), 5))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class TestNameQueryChunks:
+    def test_short_names_share_a_chunk(self):
+        assert name_query_chunks(["A", "B", "C"]) == ["A|B|C"]
+
+    def test_chunks_stay_under_limit(self):
+        names = [f"PV:{i:05d}:" + "X" * 50 for i in range(100)]
+        chunks = name_query_chunks(names)
+        assert len(chunks) > 1
+        assert all(len(chunk) < 700 for chunk in chunks)
+        assert [n for chunk in chunks for n in chunk.split("|")] == names
+
+
+class TestNamePrefixGroups:
+    def test_groups_by_last_colon(self):
+        names = ["IOC:A:1", "IOC:A:2", "IOC:A:3", "IOC:B:1", "NOCOLON"]
+        groups, rest = name_prefix_groups(names, min_group=3)
+        assert groups == {"IOC:A:": ["IOC:A:1", "IOC:A:2", "IOC:A:3"]}
+        assert sorted(rest) == ["IOC:B:1", "NOCOLON"]
+
+    def test_glob_characters_are_never_grouped(self):
+        groups, rest = name_prefix_groups(["A*:1", "A*:2"], min_group=1)
+        assert groups == {}
+        assert rest == ["A*:1", "A*:2"]
+
+
+def many_names(prefix: str, count: int):
+    return [f"{prefix}{i}" for i in range(count)]
+
+
+class TestNameLookupPlanner:
+    def test_unknown_mode_raises(self):
+        with pytest.raises(ValueError):
+            NameLookupPlanner("bulk")
+
+    def test_prefix_requires_size_limit(self):
+        planner = NameLookupPlanner(NAME_LOOKUP_PREFIX, size_limit=0)
+        assert planner.plan(many_names("IOC:", 20)).strategy == NAME_LOOKUP_CHUNKED
+
+    def test_prefix_plan_uses_wildcards_and_chunks_the_rest(self):
+        planner = NameLookupPlanner(NAME_LOOKUP_PREFIX, size_limit=100)
+        plan = planner.plan(many_names("IOC:", 10) + ["OTHER:1"])
+        assert plan.strategy == NAME_LOOKUP_PREFIX
+        assert plan.queries == [("IOC:*", frozenset(many_names("IOC:", 10))), ("OTHER:1", None)]
+
+    def test_wildcard_size_limit_bounds_groups(self):
+        planner = NameLookupPlanner(NAME_LOOKUP_PREFIX, size_limit=10000, wildcard_size_limit=10)
+        assert planner.wildcard_size_limit == 10
+        plan = planner.plan(many_names("IOC:", 10) + many_names("BIG:", 11))
+        assert plan.queries[0] == ("IOC:*", frozenset(many_names("IOC:", 10)))
+        assert all(query != "BIG:*" for query, _ in plan.queries)
+
+    def test_auto_measures_both_then_picks_cheaper(self):
+        planner = NameLookupPlanner(NAME_LOOKUP_AUTO, size_limit=100, explore_interval=1000)
+        names = many_names("IOC:", 10)
+        assert planner.plan(names).strategy == NAME_LOOKUP_CHUNKED
+        planner.record(NAME_LOOKUP_CHUNKED, 1.0, 10)
+        assert planner.plan(names).strategy == NAME_LOOKUP_PREFIX
+        planner.record(NAME_LOOKUP_PREFIX, 0.1, 10)
+        assert planner.plan(names).strategy == NAME_LOOKUP_PREFIX
+
+    def test_auto_periodically_explores_other_strategy(self):
+        planner = NameLookupPlanner(NAME_LOOKUP_AUTO, size_limit=100, explore_interval=2)
+        planner.record(NAME_LOOKUP_CHUNKED, 1.0, 10)
+        planner.record(NAME_LOOKUP_PREFIX, 0.1, 10)
+        names = many_names("IOC:", 10)
+        assert [planner.plan(names).strategy for _ in range(4)] == [
+            NAME_LOOKUP_PREFIX,
+            NAME_LOOKUP_CHUNKED,
+            NAME_LOOKUP_PREFIX,
+            NAME_LOOKUP_CHUNKED,
+        ]
+
+
+class TestPyCFClientAdapterNameLookup:
+    def test_prefix_lookup_filters_wildcard_results(self):
+        client = MagicMock()
+        wanted = many_names("IOC:", 8)
+        client.findByArgs.return_value = [make_channel(n).as_dict() for n in wanted + ["IOC:unrelated"]]
+        adapter = PyCFClientAdapter(
+            client, size_limit=100, name_lookup=NameLookupPlanner(NAME_LOOKUP_PREFIX, size_limit=100)
+        )
+
+        channels = adapter.find_by_names(wanted)
+
+        assert [ch.name for ch in channels] == wanted
+        client.findByArgs.assert_called_once_with([("~name", "IOC:*"), ("~size", 100)])
+
+    def test_prefix_lookup_uses_wildcard_size_limit(self):
+        client = MagicMock()
+        wanted = many_names("IOC:", 8)
+        client.findByArgs.return_value = [make_channel(n).as_dict() for n in wanted]
+        planner = NameLookupPlanner(NAME_LOOKUP_PREFIX, size_limit=10000, wildcard_size_limit=50)
+        adapter = PyCFClientAdapter(client, size_limit=10000, name_lookup=planner)
+
+        adapter.find_by_names(wanted)
+
+        client.findByArgs.assert_called_once_with([("~name", "IOC:*"), ("~size", 50)])
+
+    def test_truncated_wildcard_falls_back_to_exact_names(self):
+        client = MagicMock()
+        wanted = many_names("IOC:", 8)
+        client.findByArgs.side_effect = [
+            [make_channel(f"IOC:other{i}").as_dict() for i in range(8)],
+            [make_channel(n).as_dict() for n in wanted],
+        ]
+        adapter = PyCFClientAdapter(
+            client, size_limit=8, name_lookup=NameLookupPlanner(NAME_LOOKUP_PREFIX, size_limit=8)
+        )
+
+        channels = adapter.find_by_names(wanted)
+
+        assert sorted(ch.name for ch in channels) == sorted(wanted)
+        assert client.findByArgs.call_args_list[1][0][0][0] == ("~name", "|".join(sorted(wanted)))
+
+
+class TestPyCFClientAdapterStreaming:
+    def test_without_session_uses_find_by_args(self):
+        client = MagicMock()
+        client.findByArgs.return_value = [make_channel("PV:1").as_dict()]
+        adapter = PyCFClientAdapter(client)
+        assert list(adapter.iter_by_ioc_id("ioc")) == [make_channel("PV:1")]
+        client.findByArgs.assert_called_once_with([("iocid", "ioc")])
+
+    def test_with_session_streams_response(self):
+        client, session = MagicMock(), MagicMock()
+        body = json.dumps([make_channel("PV:1").as_dict(), make_channel("PV:2").as_dict()]).encode()
+        session.get.return_value = FakeStreamResponse(body)
+        adapter = PyCFClientAdapter(client, size_limit=10, base_url="http://cf/ChannelFinder/", session=session)
+
+        channels = adapter.iter_by_ioc_id("ioc")
+
+        assert [ch.name for ch in channels] == ["PV:1", "PV:2"]
+        client.findByArgs.assert_not_called()
+        args, kwargs = session.get.call_args
+        assert args == ("http://cf/ChannelFinder/resources/channels",)
+        assert kwargs["params"] == [("iocid", "ioc"), ("~size", 10)]
+        assert kwargs["stream"] is True
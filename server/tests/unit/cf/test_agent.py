@@ -0,0 +1,177 @@
+import json
+from typing import List, Optional
+
+import pytest
+from requests import ConnectionError, HTTPError
+from twisted.internet import defer
+from twisted.internet.error import ConnectionLost, ConnectionRefusedError
+from twisted.python.failure import Failure
+from twisted.web.client import ResponseDone, ResponseFailed
+
+from recceiver.cf.adapter import NAME_LOOKUP_PREFIX, NameLookupPlanner
+from recceiver.cf.agent import AgentCFAdapter
+from recceiver.cf.model import CFChannel, CFProperty, CFPropertyName, PVStatus
+from tests.unit.cf.conftest import make_channel
+
+
+class FakeResponse:
+    def __init__(self, code: int = 200, body: bytes = b""):
+        self.code = code
+        self.phrase = b"OK" if code < 400 else b"Error"
+        self.length = len(body)
+        self._body = body
+
+    def deliverBody(self, protocol):
+        protocol.dataReceived(self._body)
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
+class DroppedResponse(FakeResponse):
+    """Loses the connection half way through the body."""
+
+    def deliverBody(self, protocol):
+        protocol.dataReceived(self._body[: len(self._body) // 2])
+        protocol.connectionLost(Failure(ResponseFailed([Failure(ConnectionLost())])))
+
+
+class FakeAgent:
+    """Records requests and answers them from a queue of canned responses."""
+
+    def __init__(self):
+        self.requests = []
+        self.responses: List = []
+
+    def request(self, method, uri, headers=None, bodyProducer=None):
+        body: Optional[bytes] = bodyProducer.body if bodyProducer is not None else None
+        self.requests.append((method, uri.decode(), headers, body))
+        response = self.responses.pop(0) if self.responses else FakeResponse()
+        if isinstance(response, Exception):
+            return defer.fail(response)
+        return defer.succeed(response)
+
+
+def json_response(payload, code: int = 200) -> FakeResponse:
+    return FakeResponse(code, json.dumps(payload).encode())
+
+
+def make_adapter(**kwargs):
+    agent = FakeAgent()
+    adapter = AgentCFAdapter("http://cf.example.com/ChannelFinder/", agent=agent, **kwargs)
+    return adapter, agent
+
+
+def result_of(d: defer.Deferred):
+    results = []
+    d.addBoth(results.append)
+    assert results, "Deferred did not fire synchronously"
+    if isinstance(results[0], Failure):
+        results[0].raiseException()
+    return results[0]
+
+
+class TestAgentCFAdapterQueries:
+    def test_find_by_ioc_id_decodes_channels(self):
+        adapter, agent = make_adapter(size_limit=100)
+        agent.responses.append(json_response([make_channel("PV:1").as_dict()]))
+
+        channels = result_of(adapter.find_by_ioc_id("1.2.3.4:5064"))
+
+        assert channels == [make_channel("PV:1")]
+        method, uri, _, _ = agent.requests[0]
+        assert method == b"GET"
+        assert uri == "http://cf.example.com/ChannelFinder/resources/channels?iocid=1.2.3.4%3A5064&~size=100"
+
+    def test_find_by_names_merges_chunks(self):
+        adapter, agent = make_adapter()
+        names = [f"LONG:PV:NAME:{i:04d}:" + "X" * 40 for i in range(30)]
+        agent.responses.extend(
+            [json_response([make_channel(names[0]).as_dict()]), json_response([make_channel(names[-1]).as_dict()])]
+        )
+
+        channels = result_of(adapter.find_by_names(names))
+
+        assert len(agent.requests) > 1
+        assert [ch.name for ch in channels] == [names[0], names[-1]]
+
+    def test_find_by_names_prefix_filters_wildcard_results(self):
+        planner = NameLookupPlanner(NAME_LOOKUP_PREFIX, size_limit=100)
+        adapter, agent = make_adapter(size_limit=100, name_lookup=planner)
+        names = [f"IOC:{i}" for i in range(8)]
+        agent.responses.append(json_response([make_channel(n).as_dict() for n in names + ["IOC:extra"]]))
+
+        channels = result_of(adapter.find_by_names(names))
+
+        assert [ch.name for ch in channels] == names
+        assert len(agent.requests) == 1
+        assert "~name=IOC%3A%2A" in agent.requests[0][1]
+
+    def test_find_by_names_empty_makes_no_request(self):
+        adapter, agent = make_adapter()
+        assert result_of(adapter.find_by_names([])) == []
+        assert agent.requests == []
+
+    def test_get_property_names(self):
+        adapter, agent = make_adapter()
+        agent.responses.append(json_response([{"name": "iocid", "owner": "cf"}, {"name": "pvStatus", "owner": "cf"}]))
+        assert result_of(adapter.get_property_names()) == ["iocid", "pvStatus"]
+
+
+class TestAgentCFAdapterUpdates:
+    def test_set_channels_puts_json_body(self):
+        adapter, agent = make_adapter()
+        result_of(adapter.set_channels([make_channel("PV:1")]))
+        method, uri, _, body = agent.requests[0]
+        assert method == b"PUT"
+        assert uri.endswith("/resources/channels")
+        assert json.loads(body) == [make_channel("PV:1").as_dict()]
+
+    def test_update_property_posts_channel_list(self):
+        adapter, agent = make_adapter(username="admin", password="secret")
+        prop = CFProperty(CFPropertyName.PV_STATUS.value, "cfstore", PVStatus.INACTIVE.value)
+
+        result_of(adapter.update_property(prop, ["PV:1", "PV:2"]))
+
+        method, uri, headers, body = agent.requests[0]
+        assert method == b"POST"
+        assert uri.endswith("/resources/properties/pvStatus")
+        assert headers.getRawHeaders(b"Authorization") == [b"Basic YWRtaW46c2VjcmV0"]
+        assert [ch["name"] for ch in json.loads(body)["channels"]] == ["PV:1", "PV:2"]
+
+    def test_set_property(self):
+        adapter, agent = make_adapter()
+        result_of(adapter.set_property("archive", "cfstore"))
+        method, uri, _, body = agent.requests[0]
+        assert (method, uri.rsplit("/", 1)[-1]) == (b"PUT", "archive")
+        assert json.loads(body) == {"name": "archive", "owner": "cfstore"}
+
+
+class TestAgentCFAdapterErrors:
+    def test_http_error_status_raises_http_error(self):
+        adapter, agent = make_adapter()
+        agent.responses.append(FakeResponse(500, b"boom"))
+        with pytest.raises(HTTPError):
+            result_of(adapter.set_channels([CFChannel("PV:1", "admin", [])]))
+
+    def test_connection_failure_raises_connection_error(self):
+        adapter, agent = make_adapter()
+        agent.responses.append(ConnectionRefusedError())
+        with pytest.raises(ConnectionError):
+            result_of(adapter.find_by_ioc_id("ioc"))
+
+    def test_chunk_failure_is_unwrapped(self):
+        adapter, agent = make_adapter()
+        agent.responses.append(FakeResponse(503))
+        with pytest.raises(HTTPError):
+            result_of(adapter.find_by_names(["PV:1"]))
+
+    def test_connection_lost_reading_channels_raises_connection_error(self):
+        adapter, agent = make_adapter()
+        agent.responses.append(DroppedResponse(body=json.dumps([make_channel("PV:1").as_dict()] * 4).encode()))
+        with pytest.raises(ConnectionError):
+            result_of(adapter.find_by_ioc_id("ioc"))
+
+    def test_connection_lost_reading_body_raises_connection_error(self):
+        adapter, agent = make_adapter()
+        agent.responses.append(DroppedResponse(body=json.dumps(["hostName", "iocName"]).encode()))
+        with pytest.raises(ConnectionError):
+            result_of(adapter.get_property_names())
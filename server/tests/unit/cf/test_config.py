@@ -59,3 +59,20 @@ class TestCFConfigLoads:
         adapter = make_adapter(values={"statusinterval": "120.0"})
         config = CFConfig.loads(adapter)
         assert config.status_interval == pytest.approx(120.0)
+
+    def test_default_cf_client(self):
+        adapter = make_adapter()
+        config = CFConfig.loads(adapter)
+        assert config.cf_client == "pycfclient"
+
+    def test_cf_client_from_config(self):
+        adapter = make_adapter(values={"cfclient": "Agent", "cfmaxconnections": "64"})
+        config = CFConfig.loads(adapter)
+        assert config.cf_client == "agent"
+        assert config.cf_max_connections == 64
+
+    def test_default_name_lookup(self):
+        adapter = make_adapter()
+        config = CFConfig.loads(adapter)
+        assert config.name_lookup == "chunked"
+        assert config.name_lookup_size_limit == 1000
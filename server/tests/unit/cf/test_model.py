@@ -50,3 +50,20 @@ class TestCFChannel:
     def test_from_dict_missing_properties_defaults_to_empty(self):
         ch = CFChannel.from_dict({"name": "PV:1", "owner": "admin"})
         assert ch.properties == []
+
+    def test_from_dict_projection_keeps_selected_properties(self):
+        ch = CFChannel(
+            name="PV:1",
+            owner="admin",
+            properties=[
+                CFProperty(CFPropertyName.PV_STATUS.value, "admin", PVStatus.ACTIVE.value),
+                CFProperty("foreign", "someone", "x"),
+            ],
+        )
+        projected = CFChannel.from_dict(ch.as_dict(), {CFPropertyName.PV_STATUS.value})
+        assert projected.name == "PV:1"
+        assert [p.name for p in projected.properties] == [CFPropertyName.PV_STATUS.value]
+
+    def test_from_dict_empty_projection_keeps_name_only(self):
+        ch = CFChannel("PV:1", "admin", [CFProperty(CFPropertyName.PV_STATUS.value, "admin", "Active")])
+        assert CFChannel.from_dict(ch.as_dict(), frozenset()).properties == []
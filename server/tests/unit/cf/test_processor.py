@@ -1,11 +1,12 @@
 import time
 
+import pytest
 from requests import RequestException
 
 from recceiver.cf.model import CFChannel, CFProperty, CFPropertyName, PVStatus, RecordInfo
 from recceiver.cf.processor import CFProcessor
 from tests.unit.cf.conftest import DEFAULT_RECCEIVER_ID, make_channel, make_ioc
-from tests.unit.cf.mock_adapter import MockCFAdapter
+from tests.unit.cf.mock_adapter import AsyncMockCFAdapter, MockCFAdapter
 from tests.unit.conftest import make_adapter
 
 
@@ -120,6 +121,53 @@ class TestUpdateChannelFinder:
         status = next(p for p in adapter._channels["PV:1"].properties if p.name == CFPropertyName.PV_STATUS.value)
         assert status.value == PVStatus.INACTIVE.value
 
+    def test_reupload_with_alias_keeps_alias_active(self):
+        proc, adapter = self._make_proc()
+        proc.cf_config.alias_enabled = True
+        ioc = make_ioc()
+        proc.iocs[ioc.id] = ioc
+        records = {"PV:1": RecordInfo(pv_name="PV:1", aliases=["PV:1:ALIAS"])}
+        proc.channel_ioc_ids["PV:1"].append(ioc.id)
+        proc._register_aliases(["PV:1:ALIAS"], ioc.id)
+
+        proc._update_channelfinder(records, [], ioc)
+        proc._update_channelfinder(records, [], ioc)
+
+        status = next(p for p in adapter._channels["PV:1:ALIAS"].properties if p.name == CFPropertyName.PV_STATUS.value)
+        assert status.value == PVStatus.ACTIVE.value
+
+    def test_existing_channel_with_alias_not_in_new_channels(self):
+        # new_channels holds record names only; removing the alias from it raised KeyError
+        proc, _ = self._make_proc()
+        proc.cf_config.alias_enabled = True
+        ioc = make_ioc()
+        new_channels = {"PV:1"}
+        channels = []
+
+        proc._handle_channel_old_and_new(
+            make_channel("PV:1"),
+            ioc.id,
+            ioc,
+            channels,
+            new_channels,
+            {"PV:1": RecordInfo(pv_name="PV:1", aliases=["PV:1:ALIAS"])},
+        )
+
+        assert [ch.name for ch in channels] == ["PV:1", "PV:1:ALIAS"]
+        assert new_channels == set()
+
+    def test_find_by_ioc_id_uses_index_after_property_update(self):
+        _, adapter = self._make_proc()
+        ioc = make_ioc()
+        channel = make_channel("PV:1")
+        channel.properties.append(CFProperty(CFPropertyName.IOC_ID.value, "admin", ioc.id))
+        adapter.set_channels([channel])
+
+        adapter.update_property(CFProperty(CFPropertyName.IOC_ID.value, "admin", "other"), ["PV:1"])
+
+        assert adapter.find_by_ioc_id(ioc.id) == []
+        assert [ch.name for ch in adapter.find_by_ioc_id("other")] == ["PV:1"]
+
 
 class TestPushToCF:
     def test_abandons_push_when_processor_stops_during_retry(self, monkeypatch):
@@ -142,3 +190,90 @@ class TestPushToCF:
 
         assert result is False
         assert call_count == 1
+
+
+class TestAsyncClient:
+    def _make_proc(self):
+        proc = CFProcessor("test", make_adapter(values={"recceiverid": DEFAULT_RECCEIVER_ID, "cfclient": "agent"}))
+        adapter = MockCFAdapter()
+        proc.client = AsyncMockCFAdapter(adapter)
+        proc.running = True
+        proc.cancelled = False
+        proc.managed_properties = set()
+        proc.record_property_names_list = set()
+        proc.env_vars = {}
+        return proc, adapter
+
+    def test_agent_config_selects_async_path(self):
+        proc, _ = self._make_proc()
+        assert proc.is_async is True
+        assert make_processor().is_async is False
+
+    def test_update_registers_new_channel(self):
+        proc, adapter = self._make_proc()
+        ioc = make_ioc()
+        proc.iocs[ioc.id] = ioc
+
+        d = proc._update_channelfinder_async({"PV:1": RecordInfo(pv_name="PV:1")}, [], ioc)
+
+        assert d.called
+        status = next(p for p in adapter._channels["PV:1"].properties if p.name == CFPropertyName.PV_STATUS.value)
+        assert status.value == PVStatus.ACTIVE.value
+
+    def test_push_failure_is_retried_without_sleeping(self, monkeypatch):
+        proc, adapter = self._make_proc()
+        proc.cf_config.push_max_retries = 2
+        monkeypatch.setattr(time, "sleep", lambda _: pytest.fail("async push must not block"))
+        adapter.fail_find = True
+        ioc = make_ioc()
+        proc.iocs[ioc.id] = ioc
+
+        results = []
+        d = proc._push_to_cf_async({"PV:1": RecordInfo(pv_name="PV:1")}, [], ioc)
+        d.addBoth(results.append)
+
+        # first attempt failed synchronously; the retry waits on the reactor
+        assert results == []
+        d.cancel()
+
+    def test_clean_service_marks_channels_inactive(self):
+        proc, adapter = self._make_proc()
+        adapter.set_channels([make_channel("PV:1")])
+
+        d = proc._clean_service_async()
+
+        assert d.called
+        status = next(p for p in adapter._channels["PV:1"].properties if p.name == CFPropertyName.PV_STATUS.value)
+        assert status.value == PVStatus.INACTIVE.value
+
+
+class TestReconciliationProperties:
+    def _make_proc(self):
+        proc = CFProcessor("test", make_adapter(values={"recceiverid": DEFAULT_RECCEIVER_ID}))
+        adapter = MockCFAdapter()
+        proc.client = adapter
+        proc.cancelled = False
+        proc.managed_properties = {p.value for p in CFPropertyName}
+        proc.record_property_names_list = set()
+        proc.env_vars = {}
+        return proc, adapter
+
+    def test_reconnect_keeps_foreign_properties(self):
+        proc, adapter = self._make_proc()
+        ioc = make_ioc()
+        proc.iocs[ioc.id] = ioc
+        proc._update_channelfinder({"PV:1": RecordInfo(pv_name="PV:1")}, [], ioc)
+        adapter.update_property(CFProperty(CFPropertyName.PV_STATUS.value, "admin", PVStatus.INACTIVE.value), ["PV:1"])
+        adapter._channels["PV:1"].properties.append(CFProperty("archiver", "ops", "yes"))
+
+        # channels are written back with a set, which replaces the stored channel
+        proc._update_channelfinder({"PV:1": RecordInfo(pv_name="PV:1")}, [], ioc)
+
+        properties = {p.name: p.value for p in adapter._channels["PV:1"].properties}
+        assert properties[CFPropertyName.PV_STATUS.value] == PVStatus.ACTIVE.value
+        assert properties["archiver"] == "yes"
+
+    def test_clean_service_fetches_names_only(self):
+        proc, adapter = self._make_proc()
+        adapter.set_channels([make_channel("PV:1")])
+        assert proc.get_active_channels(DEFAULT_RECCEIVER_ID)[0].properties == []
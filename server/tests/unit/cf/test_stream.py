@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from recceiver.cf.stream import JSONArrayDecoder, iter_json_array
+
+
+def split_every(data: bytes, size: int):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class TestJSONArrayDecoder:
+    def test_yields_elements_across_chunk_boundaries(self):
+        items = [{"name": f"PV:{i}", "properties": [{"name": "iocid", "value": "é"}]} for i in range(20)]
+        data = json.dumps(items).encode()
+        assert list(iter_json_array(split_every(data, 7))) == items
+
+    def test_elements_are_returned_before_the_array_ends(self):
+        decoder = JSONArrayDecoder()
+        assert decoder.feed(b'[{"name": "PV:1"}, {"na') == [{"name": "PV:1"}]
+        assert decoder.feed(b'me": "PV:2"}]') == [{"name": "PV:2"}]
+        assert decoder.close() == []
+
+    def test_scalar_split_at_chunk_boundary_is_not_truncated(self):
+        assert list(iter_json_array([b"[12", b"34, 5", b"]"])) == [1234, 5]
+
+    def test_empty_array(self):
+        assert list(iter_json_array([b" [ ", b"]\n"])) == []
+
+    def test_empty_body_is_an_empty_array(self):
+        assert list(iter_json_array([])) == []
+
+    def test_truncated_array_raises(self):
+        with pytest.raises(ValueError):
+            list(iter_json_array([b'[{"name": "PV:1"}, {"name"']))
+
+    def test_non_array_raises(self):
+        with pytest.raises(ValueError):
+            list(iter_json_array([b'{"name": "PV:1"}']))
+
+    def test_missing_separator_raises(self):
+        with pytest.raises(ValueError):
+            list(iter_json_array([b'[{"a": 1} {"b": 2}]']))
@@ -0,0 +1,110 @@
+from twisted.internet import task
+from twisted.internet.address import IPv4Address
+from twisted.internet.testing import StringTransport
+
+from recceiver.capture import CaptureFile, ReplayFactory, read_capture
+from recceiver.protocol import messages
+from recceiver.recast import CastFactory
+
+PEER = IPv4Address("TCP", "10.0.0.1", 5001)
+
+GREETING = messages.ClientGreeting(0, 0, 42).frame()
+RECORD = messages.AddRecord(1, messages.RecordKind.RECORD, "ai", "PV:1").frame()
+DONE = messages.UploadDone().frame()
+
+
+def capture(path, events, peer=PEER):
+    cap = CaptureFile(str(path), flush_interval=0)
+    cap.start()
+    sid = cap.open(peer)
+    for data in events:
+        cap.data(sid, data)
+    cap.close(sid)
+    cap.stop()
+
+
+class TestReadCapture:
+    def test_chunks_are_split_into_messages(self, tmp_path):
+        stream = GREETING + RECORD + messages.Pong(7).frame() + DONE
+        capture(tmp_path / "c", [stream[:5], stream[5:20], stream[20:]])
+
+        (session,) = read_capture(tmp_path / "c")
+        assert session.peer == "10.0.0.1:5001"
+        assert [frame for _, frame in session.frames] == [GREETING, RECORD, DONE]
+        assert session.closed >= session.frames[-1][0]
+
+    def test_runs_appended_to_one_file(self, tmp_path):
+        path = tmp_path / "c"
+        capture(path, [GREETING, RECORD])
+        # a restart appends sessions numbered from 1 again
+        capture(path, [GREETING, DONE], IPv4Address("TCP", "10.0.0.2", 5002))
+
+        first, second = read_capture(path)
+        assert (first.sid, second.sid) == (1, 1)
+        assert (first.peer, second.peer) == ("10.0.0.1:5001", "10.0.0.2:5002")
+        assert [frame for _, frame in first.frames] == [GREETING, RECORD]
+        assert [frame for _, frame in second.frames] == [GREETING, DONE]
+
+    def test_truncated_capture(self, tmp_path, caplog):
+        path = tmp_path / "c"
+        capture(path, [GREETING, RECORD])
+        # cut into the record, dropping the close event
+        path.write_bytes(path.read_bytes()[: -(17 + 3)])
+        (session,) = read_capture(path)
+        assert [frame for _, frame in session.frames] == [GREETING]
+        assert "truncated" in caplog.text
+
+
+class TestCastReceiverCapture:
+    def test_received_bytes_are_captured(self, tmp_path):
+        factory = CastFactory()
+        factory.capture = CaptureFile(str(tmp_path / "c"), flush_interval=0)
+        factory.capture.start()
+        factory.commit = lambda trans: None
+        proto = factory.buildProtocol(PEER)
+        transport = StringTransport(peerAddress=PEER)
+        proto.makeConnection(transport)
+        proto.dataReceived(GREETING + RECORD)
+        proto._ping_timer.cancel()
+        proto.connectionLost()
+        factory.capture.stop()
+
+        (session,) = read_capture(tmp_path / "c")
+        assert [frame for _, frame in session.frames] == [GREETING, RECORD]
+
+
+class TestReplayClient:
+    def make_client(self, tmp_path, speed):
+        capture(tmp_path / "c", [GREETING, RECORD, DONE])
+        (session,) = read_capture(tmp_path / "c")
+        session.frames = [(0.0, GREETING), (2.0, RECORD), (4.0, DONE)]
+        session.closed = 8.0
+        clock = task.Clock()
+        factory = ReplayFactory(session, clock, speed)
+        proto = factory.buildProtocol(PEER)
+        transport = StringTransport()
+        proto.makeConnection(transport)
+        return clock, factory, proto, transport
+
+    def test_waits_for_greeting_then_keeps_pace(self, tmp_path):
+        clock, factory, proto, transport = self.make_client(tmp_path, speed=2.0)
+        clock.advance(10)
+        assert transport.value() == b""
+
+        proto.dataReceived(messages.ServerGreeting().frame())
+        assert transport.value() == GREETING
+        clock.advance(1)
+        assert transport.value() == GREETING + RECORD
+        clock.advance(2)
+        assert not transport.disconnecting
+        clock.advance(1)
+        assert transport.disconnecting
+
+    def test_answers_pings(self, tmp_path):
+        clock, factory, proto, transport = self.make_client(tmp_path, speed=0)
+        proto.dataReceived(messages.ServerGreeting().frame() + messages.Ping(1234).frame())
+        assert transport.value() == GREETING + RECORD + DONE + messages.Pong(1234).frame()
+        clock.advance(0)
+        assert transport.disconnecting
+        proto.connectionLost()
+        assert factory.finished.result == 3
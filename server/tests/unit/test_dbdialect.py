@@ -0,0 +1,94 @@
+import sqlite3
+
+import pytest
+
+from recceiver.dbdialect import PostgresDialect, SQLiteDialect, copy_text, get_dialect
+from tests.unit.conftest import make_adapter
+
+
+class RecordingCursor:
+    """Records the statements run on it, like a psycopg2 cursor."""
+
+    def __init__(self):
+        self.calls = []
+
+    def executemany(self, sql, rows):
+        self.calls.append(("executemany", sql, list(rows)))
+
+    def execute(self, sql, params=()):
+        self.calls.append(("execute", sql, params))
+
+    def fetchone(self):
+        return (7,)
+
+    def copy_expert(self, sql, buf):
+        self.calls.append(("copy_expert", sql, buf.read()))
+
+
+def postgres(**values) -> PostgresDialect:
+    return get_dialect("psycopg2", make_adapter("db", values=values))
+
+
+class TestGetDialect:
+    def test_by_dbtype(self):
+        conf = make_adapter("db")
+        assert isinstance(get_dialect("sqlite3", conf), SQLiteDialect)
+        assert isinstance(get_dialect("psycopg2", conf), PostgresDialect)
+        assert isinstance(get_dialect("psycopg", conf), PostgresDialect)
+
+    def test_unknown_dbtype(self):
+        with pytest.raises(ValueError, match="MySQLdb"):
+            get_dialect("MySQLdb", make_adapter("db"))
+
+
+class TestSQLiteDialect:
+    def test_upsert_replaces(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE t (host INTEGER, key TEXT, value TEXT, UNIQUE(host, key))")
+        upsert = get_dialect("sqlite3", make_adapter("db")).upsert("t", ("host", "key", "value"), ("host", "key"))
+        conn.executemany(upsert, [(1, "a", "old"), (1, "a", "new")])
+        assert conn.execute("SELECT * FROM t").fetchall() == [(1, "a", "new")]
+
+    def test_insert_id(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)")
+        dialect = get_dialect("sqlite3", make_adapter("db"))
+        cur = conn.cursor()
+        assert dialect.insert_id(cur, "t", ("name",), ("a",)) == 1
+        assert dialect.insert_id(cur, "t", ("name",), ("b",)) == 2
+
+    def test_connection_args(self):
+        dbargs = {}
+        get_dialect("sqlite3", make_adapter("db", values={"statementCache": 16})).connection_args(dbargs)
+        assert dbargs["cached_statements"] == 16
+        assert dbargs["check_same_thread"] is False
+        assert callable(dbargs["cp_openfun"])
+
+
+class TestPostgresDialect:
+    def test_placeholders(self):
+        assert postgres().sql("SELECT id FROM t WHERE a=? AND b=?") == "SELECT id FROM t WHERE a=%s AND b=%s"
+
+    def test_upsert_on_conflict(self):
+        assert postgres().upsert("servinfo", ("host", "key", "value"), ("host", "key")) == (
+            "INSERT INTO servinfo (host,key,value) VALUES (%s,%s,%s) "
+            "ON CONFLICT (host,key) DO UPDATE SET value = EXCLUDED.value"
+        )
+
+    def test_insert_id_returning(self):
+        cur = RecordingCursor()
+        assert postgres().insert_id(cur, "server", ("hostname", "port"), ("h", 1)) == 7
+        assert cur.calls == [("execute", "INSERT INTO server (hostname,port) VALUES (%s,%s) RETURNING id", ("h", 1))]
+
+    def test_few_rows_are_inserted(self):
+        cur = RecordingCursor()
+        postgres(copyMin=3).bulk_insert(cur, "record", ("host", "id"), iter([(1, 1), (1, 2)]))
+        assert cur.calls == [("executemany", "INSERT INTO record (host,id) VALUES (%s,%s)", [(1, 1), (1, 2)])]
+
+    def test_many_rows_are_copied(self):
+        cur = RecordingCursor()
+        postgres(copyMin=2).bulk_insert(cur, "record_name", ("rec", "rname"), iter([(1, "A"), (2, "B")]))
+        assert cur.calls == [("copy_expert", "COPY record_name (rec,rname) FROM STDIN", "1\tA\n2\tB\n")]
+
+    def test_copy_text_escapes(self):
+        assert list(copy_text([(1, "a\tb\\c\nd", None)])) == ["1\ta\\tb\\\\c\\nd\t\\N\n"]
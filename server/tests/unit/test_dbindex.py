@@ -0,0 +1,158 @@
+import json
+import sqlite3
+
+import pytest
+from twisted.web.test.requesthelper import DummyRequest
+
+from recceiver.dbindex import PVIndex, PVIndexResource
+from tests.unit.test_dbstore import SCHEMA, FakePool, disconnect, make_processor, make_transaction, upload
+
+
+def make_index() -> PVIndex:
+    index = PVIndex()
+    tr = upload(1, {1: "A:1", 2: "A:2", 3: "B:1"}, {1: {"archive": "yes"}, 3: {"archive": "no"}})
+    tr.aliases[2].append("Z:ALIAS")
+    index.apply(10, tr)
+    other = upload(2, {1: "A:3"})
+    other.client_infos = {"IOCNAME": "IOC2"}
+    index.apply(20, other)
+    return index
+
+
+def found(results):
+    return [r["name"] for r in results]
+
+
+class TestPVIndex:
+    def test_prefix_and_wildcard_search(self):
+        index = make_index()
+        assert found(index.find("A:*")) == ["A:1", "A:2", "A:3"]
+        assert found(index.find("A:?")) == ["A:1", "A:2", "A:3"]
+        assert found(index.find("*:1")) == ["A:1", "B:1"]
+        assert found(index.find("B:1")) == ["B:1"]
+        assert found(index.find("A:*", limit=2)) == ["A:1", "A:2"]
+
+    def test_alias(self):
+        (result,) = make_index().find("Z:*")
+        assert result["aliasOf"] == "A:2"
+        assert result["iocName"] == "IOC1"
+
+    def test_filters(self):
+        index = make_index()
+        assert found(index.find(ioc="IOC2")) == ["A:3"]
+        assert found(index.find(info="archive")) == ["A:1", "B:1"]
+        assert found(index.find(info="archive=no")) == ["B:1"]
+        assert found(index.find("A:*", ioc="IOC1", info="archive")) == ["A:1"]
+
+    def test_update_and_delete(self):
+        index = make_index()
+        index.find("*")  # merge the sorted names
+        update = make_transaction(1, initial=False)
+        update.records_to_add = {1: ("C:1", "ai")}
+        update.records_to_delete = {3}
+        update.record_infos_to_add = {2: {"archive": "yes"}}
+        index.apply(10, update)
+
+        assert found(index.find("*")) == ["A:2", "A:3", "C:1", "Z:ALIAS"]
+        assert found(index.find(info="archive")) == ["A:2", "Z:ALIAS"]
+
+    def test_disconnect_and_reconnect(self):
+        index = make_index()
+        index.find("*")
+        index.apply(10, disconnect(1))
+        assert found(index.find("*")) == ["A:3"]
+        assert [ioc["iocName"] for ioc in index.find_iocs()] == ["IOC2"]
+
+        index.apply(10, upload(1, {1: "A:1"}))
+        assert found(index.find("*")) == ["A:1", "A:3"]
+
+    def test_same_name_on_two_iocs(self):
+        index = make_index()
+        index.apply(30, upload(3, {1: "A:1"}))
+        assert [r["server"] for r in index.find("A:1")] == [10, 30]
+        index.apply(10, disconnect(1))
+        assert [r["server"] for r in index.find("A:1")] == [30]
+
+    def test_find_iocs(self):
+        (ioc,) = make_index().find_iocs("IOC1")
+        assert ioc["records"] == 3
+        assert ioc["hostname"] == "10.0.0.1"
+
+
+def get(resource, path: bytes, **args):
+    request = DummyRequest([])
+    request.path = path
+    request.args = {k.encode(): [str(v).encode()] for k, v in args.items()}
+    return request, resource.render_GET(request)
+
+
+class TestPVIndexResource:
+    def test_pvs(self):
+        request, body = get(PVIndexResource(make_index()), b"/pvs", name="A:*", ioc="IOC1")
+        assert [pv["name"] for pv in json.loads(body)] == ["A:1", "A:2"]
+        assert request.responseHeaders.getRawHeaders(b"Content-Type") == [b"application/json"]
+
+    def test_iocs(self):
+        _, body = get(PVIndexResource(make_index()), b"/iocs")
+        assert [ioc["iocName"] for ioc in json.loads(body)] == ["IOC1", "IOC2"]
+
+    def test_limit_is_capped(self):
+        _, body = get(PVIndexResource(make_index(), max_limit=1), b"/pvs", limit=100)
+        assert len(json.loads(body)) == 1
+
+    def test_errors(self):
+        request, _ = get(PVIndexResource(make_index()), b"/pvs", limit="many")
+        assert request.responseCode == 400
+        for limit in ("0", "-1"):
+            request, _ = get(PVIndexResource(make_index()), b"/pvs", limit=limit)
+            assert request.responseCode == 400
+        request, _ = get(PVIndexResource(make_index()), b"/other")
+        assert request.responseCode == 404
+
+    def test_undecodable_argument(self):
+        request = DummyRequest([])
+        request.path = b"/pvs"
+        request.args = {b"name": [b"\xff"]}
+        body = PVIndexResource(make_index()).render_GET(request)
+        assert request.responseCode == 400
+        assert json.loads(body) == {"error": "query arguments must be UTF-8"}
+
+
+class TestDBProcessorIndex:
+    @pytest.fixture
+    def conn(self):
+        conn = sqlite3.connect(":memory:")
+        conn.executescript(SCHEMA.read_text())
+        yield conn
+        conn.close()
+
+    def test_committed_transactions_update_index(self, conn):
+        proc = make_processor()
+        proc.index = PVIndex()
+        proc.batch_max = 1
+        proc.pool = FakePool(conn)
+
+        proc.commit(upload(1, {1: "PV:1", 2: "PV:2"}))
+        bad = make_transaction(99, initial=False)  # unknown source, fails
+        bad.records_to_add = {1: ("PV:BAD", "ai")}
+        proc.commit(bad).addErrback(lambda _: None)
+
+        assert found(proc.index.find("PV:*")) == ["PV:1", "PV:2"]
+
+    def test_restart_loads_adopted_servers(self, conn):
+        cur = conn.cursor()
+        tr = upload(1, {1: "PV:1", 2: "PV:2"}, {1: {"archive": "yes"}})
+        tr.aliases[2].append("PV:ALIAS")
+        make_processor()._commit(cur, tr)
+
+        proc = make_processor()
+        proc.index = PVIndex()
+        proc.setupDB(cur)
+
+        assert found(proc.index.find("PV:*")) == ["PV:1", "PV:2", "PV:ALIAS"]
+        assert found(proc.index.find(ioc="IOC1", info="archive=yes")) == ["PV:1"]
+
+        # not reconnected within the grace period
+        for op, args in proc.scheduled:
+            op(cur, *args)
+        assert len(proc.index) == 0
@@ -0,0 +1,131 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from recceiver import dbschema
+from recceiver.dbdialect import get_dialect
+from tests.unit.conftest import make_adapter
+from tests.unit.test_dbstore import make_processor, names, upload
+
+SCHEMA = Path(__file__).parents[2] / "recceiver.sqlite3"
+
+TABLES = {name: name for name in ("server", "servinfo", "record", "record_name", "recinfo")}
+
+# indexes of recceiver.sqlite3 before schema versioning
+UNVERSIONED_INDEXES = """
+CREATE INDEX servinfo_host ON servinfo(host);
+CREATE INDEX record_host ON record(host);
+CREATE UNIQUE INDEX record_id_host ON record(id, host);
+CREATE INDEX recinfo_rec ON recinfo(rec);
+DROP INDEX record_host_id;
+DROP INDEX server_owner;
+"""
+
+
+@pytest.fixture
+def cur():
+    conn = sqlite3.connect(":memory:")
+    yield conn.cursor()
+    conn.close()
+
+
+@pytest.fixture
+def dialect():
+    return get_dialect("sqlite3", make_adapter("db"))
+
+
+def indexes(cur):
+    cur.execute("SELECT tbl_name, name FROM sqlite_master WHERE type='index' ORDER BY tbl_name, name")
+    return cur.fetchall()
+
+
+def versions(cur):
+    cur.execute("SELECT version FROM recceiver_schema ORDER BY version")
+    return [row[0] for row in cur.fetchall()]
+
+
+class TestMigrate:
+    def test_empty_database_matches_schema_file(self, cur, dialect):
+        assert dbschema.migrate(cur, dialect, TABLES) == dbschema.SCHEMA_VERSION
+        assert versions(cur) == [1, 2]
+
+        shipped = sqlite3.connect(":memory:")
+        shipped.executescript(SCHEMA.read_text())
+        assert indexes(cur) == indexes(shipped.cursor())
+
+    def test_unversioned_database_is_migrated(self, cur, dialect):
+        cur.executescript(SCHEMA.read_text() + UNVERSIONED_INDEXES)
+        cur.execute("INSERT INTO server (hostname, port, owner) VALUES ('h', 1, 42)")
+
+        dbschema.migrate(cur, dialect, TABLES)
+
+        assert ("record", "record_host_id") in indexes(cur)
+        assert ("record", "record_host") not in indexes(cur)
+        assert ("recinfo", "recinfo_rec") not in indexes(cur)
+        cur.execute("SELECT COUNT(*) FROM server")
+        assert cur.fetchone() == (1,)
+
+    def test_up_to_date_database_is_left_alone(self, cur, dialect):
+        dbschema.migrate(cur, dialect, TABLES)
+        before = indexes(cur)
+        dbschema.migrate(cur, dialect, TABLES)
+        assert versions(cur) == [1, 2]
+        assert indexes(cur) == before
+
+    def test_stops_at_target(self, cur, dialect):
+        assert dbschema.migrate(cur, dialect, TABLES, target=1) == 1
+        assert ("record", "record_host") in indexes(cur)
+
+    def test_newer_database_is_refused(self, cur, dialect):
+        dbschema.migrate(cur, dialect, TABLES)
+        cur.execute("INSERT INTO recceiver_schema (version) VALUES (?)", (dbschema.SCHEMA_VERSION + 1,))
+        with pytest.raises(RuntimeError, match="newer"):
+            dbschema.migrate(cur, dialect, TABLES)
+
+    def test_configured_table_names(self, cur, dialect):
+        tables = {name: "rc_" + name for name in TABLES}
+        dbschema.migrate(cur, dialect, tables)
+        assert ("rc_record", "rc_record_host_id") in indexes(cur)
+        assert dbschema.missing_indexes(cur, dialect, tables) == []
+
+
+class TestChecks:
+    def test_missing_indexes(self, cur, dialect):
+        cur.executescript(SCHEMA.read_text() + UNVERSIONED_INDEXES)
+        assert sorted(dbschema.missing_indexes(cur, dialect, TABLES)) == ["record_host_id", "server_owner"]
+
+    def test_table_sizes(self, cur, dialect):
+        dbschema.migrate(cur, dialect, TABLES)
+        cur.execute("INSERT INTO server (hostname, port, owner) VALUES ('h', 1, 42)")
+        assert dbschema.table_sizes(cur, TABLES) == {
+            "server": 1,
+            "servinfo": 0,
+            "record": 0,
+            "record_name": 0,
+            "recinfo": 0,
+        }
+
+
+class TestSetupDB:
+    def test_creates_schema_then_commits(self, cur, caplog):
+        cur.execute("PRAGMA foreign_keys = ON")
+        proc = make_processor()
+        proc.setupDB(cur)
+
+        proc._commit(cur, upload(1, {1: "PV:1"}))
+
+        assert names(cur, 1) == [(1, "PV:1")]
+        assert "Database rows: server=0" in caplog.text
+        assert "missing indexes" not in caplog.text
+
+    def test_warns_about_missing_indexes(self, cur, caplog):
+        cur.executescript(SCHEMA.read_text() + UNVERSIONED_INDEXES)
+        proc = make_processor()
+        # record the schema as current without the indexes of version 2
+        dbschema.current_version(cur)
+        cur.execute("INSERT INTO recceiver_schema (version) VALUES (?)", (dbschema.SCHEMA_VERSION,))
+
+        proc.setupDB(cur)
+
+        assert "missing indexes" in caplog.text
@@ -0,0 +1,549 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+from twisted.internet import defer
+from twisted.internet.address import IPv4Address
+from twisted.python.failure import Failure
+
+from recceiver.dbstore import DBProcessor
+from recceiver.processors import ProcessorQueue
+from recceiver.recast import Transaction
+from tests.unit.conftest import make_adapter
+
+SCHEMA = Path(__file__).parents[2] / "recceiver.sqlite3"
+
+
+@pytest.fixture
+def cur():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA.read_text())
+    yield conn.cursor()
+    conn.close()
+
+
+def make_processor() -> DBProcessor:
+    proc = DBProcessor("db", make_adapter("db", values={"idkey": 42, "dbtype": "sqlite3", "dbname": ":memory:"}))
+    proc.sources = {}  # normally set up by startService()
+    proc.scheduled = []
+    # run reactor calls inline and record the grace-period timers instead of starting them
+    proc._call_in_reactor = lambda fn, *args, **kwargs: fn(*args, **kwargs)
+    proc._schedule = lambda op, *args, **kwargs: proc.scheduled.append((op, args))
+    proc._start_purge = lambda: None
+    return proc
+
+
+def purge(proc: DBProcessor, cur) -> int:
+    """Run purge steps until none remain; returns the number of steps."""
+    steps = 0
+    while proc._purge_step(cur):
+        steps += 1
+    return steps
+
+
+class FakePool:
+    """Runs interactions synchronously on one sqlite3 connection, like a one-thread ConnectionPool."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.interactions = 0
+
+    def runInteraction(self, interaction, *args):
+        self.interactions += 1
+        cur = self.conn.cursor()
+        try:
+            result = interaction(cur, *args)
+        except Exception:
+            self.conn.rollback()
+            return defer.fail()
+        self.conn.commit()
+        return defer.succeed(result)
+
+
+def make_transaction(srcid: int = 1, initial: bool = True) -> Transaction:
+    tr = Transaction(IPv4Address("TCP", "10.0.0.1", 5000 + srcid), srcid)
+    tr.initial = initial
+    return tr
+
+
+def names(cur, prim: int):
+    cur.execute("SELECT r.id, n.rname FROM record r JOIN record_name n ON n.rec = r.pkey WHERE n.prim = ?", (prim,))
+    return sorted(cur.fetchall())
+
+
+class TestDBProcessorCommit:
+    def test_initial_upload(self, cur):
+        proc = make_processor()
+        tr = make_transaction()
+        tr.client_infos = {"IOCNAME": "IOC1"}
+        tr.records_to_add = {1: ("PV:1", "ai"), 2: ("PV:2", "bo")}
+        tr.aliases[1].append("PV:1:ALIAS")
+        tr.record_infos_to_add = {2: {"archive": "yes"}}
+
+        proc._commit(cur, tr)
+
+        cur.execute("SELECT id, rtype FROM record ORDER BY id")
+        assert cur.fetchall() == [(1, "ai"), (2, "bo")]
+        assert names(cur, 1) == [(1, "PV:1"), (2, "PV:2")]
+        assert names(cur, 0) == [(1, "PV:1:ALIAS")]
+        cur.execute("SELECT r.id, i.key, i.value FROM recinfo i JOIN record r ON i.rec = r.pkey")
+        assert cur.fetchall() == [(2, "archive", "yes")]
+        cur.execute("SELECT key, value FROM servinfo")
+        assert cur.fetchall() == [("IOCNAME", "IOC1")]
+
+    def test_update_replaces_records_and_adds_info_to_existing(self, cur):
+        proc = make_processor()
+        tr = make_transaction()
+        tr.records_to_add = {1: ("PV:1", "ai"), 2: ("PV:2", "bo")}
+        proc._commit(cur, tr)
+
+        update = make_transaction(initial=False)
+        update.records_to_add = {1: ("PV:1:NEW", "ao")}
+        update.records_to_delete = {2}
+        update.record_infos_to_add = {1: {"k": "v"}}
+        proc._commit(cur, update)
+
+        assert names(cur, 1) == [(1, "PV:1:NEW")]
+        cur.execute("SELECT key, value FROM recinfo")
+        assert cur.fetchall() == [("k", "v")]
+
+    def test_disconnect_removes_server(self, cur):
+        proc = make_processor()
+        proc.reconnect_grace = 0
+        tr = make_transaction()
+        tr.records_to_add = {1: ("PV:1", "ai")}
+        proc._commit(cur, tr)
+
+        gone = make_transaction(initial=False)
+        gone.connected = False
+        proc._commit(cur, gone)
+
+        # marked for purging at once, rows removed by the background purge
+        cur.execute("SELECT owner FROM server")
+        assert cur.fetchall() == [(-42,)]
+        assert proc.sources == {}
+        purge(proc, cur)
+        cur.execute("SELECT COUNT(*) FROM record_name")
+        assert cur.fetchone() == (0,)
+        cur.execute("SELECT COUNT(*) FROM server")
+        assert cur.fetchone() == (0,)
+
+    def test_purge_deletes_in_batches(self, cur):
+        proc = make_processor()
+        proc.reconnect_grace = 0
+        proc.purge_batch = 10
+        tr = make_transaction()
+        tr.records_to_add = {i: (f"PV:{i}", "ai") for i in range(25)}
+        proc._commit(cur, tr)
+        gone = make_transaction(initial=False)
+        gone.connected = False
+        proc._commit(cur, gone)
+
+        assert purge(proc, cur) == 3
+        cur.execute("SELECT COUNT(*) FROM record")
+        assert cur.fetchone() == (0,)
+
+    def test_cleanup_marks_own_servers_only(self, cur):
+        proc = make_processor()
+        proc._commit(cur, make_transaction())
+        cur.execute("INSERT INTO server (hostname, port, owner) VALUES ('other', 1, 7)")
+
+        proc.cleanupDB(cur)
+
+        cur.execute("SELECT owner FROM server ORDER BY owner")
+        assert cur.fetchall() == [(-42,), (7,)]
+
+
+def upload(srcid: int, records, infos=None) -> Transaction:
+    tr = make_transaction(srcid)
+    tr.client_infos = {"IOCNAME": "IOC1"}
+    tr.records_to_add = {recid: (name, "ai") for recid, name in records.items()}
+    tr.record_infos_to_add = infos or {}
+    return tr
+
+
+def disconnect(srcid: int) -> Transaction:
+    tr = make_transaction(srcid, initial=False)
+    tr.connected = False
+    return tr
+
+
+def count_changes(cur) -> int:
+    return cur.connection.total_changes
+
+
+class TestDBProcessorReconnect:
+    def test_unchanged_records_are_not_rewritten(self, cur):
+        proc = make_processor()
+        records = {i: f"PV:{i}" for i in range(1, 51)}
+        proc._commit(cur, upload(1, records, {1: {"archive": "yes"}}))
+        proc._commit(cur, disconnect(1))
+
+        before = count_changes(cur)
+        records[2] = "PV:2:RENAMED"
+        proc._commit(cur, upload(2, records, {1: {"archive": "yes"}}))
+
+        # server and client info updates plus one rewritten record, not all 50
+        assert count_changes(cur) - before < 10
+        assert (2, "PV:2:RENAMED") in names(cur, 1)
+        cur.execute("SELECT COUNT(*) FROM server")
+        assert cur.fetchone() == (1,)
+
+    def test_records_not_sent_again_are_purged_after_grace(self, cur):
+        proc = make_processor()
+        proc._commit(cur, upload(1, {1: "PV:1", 2: "PV:2"}))
+        proc._commit(cur, disconnect(1))
+        proc._commit(cur, upload(2, {1: "PV:1"}))
+
+        purges = [(op, args) for op, args in proc.scheduled if op == proc._purge_stale]
+        for op, args in purges:
+            op(cur, *args)
+
+        assert names(cur, 1) == [(1, "PV:1")]
+
+    def test_stale_purge_waits_for_the_end_of_the_upload(self, cur):
+        proc = make_processor()
+        proc._commit(cur, upload(1, {1: "PV:1", 2: "PV:2", 3: "PV:3"}))
+        proc._commit(cur, disconnect(1))
+        proc._commit(cur, upload(2, {1: "PV:1"}))
+        first = [(op, args) for op, args in proc.scheduled if op == proc._purge_stale]
+        # the rest of the upload, flushed as a later transaction
+        more = make_transaction(2, initial=False)
+        more.records_to_add = {2: ("PV:2", "ai")}
+        proc._commit(cur, more)
+
+        # the grace period after the first transaction ends mid-upload
+        for op, args in first:
+            op(cur, *args)
+        assert [name for _, name in names(cur, 1)] == ["PV:1", "PV:2", "PV:3"]
+
+        for op, args in proc.scheduled:
+            if op == proc._purge_stale:
+                op(cur, *args)
+        assert names(cur, 1) == [(1, "PV:1"), (2, "PV:2")]
+        assert proc.stale == {} and proc.stale_commits == {}
+
+    def test_retired_server_is_purged_when_ioc_stays_away(self, cur):
+        proc = make_processor()
+        proc._commit(cur, upload(1, {1: "PV:1"}))
+        proc._commit(cur, disconnect(1))
+        assert names(cur, 1) == [(1, "PV:1")]
+
+        for op, args in proc.scheduled:
+            op(cur, *args)
+        purge(proc, cur)
+
+        cur.execute("SELECT COUNT(*) FROM server")
+        assert cur.fetchone() == (0,)
+        assert proc.retired == {}
+
+    def test_fingerprints_reload_from_database(self, cur):
+        proc = make_processor()
+        proc._commit(cur, upload(1, {1: "PV:1"}, {1: {"k": "v"}}))
+        cached = dict(proc.fingerprints)
+        proc.fingerprints.clear()
+        srvid = proc.sources[1]
+        assert proc._fingerprints(cur, srvid) == cached[srvid]
+
+
+class TestDBProcessorSQLiteProfile:
+    def _pragma(self, conn, name):
+        return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+    def test_default_profile_is_applied_per_connection(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / "test.db"))
+        make_processor().dialect.open_connection(conn)
+        assert self._pragma(conn, "journal_mode") == "wal"
+        assert self._pragma(conn, "synchronous") == 1  # NORMAL
+        assert self._pragma(conn, "cache_size") == -65536
+        assert self._pragma(conn, "foreign_keys") == 1
+        conn.close()
+
+    def test_profile_from_config(self, tmp_path):
+        values = {"idkey": 42, "journalMode": "DELETE", "synchronous": "FULL", "pageSize": "8192", "mmapSize": ""}
+        proc = DBProcessor("db", make_adapter("db", values=values))
+        conn = sqlite3.connect(str(tmp_path / "test.db"))
+        proc.dialect.open_connection(conn)
+        assert self._pragma(conn, "journal_mode") == "delete"
+        assert self._pragma(conn, "synchronous") == 2  # FULL
+        assert self._pragma(conn, "page_size") == 8192
+        assert not any("mmap_size" in p for p in proc.dialect.pragmas)
+        conn.close()
+
+
+class TestDBProcessorGroupCommit:
+    def test_batch_max_flushes_one_interaction_and_resolves_each(self, cur):
+        proc = make_processor()
+        proc.batch_max = 3
+        proc.pool = FakePool(cur.connection)
+        good = make_transaction(srcid=1)
+        good.records_to_add = {1: ("PV:1", "ai")}
+        unknown = make_transaction(srcid=99, initial=False)  # no initial transaction seen
+        other = make_transaction(srcid=2)
+        other.records_to_add = {1: ("PV:2", "ai")}
+
+        results = []
+        for tr in (good, unknown, other):
+            proc.commit(tr).addBoth(results.append)
+
+        assert proc.pool.interactions == 1
+        assert results[0] is None and results[2] is None
+        assert results[1].check(KeyError)
+        assert names(cur, 1) == [(1, "PV:1"), (1, "PV:2")]
+
+    def test_transactions_through_the_processor_queue_are_batched(self, cur):
+        proc = make_processor()
+        proc.batch_max = 20
+        proc.pool = FakePool(cur.connection)
+        queue = ProcessorQueue(proc)
+
+        results = []
+        for srcid in range(1, 21):
+            tr = upload(srcid, {1: f"PV:{srcid}"})
+            tr.client_infos = {"IOCNAME": f"IOC{srcid}"}
+            queue.put(tr).addBoth(results.append)
+
+        assert proc.pool.interactions == 1
+        assert results == [None] * 20
+        assert len(names(cur, 1)) == 20
+
+    def test_failed_transaction_is_rolled_back_alone(self, cur):
+        proc = make_processor()
+        tr = make_transaction()
+        tr.records_to_add = {1: ("PV:1", "ai")}
+        bad = make_transaction(srcid=2)
+        bad.records_to_add = {1: ("PV:2", "ai")}
+        bad.aliases[1] = [None]  # violates NOT NULL on rname
+
+        results = proc._commit_batch(cur, [(proc._commit, (tr,)), (proc._commit, (bad,))])
+
+        assert results[0] == 1  # the server id
+        assert isinstance(results[1], Failure)
+        assert cur.connection.in_transaction  # one SQL transaction for the batch
+        cur.connection.commit()
+        assert names(cur, 1) == [(1, "PV:1")]
+        cur.execute("SELECT COUNT(*) FROM server")
+        assert cur.fetchone() == (1,)
+
+    def test_rolled_back_transaction_leaves_writer_state_alone(self, cur):
+        proc = make_processor()
+        proc._commit(cur, upload(1, {1: "PV:1", 2: "PV:2"}))
+        proc._commit(cur, disconnect(1))
+        scheduled, retired = len(proc.scheduled), dict(proc.retired)
+
+        bad = upload(2, {1: "PV:1"})
+        bad.aliases[1] = [None]  # violates NOT NULL on rname
+        proc._commit_batch(cur, [(proc._commit, (bad,))])
+
+        assert proc.retired == retired and proc.stale == {} and 2 not in proc.sources
+        assert len(proc.scheduled) == scheduled
+
+        more = make_transaction(2, initial=False)
+        more.records_to_add = {2: ("PV:2", "ai")}
+        more.aliases[2] = [None]
+        results = proc._commit_batch(cur, [(proc._commit, (upload(2, {1: "PV:1"}),)), (proc._commit, (more,))])
+
+        assert isinstance(results[1], Failure)
+        srvid = proc.sources[2]
+        # PV:2 is stale again, and only the reconnect armed a purge
+        assert proc.stale == {srvid: {2}}
+        assert [op for op, _ in proc.scheduled[scheduled:]] == [proc._purge_stale]
+
+    def test_failed_commit_restores_writer_state(self, cur):
+        proc = make_processor()
+        proc.batch_max = 1
+        proc.pool = FakePool(cur.connection)
+        proc.commit(upload(1, {1: "PV:1"}))
+        sources, retired, scheduled = dict(proc.sources), dict(proc.retired), len(proc.scheduled)
+
+        class FailingCommitPool(FakePool):
+            def runInteraction(self, interaction, *args):
+                interaction(self.conn.cursor(), *args)
+                self.conn.rollback()
+                return defer.fail(RuntimeError("COMMIT failed"))
+
+        proc.pool = FailingCommitPool(cur.connection)
+        failed = []
+        proc.commit(disconnect(1)).addErrback(failed.append)
+
+        assert failed and failed[0].check(RuntimeError)
+        assert proc.sources == sources and proc.retired == retired
+        assert len(proc.scheduled) == scheduled
+
+        # the disconnect can be committed again once the database is back
+        proc.pool = FakePool(cur.connection)
+        results = []
+        proc.commit(disconnect(1)).addBoth(results.append)
+        assert results == [None]
+        assert list(proc.retired.values()) == [sources[1]]
+
+    def test_stop_waits_for_pending_batches(self, cur):
+        proc = make_processor()
+        proc.batch_max = 1
+        proc.pool = ManualPool(cur.connection)
+        proc.commit(upload(1, {1: "PV:1"}))
+        other = upload(2, {1: "PV:2"})
+        other.client_infos = {"IOCNAME": "IOC2"}
+        proc.commit(other)  # pending behind the batch being written
+
+        stopped = []
+        proc.stopService().addCallback(stopped.append)
+        assert not stopped
+        proc.pool.run_all()
+
+        assert stopped and proc.pool.lost == []
+        assert names(cur, 1) == [(1, "PV:1"), (1, "PV:2")]
+
+
+class TestDBProcessorRestart:
+    def restart(self, cur, **values) -> DBProcessor:
+        proc = make_processor()
+        for key, value in values.items():
+            setattr(proc, key, value)
+        proc.setupDB(cur)
+        return proc
+
+    def test_reconnecting_ioc_adopts_its_rows(self, cur):
+        records = {i: f"PV:{i}" for i in range(1, 51)}
+        first = make_processor()
+        first._commit(cur, upload(1, records))
+        srvid = first.sources[1]
+
+        proc = self.restart(cur)
+        assert proc.retired == {("10.0.0.1", "IOC1"): srvid}
+
+        before = count_changes(cur)
+        proc._commit(cur, upload(2, records))
+
+        assert proc.sources[2] == srvid
+        assert count_changes(cur) - before < 10
+        assert len(names(cur, 1)) == 50
+
+    def test_ioc_not_reconnecting_is_purged_after_grace(self, cur):
+        make_processor()._commit(cur, upload(1, {1: "PV:1"}))
+
+        proc = self.restart(cur)
+        for op, args in proc.scheduled:
+            op(cur, *args)
+        purge(proc, cur)
+
+        cur.execute("SELECT COUNT(*) FROM server")
+        assert cur.fetchone() == (0,)
+
+    def test_servers_without_iocname_or_duplicated_are_purged(self, cur):
+        first = make_processor()
+        first._commit(cur, upload(1, {1: "PV:1"}))
+        first._commit(cur, upload(2, {1: "PV:1"}))  # same host and IOCNAME
+        anonymous = make_transaction(3)
+        anonymous.records_to_add = {1: ("PV:3", "ai")}
+        first._commit(cur, anonymous)
+
+        proc = self.restart(cur)
+
+        assert list(proc.retired.values()) == [first.sources[1]]
+        cur.execute("SELECT id FROM server WHERE owner = -42 ORDER BY id")
+        assert [row[0] for row in cur.fetchall()] == [first.sources[2], first.sources[3]]
+
+    def test_clean_on_start(self, cur):
+        make_processor()._commit(cur, upload(1, {1: "PV:1"}))
+
+        proc = self.restart(cur, clean_on_start=True)
+
+        assert proc.retired == {}
+        cur.execute("SELECT owner FROM server")
+        assert cur.fetchall() == [(-42,)]
+
+    def test_other_daemons_servers_are_left_alone(self, cur):
+        cur.execute("INSERT INTO server (hostname, port, owner) VALUES ('other', 1, 7)")
+        proc = self.restart(cur)
+        assert proc.retired == {}
+        cur.execute("SELECT owner FROM server")
+        assert cur.fetchall() == [(7,)]
+
+
+class ManualPool(FakePool):
+    """Holds interactions until run_next(), so the order of the writer ops can be observed."""
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.queue = []
+        self.ran = []
+
+    def runInteraction(self, interaction, *args):
+        d = defer.Deferred()
+        self.queue.append((interaction, args, d))
+        return d
+
+    def run_next(self):
+        interaction, args, d = self.queue.pop(0)
+        self.ran.append([op.__name__ for op, _ in args[0]])
+        FakePool.runInteraction(self, interaction, *args).chainDeferred(d)
+
+    def run_all(self):
+        while self.queue:
+            self.run_next()
+
+    def close(self):
+        # interactions still queued would be lost by a real pool
+        self.lost = list(self.queue)
+
+
+class TestDBProcessorChunks:
+    def test_large_upload_is_written_in_chunks(self, cur):
+        proc = make_processor()
+        proc.chunk_size = 10
+        proc.batch_max = 1
+        proc.pool = ManualPool(cur.connection)
+        records = {i: f"PV:{i}" for i in range(25)}
+        tr = upload(1, records, {i: {"k": str(i)} for i in range(25)})
+        tr.aliases[24].append("PV:24:ALIAS")
+
+        results = []
+        proc.commit(tr).addBoth(results.append)
+        proc.pool.run_all()
+
+        assert results == [None]
+        assert proc.pool.ran == [["_commit_head"]] + [["_commit_records"]] * 3 + [["_commit_tail"]]
+        assert names(cur, 1) == sorted((i, f"PV:{i}") for i in range(25))
+        assert names(cur, 0) == [(24, "PV:24:ALIAS")]
+        cur.execute("SELECT COUNT(*) FROM recinfo")
+        assert cur.fetchone() == (25,)
+
+    def test_other_writes_go_between_chunks(self, cur):
+        proc = make_processor()
+        proc.chunk_size = 10
+        proc.batch_max = 1
+        proc.pool = ManualPool(cur.connection)
+
+        proc.commit(upload(1, {i: f"PV:{i}" for i in range(30)}))
+        small = upload(2, {1: "OTHER:1"})
+        small.client_infos = {"IOCNAME": "IOC2"}
+        proc.commit(small)
+        proc.pool.run_all()
+
+        assert proc.pool.ran[:3] == [["_commit_head"], ["_commit"], ["_commit_records"]]
+        assert len(names(cur, 1)) == 31
+
+    def test_other_writes_go_between_chunks_through_the_processor_queue(self, cur):
+        proc = make_processor()
+        proc.chunk_size = 10
+        proc.batch_max = 1
+        proc.pool = ManualPool(cur.connection)
+        queue = ProcessorQueue(proc)
+
+        queue.put(upload(1, {i: f"PV:{i}" for i in range(30)}))
+        small = upload(2, {1: "OTHER:1"})
+        small.client_infos = {"IOCNAME": "IOC2"}
+        queue.put(small)
+        proc.pool.run_all()
+
+        assert proc.pool.ran[:3] == [["_commit_head"], ["_commit"], ["_commit_records"]]
+        assert len(names(cur, 1)) == 31
+
+    def test_small_upload_is_one_op(self, cur):
+        proc = make_processor()
+        proc.batch_max = 1
+        proc.pool = ManualPool(cur.connection)
+        proc.commit(upload(1, {1: "PV:1"}))
+        proc.pool.run_all()
+        assert proc.pool.ran == [["_commit"]]
@@ -0,0 +1,104 @@
+import json
+
+from twisted.internet.address import IPv4Address
+from twisted.internet.testing import StringTransport
+from twisted.web.test.requesthelper import DummyRequest
+
+from recceiver.iocstats import IOCStats, IOCStatsResource
+from recceiver.processors import ProcessorQueue
+from recceiver.protocol import messages
+from recceiver.recast import CastFactory
+from tests.unit.test_processors import FakeProcessor, connect, disconnect, make_controller, update
+
+
+def observe(stats, trans):
+    trans.stats = stats.observe(trans)
+    return trans
+
+
+class TestIOCStats:
+    def test_records_and_reconnects(self):
+        stats = IOCStats()
+        observe(stats, connect(1, {1: "A", 2: "B"}, {"IOCNAME": "ioc1"}))
+        observe(stats, update(1, {3: "C"}, deleted=[1]))
+        observe(stats, connect(2, {1: "D"}, {"IOCNAME": "ioc2"}))
+        observe(stats, disconnect(1))
+        observe(stats, connect(3, {1: "A"}, {"IOCNAME": "ioc1"}))
+
+        ioc1, ioc2 = stats.list()
+        assert (ioc1["iocName"], ioc1["records"], ioc1["reconnects"], ioc1["peer"]) == ("ioc1", 1, 1, "10.0.0.1:5003")
+        assert (ioc2["iocName"], ioc2["records"], ioc2["connected"]) == ("ioc2", 1, True)
+        assert [ioc["iocName"] for ioc in stats.list("reconnects", limit=1)] == ["ioc1"]
+
+    def test_disconnect_before_any_transaction(self):
+        stats = IOCStats()
+        assert stats.observe(disconnect(1)) is None
+        assert len(stats) == 0
+
+    def test_commit_latency_and_queue_position(self):
+        slow = FakeProcessor("cf")
+        queue = ProcessorQueue(slow, max_in_flight=1)
+        ctrl = make_controller(ProcessorQueue(FakeProcessor("db", sync=True)), queue)
+        stats = IOCStats(ctrl.queues.values())
+        for srcid in (1, 2, 3):
+            ctrl.commit(observe(stats, connect(srcid, {1: "A"}, {"IOCNAME": "ioc%d" % srcid})))
+
+        (last,) = stats.list("queue_position", limit=1)
+        assert (last["iocName"], last["queuePosition"]) == ("ioc3", {"cf": 2})
+        slow.release()
+        ioc1, ioc2, ioc3 = stats.list()
+        assert (set(ioc1["commitSeconds"]), ioc1["queuePosition"]) == ({"db", "cf"}, {})
+        assert (set(ioc2["commitSeconds"]), ioc2["queuePosition"]) == ({"db"}, {})
+        assert ioc3["queuePosition"] == {"cf": 1}
+
+
+class TestUploadStats:
+    def test_upload_size_and_duration(self):
+        peer = IPv4Address("TCP", "10.0.0.1", 5001)
+        factory = CastFactory()
+        factory.iocstats = IOCStats()
+        factory.commit = lambda trans: None
+        proto = factory.buildProtocol(peer)
+        proto.makeConnection(StringTransport(peerAddress=peer))
+        data = (
+            messages.ClientGreeting(0, 0, 42).frame()
+            + messages.AddInfo(0, "IOCNAME", "ioc1").frame()
+            + messages.AddRecord(1, messages.RecordKind.RECORD, "ai", "PV:1").frame()
+            + messages.UploadDone().frame()
+        )
+        proto.dataReceived(data)
+        proto.connectionLost()
+
+        (ioc,) = factory.iocstats.list()
+        assert (ioc["iocName"], ioc["records"], ioc["uploadBytes"], ioc["connected"]) == ("ioc1", 1, len(data), False)
+        assert ioc["uploadSeconds"] >= 0
+
+
+def get(resource, **args):
+    request = DummyRequest([b"iocstats"])
+    request.args = {k.encode(): [str(v).encode()] for k, v in args.items()}
+    return request, resource.render_GET(request)
+
+
+class TestIOCStatsResource:
+    def make_stats(self):
+        stats = IOCStats()
+        observe(stats, connect(1, {1: "A"}, {"IOCNAME": "small"}))
+        observe(stats, connect(2, {1: "A", 2: "B", 3: "C"}, {"IOCNAME": "big"}))
+        return stats
+
+    def test_top(self):
+        request, body = get(IOCStatsResource(self.make_stats()), sort="records", limit=1)
+        result = json.loads(body)
+        assert result["iocs"] == 2
+        assert [ioc["iocName"] for ioc in result["top"]] == ["big"]
+        assert request.responseHeaders.getRawHeaders(b"Content-Type") == [b"application/json"]
+
+    def test_errors(self):
+        request, _ = get(IOCStatsResource(self.make_stats()), limit="many")
+        assert request.responseCode == 400
+        request, _ = get(IOCStatsResource(self.make_stats()), sort="colour")
+        assert request.responseCode == 400
+        for limit in ("0", "-1"):
+            request, _ = get(IOCStatsResource(self.make_stats()), limit=limit)
+            assert request.responseCode == 400
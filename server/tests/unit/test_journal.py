@@ -0,0 +1,134 @@
+import pytest
+from twisted.internet import defer, task
+
+from recceiver import interfaces
+from recceiver.journal import MAGIC, JournalProcessor, decode_transaction, encode_transaction, read_journal, replay
+from recceiver.processors import ProcessorQueue
+from tests.unit.conftest import make_adapter
+from tests.unit.test_processors import FakeProcessor, connect, disconnect, make_controller, update
+
+
+def fields(trans):
+    address = trans.source_address
+    return (
+        address.host,
+        address.port,
+        trans.srcid,
+        trans.connected,
+        trans.initial,
+        trans.client_infos,
+        trans.records_to_add,
+        {recid: names for recid, names in trans.aliases.items() if names},
+        trans.record_infos_to_add,
+        trans.records_to_delete,
+    )
+
+
+def sample():
+    trans = connect(1, {1: "A", 2: "B:é"}, {"IOCNAME": "ioc1", "ENGINEER": ""})
+    trans.aliases[1].extend(["A:1", "A:2"])
+    trans.record_infos_to_add = {2: {"archive": "yes", "descr": "x" * 300}}
+    return trans
+
+
+class TestEncoding:
+    def test_round_trip(self):
+        trans = update(2, {3: "C"}, deleted=[1, 2], infos={4: {"k": "v"}})
+        for original in (sample(), trans, disconnect(3)):
+            stamp, decoded, end = decode_transaction(encode_transaction(original, 12.5))
+            assert stamp == 12.5
+            assert fields(decoded) == fields(original)
+
+    def test_session_ids_are_64_bit(self):
+        srcid = id(object())
+        original = connect(1, {1: "A"})
+        original.srcid = srcid
+        _, decoded, _ = decode_transaction(encode_transaction(original, 1.0))
+        assert decoded.srcid == srcid
+
+    def test_entries_follow_each_other(self):
+        buf = encode_transaction(sample(), 1.0) + encode_transaction(disconnect(1), 2.0)
+        _, _, end = decode_transaction(buf)
+        stamp, trans, _ = decode_transaction(buf, end)
+        assert (stamp, trans.connected) == (2.0, False)
+
+
+def write_journal(path, entries):
+    path.write_bytes(MAGIC + b"".join(encode_transaction(trans, stamp) for stamp, trans in entries))
+
+
+class TestReadJournal:
+    def test_reads_entries(self, tmp_path):
+        write_journal(tmp_path / "j", [(1.0, sample()), (2.0, disconnect(1))])
+        assert [(stamp, trans.connected) for stamp, trans in read_journal(tmp_path / "j")] == [
+            (1.0, True),
+            (2.0, False),
+        ]
+
+    def test_truncated_entry_ends_the_journal(self, tmp_path, caplog):
+        path = tmp_path / "j"
+        write_journal(path, [(1.0, sample()), (2.0, sample())])
+        path.write_bytes(path.read_bytes()[:-10])
+        assert [stamp for stamp, _ in read_journal(path)] == [1.0]
+        assert "truncated" in caplog.text
+
+    def test_not_a_journal(self, tmp_path):
+        (tmp_path / "j").write_bytes(b"something else")
+        with pytest.raises(ValueError):
+            list(read_journal(tmp_path / "j"))
+
+
+class TestJournalProcessor:
+    def test_appends_transactions(self, tmp_path):
+        path = tmp_path / "j"
+        for srcid in (1, 2):
+            proc = JournalProcessor("journal", make_adapter("journal", {"path": path}))
+            proc.startService()
+            assert proc.commit(connect(srcid, {1: "A"})).called
+            proc.writer.close()
+
+        assert [trans.srcid for _, trans in read_journal(path)] == [1, 2]
+
+    def test_is_a_processor(self, tmp_path):
+        proc = JournalProcessor("journal", make_adapter("journal", {"path": tmp_path / "j"}))
+        assert interfaces.IProcessor.providedBy(proc)
+
+
+class TestReplay:
+    def test_keeps_recorded_pacing(self):
+        clock = task.Clock()
+        clock.advance(1000)
+        proc = FakeProcessor("db", sync=True)
+        ctrl = make_controller(ProcessorQueue(proc, synchronous=True))
+        journal = [(50.0, connect(1, {1: "A"})), (54.0, update(1, {2: "B"})), (55.0, disconnect(1))]
+
+        d = replay(clock, ctrl, iter(journal), speed=2.0)
+        assert len(proc.committed) == 1
+        clock.advance(1.9)
+        assert len(proc.committed) == 1
+        clock.advance(0.1)
+        assert len(proc.committed) == 2
+        clock.advance(0.5)
+        assert d.result == 3
+
+    def test_maximum_speed_waits_for_queues(self):
+        proc = FakeProcessor("cf")
+        ctrl = make_controller(ProcessorQueue(proc))
+        journal = [(50.0, connect(1, {1: "A"})), (500.0, disconnect(1))]
+
+        d = replay(task.Clock(), ctrl, iter(journal), speed=0)
+        assert not d.called
+        proc.release()
+        proc.release()
+        assert d.result == 2
+
+
+def test_drained():
+    proc = FakeProcessor("cf")
+    queue = ProcessorQueue(proc)
+    assert queue.drained().called
+    queue.put(connect(1, {}))
+    d = queue.drained()
+    assert not d.called
+    proc.release()
+    assert isinstance(d, defer.Deferred) and d.called
@@ -1,11 +1,17 @@
+import struct
+
 import pytest
 
 pytest.importorskip("prometheus_client")
 
 from prometheus_client import CONTENT_TYPE_LATEST  # noqa: E402
+from twisted.internet.address import IPv4Address  # noqa: E402
+from twisted.internet.testing import StringTransport  # noqa: E402
 from twisted.web.test.requesthelper import DummyRequest  # noqa: E402
 
 from recceiver import metrics  # noqa: E402
+from recceiver.protocol import messages  # noqa: E402
+from recceiver.recast import CastFactory  # noqa: E402
 
 
 class TestMetricsAvailable:
@@ -17,6 +23,14 @@ class TestMetricsAvailable:
 
         assert isinstance(metrics.make_site(), Site)
 
+    def test_make_site_serves_children(self):
+        from twisted.web.resource import Resource
+
+        child = Resource()
+        root = metrics.make_site({b"iocstats": child}).resource
+        assert root.getChildWithDefault(b"iocstats", DummyRequest([])) is child
+        assert root.getChildWithDefault(b"metrics", DummyRequest([])) is root
+
 
 class TestMetricsEndpoint:
     def test_render_get_sets_prometheus_content_type(self):
@@ -36,5 +50,74 @@ class TestMetricsEndpoint:
             b"recceiver_tracked_channels",
             b"recceiver_cf_commits_total",
             b"recceiver_cf_commit_duration_seconds",
+            b"recceiver_cf_name_lookup_requests_total",
+            b"recceiver_cf_name_lookup_duration_seconds",
+            b"recceiver_processor_queue_depth",
+            b"recceiver_processor_queue_lag_seconds",
+            b"recceiver_processor_parked",
+            b"recceiver_processor_backlog",
+            b"recceiver_show_dropped_total",
+            b"recceiver_span_seconds",
+            b"recceiver_received_bytes_total",
+            b"recceiver_frames_total",
+            b"recceiver_protocol_errors_total",
+            b"recceiver_transaction_items",
+            b"recceiver_transaction_size",
+            b"recceiver_ping_rtt_seconds",
+            b"recceiver_upload_duration_seconds",
+            b"recceiver_upload_bytes",
+            b"recceiver_reactor_lag_seconds",
         ):
             assert name in body, f"{name!r} not found in metrics output"
+
+
+def sample(name, **labels):
+    return metrics._registry.get_sample_value(name, labels) or 0.0
+
+
+class TestIngestMetrics:
+    PEER = IPv4Address("TCP", "10.0.0.1", 5001)
+
+    def connect(self):
+        factory = CastFactory()
+        factory.commit = lambda trans: None
+        proto = factory.buildProtocol(self.PEER)
+        proto.makeConnection(StringTransport(peerAddress=self.PEER))
+        return proto
+
+    def test_counts_are_added_in_batches(self):
+        frames = sample("recceiver_frames_total", message="AddRecord")
+        received = sample("recceiver_received_bytes_total")
+        proto = self.connect()
+        proto.metricsBatch = 3
+        record = messages.AddRecord(1, messages.RecordKind.RECORD, "ai", "PV:1").frame()
+        data = messages.ClientGreeting(0, 0, 42).frame() + record
+        proto.dataReceived(data)
+        assert sample("recceiver_frames_total", message="AddRecord") == frames
+
+        proto.dataReceived(record)
+        assert sample("recceiver_frames_total", message="AddRecord") == frames + 2
+        assert sample("recceiver_received_bytes_total") == received + len(data) + len(record)
+        proto.connectionLost()
+
+    def test_protocol_errors_and_upload(self):
+        errors = sample("recceiver_protocol_errors_total", message="AddInfo")
+        uploads = sample("recceiver_upload_duration_seconds_count")
+        records = sample("recceiver_transaction_items_sum", kind="record")
+        proto = self.connect()
+        bad_info = messages.Header(messages.AddInfo.msg_id, 8).encode() + struct.pack("!IBxH", 1, 0, 0)
+        proto.dataReceived(
+            messages.ClientGreeting(0, 0, 42).frame()
+            + messages.AddRecord(1, messages.RecordKind.RECORD, "ai", "PV:1").frame()
+            + messages.AddRecord(2, messages.RecordKind.RECORD, "ai", "PV:2").frame()
+            + bad_info
+            + messages.UploadDone().frame()
+        )
+        assert sample("recceiver_protocol_errors_total", message="AddInfo") == errors + 1
+        assert sample("recceiver_upload_duration_seconds_count") == uploads + 1
+        assert sample("recceiver_transaction_items_sum", kind="record") == records + 2
+
+        rtts = sample("recceiver_ping_rtt_seconds_count")
+        proto.dataReceived(messages.Pong(proto.nonce).frame())
+        assert sample("recceiver_ping_rtt_seconds_count") == rtts + 1
+        proto.connectionLost()
@@ -1,8 +1,13 @@
+import json
 import textwrap
 from pathlib import Path
 
+from twisted.internet import defer, task
+from twisted.internet.address import IPv4Address
+
 from recceiver.cf.processor import CFProcessor
-from recceiver.processors import ProcessorController
+from recceiver.processors import Backlog, ProcessorController, ProcessorQueue, ShowProcessor
+from recceiver.recast import Transaction
 from tests.unit.conftest import make_adapter
 
 
@@ -86,3 +91,407 @@ class TestProcessorControllerFromConfig:
         assert len(ctrl.procs) == 1
         assert isinstance(ctrl.procs[0], CFProcessor)
         assert ctrl.procs[0].cf_config.push_max_retries == 5
+
+    def test_processor_queue_options(self, tmp_path: Path):
+        config_file = tmp_path / "recceiver.conf"
+        config_file.write_text(
+            textwrap.dedent(
+                """\
+                [recceiver]
+                procs = show, show:other
+
+                [other]
+                # the sqlite pragma of a db processor, not a queue option
+                synchronous = NORMAL
+                waitForCommit = True
+                queueSize = 5
+                maxInFlight = 1
+                """
+            )
+        )
+        ctrl = ProcessorController(cfile=str(config_file))
+        show, other = ctrl.procs
+        assert isinstance(other, ShowProcessor)
+        assert (ctrl.queues[show].synchronous, ctrl.queues[show].maxsize) == (False, 1000)
+        assert (ctrl.queues[other].synchronous, ctrl.queues[other].maxsize) == (True, 5)
+        assert (ctrl.queues[show].max_in_flight, ctrl.queues[other].max_in_flight) == (64, 1)
+
+
+class FakeProcessor:
+    """Records its commits; commits complete when release() is called, or at once if sync."""
+
+    def __init__(self, name, sync=False):
+        self.name, self.sync = name, sync
+        self.committed = []
+        self.pending = []
+
+    def commit(self, trans):
+        self.committed.append(trans)
+        if self.sync:
+            return None
+        d = defer.Deferred()
+        self.pending.append(d)
+        return d
+
+    def release(self, result=None):
+        d = self.pending.pop(0)
+        if isinstance(result, Exception):
+            d.errback(result)
+        else:
+            d.callback(result)
+
+
+def make_controller(*queues) -> ProcessorController:
+    ctrl = ProcessorController.__new__(ProcessorController)
+    ctrl.procs = [queue.processor for queue in queues]
+    ctrl.queues = {queue.processor: queue for queue in queues}
+    return ctrl
+
+
+class TestProcessorQueue:
+    def test_commits_of_a_connection_in_order_one_at_a_time(self):
+        proc = FakeProcessor("slow")
+        queue = ProcessorQueue(proc)
+        done = []
+        transactions = [update(1, {recid: "A"}) for recid in range(3)]
+        for trans in transactions:
+            queue.put(trans).addCallback(lambda _, t=trans: done.append(t))
+
+        assert proc.committed == transactions[:1]
+        assert len(queue) == 2
+        proc.release()
+        assert proc.committed == transactions[:2]
+        proc.release()
+        proc.release()
+        assert done == transactions
+
+    def test_connections_are_committed_concurrently(self):
+        proc = FakeProcessor("slow")
+        queue = ProcessorQueue(proc, max_in_flight=2)
+        first, second, third = update(1), update(2), update(1)
+        fourth = update(3)
+        for trans in (first, second, third, fourth):
+            queue.put(trans)
+
+        assert proc.committed == [first, second]
+        assert list(queue.pending()) == [third, fourth]
+        proc.release()
+        # the connection of first goes after the one waiting longer
+        assert proc.committed == [first, second, fourth]
+        proc.release()
+        assert proc.committed == [first, second, fourth, third]
+
+    def test_synchronous_commits_do_not_recurse(self):
+        proc = FakeProcessor("fast", sync=True)
+        queue = ProcessorQueue(proc, maxsize=100000)
+        blocker = FakeProcessor("blocker")
+        # hold the queue with one pending commit, then fill it
+        queue.processor = blocker
+        queue.put(update(1))
+        for _ in range(5000):
+            queue.put(update(1))
+        queue.processor = proc
+        blocker.release()
+        assert len(proc.committed) == 5000
+
+    def test_room(self):
+        proc = FakeProcessor("slow")
+        queue = ProcessorQueue(proc, maxsize=1)
+        queue.put(update(1))
+        queue.put(update(1))
+        room = queue.room()
+        assert not room.called
+        proc.release()
+        assert room.called
+
+    def test_clear_cancels_queued(self):
+        proc = FakeProcessor("slow")
+        queue = ProcessorQueue(proc)
+        queue.put(update(1))
+        results = []
+        queue.put(update(1)).addErrback(results.append)
+        assert queue.clear() == 1
+        assert results[0].check(defer.CancelledError)
+
+
+class TestProcessorControllerQueues:
+    def test_waits_only_for_synchronous_processors(self):
+        slow, db = FakeProcessor("cf"), FakeProcessor("db")
+        ctrl = make_controller(ProcessorQueue(slow), ProcessorQueue(db, synchronous=True))
+
+        t1, t2 = update(1), update(1)
+        d = ctrl.commit(t1)
+        assert not d.called
+        db.release()
+        assert d.called
+        # the next transaction reaches db while cf is still busy with the first
+        ctrl.commit(t2)
+        assert db.committed == [t1, t2]
+        assert slow.committed == [t1]
+
+    def test_full_queue_holds_the_session(self):
+        slow = FakeProcessor("cf")
+        ctrl = make_controller(ProcessorQueue(slow, maxsize=1))
+        assert ctrl.commit(update(1)).called
+        d = ctrl.commit(update(1))
+        assert not d.called
+        slow.release()
+        assert d.called
+
+    def test_failing_processor_is_parked(self):
+        slow, db = FakeProcessor("cf"), FakeProcessor("db", sync=True)
+        ctrl = make_controller(
+            ProcessorQueue(slow, clock=task.Clock()),
+            ProcessorQueue(db, synchronous=True),
+        )
+        t1, t2 = connect(1, {1: "A"}), update(1, {2: "B"})
+        results = []
+        ctrl.commit(t1).addCallback(results.append)
+        ctrl.commit(t2)
+
+        slow.release(RuntimeError("CF down"))
+
+        assert results == [None]
+        assert ctrl.procs == [slow, db]
+        assert ctrl.queues[slow].state == ProcessorQueue.OPEN
+        assert db.committed == [t1, t2]
+
+    def test_synchronous_failure_does_not_abort_the_session(self):
+        db = FakeProcessor("db")
+        ctrl = make_controller(ProcessorQueue(db, synchronous=True, clock=task.Clock()))
+        results = []
+        ctrl.commit(connect(1, {1: "A"})).addBoth(results.append)
+        db.release(RuntimeError("disk full"))
+        assert results == [None]
+
+
+def connect(srcid, records, infos=None):
+    trans = Transaction(IPv4Address("TCP", "10.0.0.1", 5000 + srcid), srcid)
+    trans.initial = True
+    trans.records_to_add = {recid: (name, "ai") for recid, name in records.items()}
+    trans.client_infos = dict(infos or {})
+    return trans
+
+
+def update(srcid, records=None, deleted=(), infos=None):
+    trans = Transaction(IPv4Address("TCP", "10.0.0.1", 5000 + srcid), srcid)
+    trans.records_to_add = {recid: (name, "ai") for recid, name in (records or {}).items()}
+    trans.records_to_delete = set(deleted)
+    trans.record_infos_to_add = dict(infos or {})
+    return trans
+
+
+def disconnect(srcid):
+    trans = Transaction(IPv4Address("TCP", "10.0.0.1", 5000 + srcid), srcid)
+    trans.connected = False
+    return trans
+
+
+def replayed(backlog):
+    result = []
+    while True:
+        entry = backlog.popleft()
+        if entry is None:
+            return result
+        result.extend(entry.transactions())
+
+
+class TestBacklog:
+    def test_updates_are_merged_into_the_upload(self):
+        backlog = Backlog()
+        first = connect(1, {1: "A", 2: "B"}, {"IOCNAME": "ioc1"})
+        backlog.add(first)
+        backlog.add(update(1, {3: "C"}, deleted=[2], infos={1: {"archive": "yes"}}))
+        backlog.add(update(1, {2: "B2"}))
+
+        (merged,) = replayed(backlog)
+        assert merged.initial
+        assert merged.records_to_add == {1: ("A", "ai"), 2: ("B2", "ai"), 3: ("C", "ai")}
+        assert merged.records_to_delete == set()
+        assert merged.record_infos_to_add == {1: {"archive": "yes"}}
+        assert merged.client_infos == {"IOCNAME": "ioc1"}
+        # shared with the other processors, so left untouched
+        assert first.records_to_add == {1: ("A", "ai"), 2: ("B", "ai")}
+
+    def test_deletes_are_kept_for_an_update(self):
+        backlog = Backlog()
+        backlog.add(update(1, {1: "A"}))
+        backlog.add(update(1, deleted=[1, 2]))
+        (merged,) = replayed(backlog)
+        assert merged.records_to_add == {}
+        assert merged.records_to_delete == {1, 2}
+
+    def test_record_deleted_then_added_again_is_only_added(self):
+        backlog = Backlog()
+        backlog.add(update(1, deleted=[1]))
+        backlog.add(update(1, {1: "A2"}))
+        (merged,) = replayed(backlog)
+        assert merged.records_to_add == {1: ("A2", "ai")}
+        assert merged.records_to_delete == set()
+
+    def test_connection_opened_and_closed_while_parked_is_dropped(self):
+        backlog = Backlog()
+        backlog.add(connect(1, {1: "A"}))
+        backlog.add(disconnect(1))
+        assert len(backlog) == 0
+        assert replayed(backlog) == []
+
+    def test_disconnect_follows_an_attempted_upload(self):
+        backlog = Backlog()
+        backlog.add(connect(1, {1: "A"}), attempted=True)
+        backlog.add(disconnect(1))
+        merged, closed = replayed(backlog)
+        assert merged.records_to_add == {1: ("A", "ai")}
+        assert not closed.connected
+
+    def test_reconnect_starts_a_new_entry(self):
+        backlog = Backlog()
+        backlog.add(update(1, {1: "A"}))
+        backlog.add(disconnect(1))
+        backlog.add(connect(1, {1: "B"}))
+        assert [(t.connected, t.initial) for t in replayed(backlog)] == [(True, False), (False, False), (True, True)]
+
+
+class TestProcessorQueueBreaker:
+    def make_queue(self, proc):
+        clock = task.Clock()
+        return clock, ProcessorQueue(proc, retry_interval=10, retry_max=30, clock=clock)
+
+    def test_parked_processor_catches_up(self):
+        proc = FakeProcessor("cf")
+        clock, queue = self.make_queue(proc)
+        queue.put(connect(1, {1: "A"}))
+        queue.put(update(1, {2: "B"}))
+        proc.release(RuntimeError("CF down"))
+
+        assert queue.state == ProcessorQueue.OPEN
+        assert queue.put(update(1, {3: "C"})).called
+        assert len(proc.committed) == 1
+
+        clock.advance(10)
+        assert queue.state == ProcessorQueue.REPLAYING
+        (retry,) = proc.committed[1:]
+        assert sorted(retry.records_to_add) == [1, 2, 3]
+        proc.release()
+
+        assert queue.state == ProcessorQueue.CLOSED
+        queue.put(update(1, {4: "D"}))
+        assert len(proc.committed) == 3
+
+    def test_backoff_doubles_up_to_the_maximum(self):
+        proc = FakeProcessor("cf")
+        clock, queue = self.make_queue(proc)
+        queue.put(connect(1, {1: "A"}))
+        proc.release(RuntimeError("CF down"))
+
+        for delay in (10, 20, 30, 30):
+            clock.advance(delay - 1)
+            assert not proc.pending
+            clock.advance(1)
+            proc.release(RuntimeError("CF down"))
+        assert len(proc.committed) == 5
+        assert queue.state == ProcessorQueue.OPEN
+        assert len(queue.backlog) == 1
+
+    def test_replay_keeps_connection_order(self):
+        proc = FakeProcessor("cf", sync=True)
+        clock, queue = self.make_queue(proc)
+        queue.processor = FakeProcessor("cf")
+        queue.put(connect(1, {1: "A"}))
+        queue.put(connect(2, {1: "B"}))
+        queue.put(disconnect(1))
+        queue.processor.release(RuntimeError("CF down"))
+        # the commit of the other connection, begun before parking, fails after it
+        queue.processor.release(RuntimeError("CF down"))
+
+        queue.processor = proc
+        clock.advance(10)
+        assert [(t.srcid, t.connected) for t in proc.committed] == [(1, True), (1, False), (2, True)]
+        assert queue.state == ProcessorQueue.CLOSED
+
+    def test_committed_upload_is_not_replayed_again(self):
+        proc = FakeProcessor("cf")
+        clock, queue = self.make_queue(proc)
+        queue.put(connect(1, {1: "A"}))
+        proc.release(RuntimeError("CF down"))
+        queue.put(disconnect(1))
+
+        clock.advance(10)
+        proc.release()
+        proc.release(RuntimeError("CF down"))
+        assert queue.state == ProcessorQueue.OPEN
+
+        clock.advance(20)
+        proc.release()
+        assert [(t.connected, t.initial) for t in proc.committed] == [
+            (True, True),
+            (True, True),
+            (False, False),
+            (False, False),
+        ]
+        assert queue.state == ProcessorQueue.CLOSED
+
+    def test_clear_drops_backlog_and_retry(self):
+        proc = FakeProcessor("cf")
+        clock, queue = self.make_queue(proc)
+        queue.put(connect(1, {1: "A"}))
+        proc.release(RuntimeError("CF down"))
+        queue.put(connect(2, {1: "B"}))
+
+        assert queue.clear() == 2
+        assert not clock.getDelayedCalls()
+
+
+class TestShowProcessorFile:
+    def make_show(self, tmp_path, **values):
+        values.setdefault("output", str(tmp_path / "show.out"))
+        return ShowProcessor("show", make_adapter(values={k: str(v) for k, v in values.items()}))
+
+    def test_ndjson(self, tmp_path):
+        show = self.make_show(tmp_path)
+        show.startService()
+        trans = connect(1, {1: "A", 2: "B"}, {"IOCNAME": "ioc1"})
+        trans.aliases[1].append("A:ALIAS")
+        assert show.commit(trans).called
+        show.commit(disconnect(1))
+        show.writer.close()
+
+        first, second = [json.loads(line) for line in (tmp_path / "show.out").read_text().splitlines()]
+        assert first["infos"] == {"IOCNAME": "ioc1"}
+        assert first["records"][0] == {"id": 1, "name": "A", "type": "ai", "aliases": ["A:ALIAS"], "infos": {}}
+        assert second["connected"] is False
+
+    def test_db_format(self, tmp_path):
+        show = self.make_show(tmp_path, format="db")
+        show.startService()
+        trans = connect(1, {1: "A"})
+        trans.record_infos_to_add = {1: {"archive": "yes"}}
+        show.commit(trans)
+        show.writer.close()
+
+        text = (tmp_path / "show.out").read_text()
+        assert 'record(ai, "A") {\n info(archive,"yes")\n}\n# End\n' in text
+
+    def test_rotation(self, tmp_path):
+        show = self.make_show(tmp_path, maxBytes=300, backupCount=2)
+        show.startService()
+        for srcid in range(10):
+            show.commit(connect(srcid, {1: "A"}))
+        show.writer.close()
+
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["show.out", "show.out.1", "show.out.2"]
+        assert all(p.stat().st_size <= 300 for p in tmp_path.iterdir())
+
+    def test_sampling(self, tmp_path):
+        show = self.make_show(tmp_path, sample=0)
+        show.startService()
+        show.commit(connect(1, {1: "A"}))
+        show.writer.close()
+        assert (tmp_path / "show.out").read_text() == ""
+
+    def test_full_buffer_drops(self, tmp_path):
+        show = self.make_show(tmp_path, bufferSize=1)
+        # not started, so nothing drains the queue
+        assert show.writer.put(connect(1, {})) is True
+        assert show.commit(connect(2, {})).called
+        assert show.writer.dropped == 1
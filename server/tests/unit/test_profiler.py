@@ -0,0 +1,147 @@
+import marshal
+import threading
+from types import SimpleNamespace
+
+from twisted.internet import error, task
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+from twisted.web.test.requesthelper import DummyRequest
+
+from recceiver import profiler
+from recceiver.profiler import LagProbe, PoolProfile, ProfileResource, StackSampler
+
+
+class TestLagProbe:
+    def test_measures_late_calls(self):
+        clock = task.Clock()
+        probe = LagProbe(clock, interval=1.0)
+        probe.start()
+        clock.advance(1.0)
+        assert probe.last == 0.0
+        clock.advance(1.25)
+        assert probe.last == 0.25
+        probe.stop()
+        assert not clock.getDelayedCalls()
+
+
+def pool_job(done):
+    sorted(range(10))
+    done.set()
+
+
+def busy_worker(stop):
+    while not stop.is_set():
+        stop.wait(0.001)
+
+
+class TestStackSampler:
+    def test_samples_pool_threads_but_not_others(self):
+        stop = threading.Event()
+        workers = [
+            threading.Thread(target=busy_worker, args=(stop,), name=name)
+            for name in ("PoolThread-twisted.internet.reactor-1", "other")
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            counts = StackSampler(reactor_ident=None, interval=0.001).sample(0.02)
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+        assert counts
+        assert all(stack.startswith("threadpool;") for stack in counts)
+        assert any("busy_worker (" in stack for stack in counts)
+
+    def test_other_pools_are_labelled_by_name(self):
+        sampler = StackSampler(reactor_ident=1)
+        names = {2: "PoolThread-twisted.internet.reactor-3", 3: "PoolThread-adbapi.ConnectionPool-1", 4: "other"}
+        assert [sampler._label(ident, names) for ident in (1, 2, 3, 4)] == [
+            "reactor",
+            "threadpool",
+            "adbapi.ConnectionPool",
+            None,
+        ]
+
+
+class FakeReactor(task.Clock):
+    def callFromThread(self, f, *args):
+        f(*args)
+
+
+def get(resource, **args):
+    request = DummyRequest([b"profile"])
+    request.args = {k.encode(): [str(v).encode()] for k, v in args.items()}
+    return request, resource.render_GET(request)
+
+
+class TestProfileResource:
+    def test_collapsed(self):
+        resource = ProfileResource(FakeReactor())
+        request, _ = get(resource, seconds=0.01, interval=1)
+        assert resource.busy
+        resource.thread.join()
+        assert not resource.busy and request.finished
+        lines = b"".join(request.written).decode().splitlines()
+        # the reactor thread is the test thread, waiting in join()
+        assert lines and all(line.startswith("reactor;") for line in lines)
+        assert any("test_collapsed (" in line for line in lines)
+
+    def test_pstats(self):
+        reactor = FakeReactor()
+        resource = ProfileResource(reactor)
+        request, _ = get(resource, seconds=5, format="pstats")
+        sum(range(10))
+        reactor.advance(5)
+        stats = marshal.loads(b"".join(request.written))
+        assert any("builtins.sum" in func for _file, _line, func in stats)
+
+    def test_pstats_includes_pool_jobs(self):
+        reactor = FakeReactor()
+        pool = ThreadPool(1, 1)
+        pool.start()
+        try:
+            resource = ProfileResource(reactor, threadpool=pool)
+            request, _ = get(resource, seconds=5, format="pstats")
+            done = threading.Event()
+            pool.callInThread(pool_job, done)
+            assert done.wait(5)
+            # pool_job has returned, wait for the wrapper to store its profile
+            while pool.working:
+                done.wait(0.001)
+            reactor.advance(5)
+        finally:
+            pool.stop()
+        stats = marshal.loads(b"".join(request.written))
+        assert any(func == "pool_job" for _file, _line, func in stats)
+        assert "callInThreadWithCallback" not in vars(pool)
+
+    def test_pool_job_runs_when_profiling_is_refused(self, monkeypatch):
+        class Refused:
+            def enable(self):
+                raise ValueError("Another profiling tool is already active")
+
+        monkeypatch.setattr(profiler, "cProfile", SimpleNamespace(Profile=Refused))
+        pool = PoolProfile(SimpleNamespace(callInThreadWithCallback=None))
+        assert pool._wrap(sum)([1, 2]) == 3
+        assert pool.profiles == []
+
+    def test_client_gone(self):
+        reactor = FakeReactor()
+        resource = ProfileResource(reactor)
+        request, _ = get(resource, seconds=1, format="pstats")
+        request.processingFailed(Failure(error.ConnectionDone()))
+        reactor.advance(1)
+        assert not resource.busy and request.written == []
+
+    def test_errors(self):
+        resource = ProfileResource(FakeReactor(), max_seconds=10)
+        for args in ({"seconds": "soon"}, {"seconds": 11}, {"format": "svg"}):
+            request, _ = get(resource, **args)
+            assert request.responseCode == 400
+        get(resource, seconds=1, format="pstats")
+        request, _ = get(resource)
+        assert request.responseCode == 409
+        resource.reactor.advance(1)
+        assert not resource.busy
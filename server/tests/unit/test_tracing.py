@@ -0,0 +1,98 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from twisted.internet.address import IPv4Address
+
+from recceiver import tracing
+from recceiver.cf.adapter import PyCFClientAdapter
+from recceiver.processors import ProcessorQueue
+from recceiver.recast import CollectionSession
+from tests.unit.test_processors import FakeProcessor, make_controller
+
+
+def names(trace):
+    return [span.name for span in trace.spans]
+
+
+def make_session(tracer, ctrl):
+    proto = MagicMock()
+    session = CollectionSession(proto, IPv4Address("TCP", "10.0.0.1", 5001))
+    session.factory = SimpleNamespace(tracer=tracer, iocstats=None, commit=ctrl.commit)
+    return session
+
+
+class TestTransactionTrace:
+    def test_spans_from_session_to_processors(self):
+        db, cf = FakeProcessor("db", sync=True), FakeProcessor("cf")
+        ctrl = make_controller(ProcessorQueue(db, synchronous=True), ProcessorQueue(cf))
+        finished = []
+        tracer = tracing.Tracer()
+        tracer.finish = finished.append
+        session = make_session(tracer, ctrl)
+
+        session.add_record(1, "ai", "PV:1")
+        session.done()
+        (trans,) = db.committed
+        assert names(trans.trace) == ["receive", "session.queue", "queue:db", "commit:db", "queue:cf"]
+        assert finished == []
+
+        cf.release()
+        assert finished == [trans.trace]
+        assert names(trans.trace)[-1] == "commit:cf"
+        assert all(span.end >= span.start for span in trans.trace.spans)
+
+    def test_next_transaction_gets_a_new_trace(self):
+        db = FakeProcessor("db", sync=True)
+        session = make_session(tracing.Tracer(), make_controller(ProcessorQueue(db)))
+        session.add_record(1, "ai", "PV:1")
+        session.done()
+        session.close()
+        first, closed = db.committed
+        assert closed.trace is not None and closed.trace.trace_id != first.trace.trace_id
+
+    def test_unsampled_transactions_are_not_traced(self):
+        db = FakeProcessor("db", sync=True)
+        session = make_session(tracing.Tracer(sample=0.0), make_controller(ProcessorQueue(db)))
+        session.add_record(1, "ai", "PV:1")
+        session.done()
+        assert db.committed[0].trace is None
+
+
+class TestSpans:
+    def test_span_without_trace_is_a_no_op(self):
+        with tracing.span("cf.find"):
+            pass
+        assert tracing.current() is None
+
+    def test_cf_adapter_calls(self):
+        trace = tracing.Tracer().new_trace()
+        adapter = PyCFClientAdapter(MagicMock())
+        with tracing.activate(trace):
+            adapter.set_property("pvStatus", "admin")
+            adapter.find_by_ioc_id("ioc1")
+        assert tracing.current() is None
+        assert names(trace) == ["cf.set_property", "cf.find"]
+        assert trace.spans[0].attributes == {"property": "pvStatus"}
+
+
+def test_otlp_json_file(tmp_path):
+    tracer = tracing.Tracer(str(tmp_path / "traces"))
+    tracer.start()
+    trace = tracer.new_trace(started=100.0)
+    trace.add("receive", 100.0, 100.5)
+    trace.add("commit:cf", 100.5, 102.0, attempt=1)
+    trace.finish()
+    tracer.stop()
+
+    (line,) = (tmp_path / "traces").read_text().splitlines()
+    (resource,) = json.loads(line)["resourceSpans"]
+    root, receive, commit = resource["scopeSpans"][0]["spans"]
+    assert (root["name"], root["startTimeUnixNano"], root["endTimeUnixNano"]) == (
+        "transaction",
+        100 * 10**9,
+        102 * 10**9,
+    )
+    assert receive["parentSpanId"] == root["spanId"]
+    assert {receive["traceId"], commit["traceId"]} == {trace.trace_id}
+    assert commit["attributes"] == [{"key": "attempt", "value": {"stringValue": "1"}}]
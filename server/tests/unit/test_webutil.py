@@ -0,0 +1,27 @@
+import json
+
+import pytest
+from twisted.web.test.requesthelper import DummyRequest
+
+from recceiver.webutil import error, query_args
+
+
+def test_query_args_keep_the_last_value():
+    request = DummyRequest([])
+    request.args = {b"name": [b"A", b"B\xc3\xa9"]}
+    assert query_args(request) == {"name": "Bé"}
+
+
+def test_undecodable_query_args():
+    request = DummyRequest([])
+    request.args = {b"name": [b"\xff"]}
+    with pytest.raises(ValueError):
+        query_args(request)
+
+
+def test_error():
+    request = DummyRequest([])
+    body = error(request, 404, "unknown path")
+    assert request.responseCode == 404
+    assert request.responseHeaders.getRawHeaders(b"Content-Type") == [b"application/json"]
+    assert json.loads(body) == {"error": "unknown path"}
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from recceiver import dbstore, processors
+from recceiver import dbstore, journal, processors
 from recceiver.application import Maker
 from recceiver.cf.processor import CFProcessor
 
@@ -9,3 +9,4 @@ serviceMaker = Maker()
 showfactory = processors.ProcessorFactory("show", processors.ShowProcessor)
 dbfactory = processors.ProcessorFactory("db", dbstore.DBProcessor)
 cffactory = processors.ProcessorFactory("cf", CFProcessor)
+journalfactory = processors.ProcessorFactory("journal", journal.JournalProcessor)